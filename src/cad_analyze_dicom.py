@@ -4,9 +4,14 @@ import logging
 import datetime
 import cad_config
 import meta_api
-import dicom
+import cad_writeback
+import meta_cursor
+import dicom_header
 import dicom_phi_rules
-import cad_pyke_dicom
+import cad_rules_dicom
+import cad_pool
+import cad_cache
+import cad_fingerprint
 
 
 # Filename : cad_analyze_dicom.py
@@ -20,10 +25,31 @@ import cad_pyke_dicom
 #   [dicom]
 #   log_file
 #   rules_file
+#   use_pyke_algorithm - yes: classify with the cad_pyke_dicom.krb rules (cad_rules_dicom)
+#   header_only        - yes: pixel data and large values are not read (dicom_header)
+#   workers            - processes analyzing dicom files in parallel, 1 = no pool
+#   [scheduler]
+#   result_cache       - verdicts of unchanged files are reused (cad_cache)
+#   content_dedup      - yes: copies of a file under other paths reuse its verdict
+#   fingerprint_threads - threads fingerprinting a page of files for content_dedup
 
 # Change Log:
 # 20150613 - initial release
 # 20150702 - tag converted to lowercae alphabets before dict lookup
+# 20261018 - results written back through the cad_writeback buffer
+# 20261018 - unprocessed files read from the meta engine pending set
+# 20261018 - pending set read page by page with meta_cursor.iter_pending
+# 20261018 - meta engine connection pool sized by redis_pool_size
+# 20261018 - dicom files analyzed by a cad_pool worker pool ([dicom] workers)
+# 20261018 - data elements read with dicom_header, header_only skips pixel data
+# 20261018 - phi rules compiled into phi_table, keyed by integer tag
+# 20261018 - pyke engine loaded once in __init__
+# 20261018 - pyke rules evaluated by cad_rules_dicom instead of the pyke engine
+# 20261018 - verdicts of unchanged files read from the cad_cache result cache
+# 20261018 - content copies reuse the verdict of the original, duplicate_of field
+# 20261018 - buffered results, write errors reported once by writeback.flush()
+# 20261018 - fingerprints computed by fingerprint_threads threads
+# 20261018 - duplicate_of written for copies only
 #
 #
 # functions
@@ -34,6 +60,61 @@ def lrstrip(item):
     out = out.lstrip()
     out = out.rstrip()
     return out
+
+
+# phi_table actions, decided once per rule instead of once per data element
+ACTION_KEEP = 0             # not phi
+ACTION_REMOVE = 1           # phi, anon_rule is "" or remove
+ACTION_EMPTY = 2            # phi, blank if the value is empty
+ACTION_INCREMENTDATE = 3    # phi, anon_rule is incrementdate
+ACTION_UNKNOWN = 4          # phi, undefined anon_rule
+
+phi_table = {}
+
+
+# table = compile_phi_table(dicom_phi_dict)
+# {integer tag: (action, anon_rule)} with anon_rule stripped and lowercase,
+# the action follows the rule order of process_dicom_file
+def compile_phi_table(phi_dict):
+    table = {}
+    for tag in phi_dict:
+
+        # Format: [Name] [VR] [VM] [version] [is_phi] [anonymization_rule]
+        rule = phi_dict[tag][0]
+        anon_rule = lrstrip(rule[5]).lower()
+        if not rule[4]:
+            action = ACTION_KEEP
+        elif "empty" in anon_rule:
+            action = ACTION_EMPTY
+        elif len(anon_rule) == 0 or "remove" in anon_rule:
+            action = ACTION_REMOVE
+        elif "incrementdate" in anon_rule:
+            action = ACTION_INCREMENTDATE
+        else:
+            action = ACTION_UNKNOWN
+        table[int(tag[1:5], 16) << 16 | int(tag[6:10], 16)] = (action, anon_rule)
+    return table
+
+
+# (rc, status, phi_rule, undef_rule) = analyze_dicom_file(dicom_file)
+# cad_pool worker function, analyzer is the dicom_class instance inherited from the
+# process that created the pool
+analyzer = None
+
+def analyze_dicom_file(dicom_file):
+    if cad_config.dicom['use_pyke_algorithm'].lower() == 'yes':
+        return cad_rules_dicom.process_dicom_file(dicom_file)
+    return analyzer.process_dicom_file(dicom_file)
+
+
+# version = rule_version()
+# cad_cache rule version, the settings and rule files a dicom verdict depends on
+def rule_version():
+    home_dir = os.path.dirname(os.path.realpath(__file__))
+    return cad_cache.rule_version(['dicom', cad_config.dicom['use_pyke_algorithm'].lower(),
+                                   cad_config.dicom['header_only'].lower()],
+                                  [home_dir + '/dicom_phi_rules.py',
+                                   home_dir + '/dicom_phi_rules.kfb'])
 #
 #
 # class - dicom_class
@@ -46,12 +127,18 @@ class dicom_class:
 
     def __init__(self):
 
-        # initialize dicom_phi_dict
-        global dicom_phi_dict
+        # initialize dicom_phi_dict and the phi_table compiled from it
+        global dicom_phi_dict, phi_table
         dicom_phi_dict = dicom_phi_rules.init_phi_dict()
+        phi_table = compile_phi_table(dicom_phi_dict)
+
+        # load the pyke rule facts before cad_pool forks the workers
+        if cad_config.dicom['use_pyke_algorithm'].lower() == 'yes':
+            cad_rules_dicom.load_facts()
+        self.writeback = cad_writeback.writeback_class('dicom')
 
 
-    def append_medb_record(self, recid, status, phi_rule, undef_rule):
+    def append_medb_record(self, recid, status, phi_rule, undef_rule, duplicate_of=''):
 
         # *** SCHEMA DEFINITION ***
         d = {}
@@ -60,8 +147,12 @@ class dicom_class:
         d['privacy_rule_status']      = status    # is_phi, not_phi, indeterminate, file_not_found, duplicate
         d['privacy_dicom_phi_rule']   = phi_rule
         d['privacy_dicom_unref_rule'] = undef_rule
+        if duplicate_of:
+            # file name of the same content, not written for originals so the
+            # duplicate_of index holds copies only
+            d['duplicate_of'] = duplicate_of
 
-        return meta_api.append_to_record(recid, d)
+        self.writeback.append(recid, d)
     #
     #
     # rc = process_medb_dicom()
@@ -74,60 +165,83 @@ class dicom_class:
         if cad_config.scheduler['log_level'].upper() == 'DEBUG':
             debug_mode = 1;
 
-        rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode)
+        rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode,
+                                        int(cad_config.scheduler['redis_pool_size']))
         if rc != 0:
             logging.critical("query_medb_dicom: init_redis_handle failed, rc=" + str(rc))
             return 1
 
-        # get unprocessed dicom files from metaengine db
-        dict ={}
-        (rc, dict) = meta_api.get_unprocessed_record('file_name', '*.dcm', 'privacy_rule_status')
-        if rc != 0:
-            logging.critical("query_medb_dicom: query db failed, rc=" + str(rc))
-            return 2
-
-        # loop through dict items - determine dicom file phi status
-        logging.info("query_medb_dicom: unprocessed item count: " + str(len(dict)))
+        # loop through unprocessed dicom files from the metaengine dicom pending set,
+        # files are analyzed by the worker pool one page at a time
         succ = 0
         fail = 0
         dupl = 0
-        processed_items = []
-
-        for recid in dict:
-            file = dict[recid]
-
-            # analyze new vcf file
-            if not file in processed_items:
-                if cad_config.dicom['use_pyke_algorithm'].lower() =='yes':
-                    (rc, status, phi_rule, undef_rule) = cad_pyke_dicom.process_dicom_file(file)
-                else:
-                    (rc, status, phi_rule, undef_rule) = self.process_dicom_file(file)
-
-                # dicom analysis successful
-                if rc == 0:
-                    succ += 1
-                    rc = self.append_medb_record(recid, status, phi_rule, undef_rule)
-                    if rc != 0:
-                        logging.error("query_medb_dicom: append record failed, recid=" + recid)
-
-                    # append successful, add to processed_items list to detect duplicates
+        copy = 0
+        processed_items = set()
+
+        global analyzer
+        analyzer = self
+        batch_size = int(cad_config.scheduler['cursor_batch_size'])
+        pool = cad_pool.create(int(cad_config.dicom['workers']))
+        cache = cad_cache.open_cache('dicom', rule_version())
+        content = None
+        if cad_config.scheduler['content_dedup'].lower() == 'yes':
+            content = cad_fingerprint.content_index(
+                int(cad_config.scheduler['fingerprint_threads']))
+        try:
+            pending = meta_cursor.iter_pending('dicom', 'file_name', batch_size)
+            for (recid, file, result) in cad_pool.analyze_pending(
+                    pending, analyze_dicom_file, pool, batch_size, processed_items, cache, content):
+
+                # analyze new dicom file, a copy of an analyzed file gets its result
+                if not file in processed_items:
+                    (rc, status, phi_rule, undef_rule) = result
+                    duplicate_of = ''
+                    if content is not None:
+                        duplicate_of = content.duplicate_of.get(file, '')
+
+                    # dicom analysis successful
                     if rc == 0:
-                        processed_items.append(file)
-
-                # dicom file not found
+                        if duplicate_of:
+                            copy += 1
+                        else:
+                            succ += 1
+                        # the result is buffered, write errors are reported by
+                        # writeback.flush()
+                        self.append_medb_record(recid, status, phi_rule, undef_rule,
+                                                duplicate_of)
+
+                        # add to processed_items to detect duplicates
+                        processed_items.add(file)
+
+                    # dicom file not found
+                    else:
+                        fail += 1
+                        self.append_medb_record(recid, 'file_not_found', 'none', 'none')
+
+                # this is a duplicate file name
                 else:
-                    fail += 1
-                    rc = self.append_medb_record(recid, 'file_not_found', 'none', 'none')
+                    dupl += 1
+                    self.append_medb_record(recid, 'duplicate', 'none', 'none')
+
+        except IOError as e:
+            logging.critical("query_medb_dicom: query db failed, " + str(e))
+            cad_pool.close(pool)
+            cad_cache.close(cache)
+            self.writeback.flush()
+            return 2
+        cad_pool.close(pool)
+        cad_cache.close(cache)
 
-            # this is a duplicate file name
-            else:
-                dupl += 1
-                rc = self.append_medb_record(recid, 'duplicate', 'none', 'none')
-                if rc != 0:
-                    logging.error("query_medb_dicom: append record failed, recid=" + recid)
+        # write remaining buffered results
+        rc = self.writeback.flush()
+        if rc != 0:
+            logging.error("query_medb_dicom: append failed, rc=" + str(rc)
+            + ", records failed=" + str(self.writeback.failed))
 
         logging.info("query_medb_dicom: completed, succ="
-                     + str(succ) + ", fail=" + str(fail) + ", dupl=" + str(dupl))
+                     + str(succ) + ", fail=" + str(fail) + ", dupl=" + str(dupl)
+                     + ", copy=" + str(copy))
 
         return 0
     #
@@ -137,90 +251,74 @@ class dicom_class:
     #
     def process_dicom_file(self, dicom_file):
 
-        global dicom_phi_dict
         phi_rule = list()
         undef_rule = list()
 
-        # extract dicom dataset
+        # extract dicom data elements
         try:
             logging.info("process_dicom_file: " + dicom_file)
-            dataset = dicom.read_file(dicom_file)
+            header_only = cad_config.dicom['header_only'].lower() == 'yes'
+            elements = dicom_header.read_elements(dicom_file, header_only)
 
         except:
             logging.error("process_dicom_file: file open error: " + dicom_file)
             return 1, 'file_not_found', 'none', 'none'
 
-        tags_total = len(dataset)
+        tags_total = len(elements)
         tags_blank = 0
         tags_nokey = 0
         tags_isphi = 0
         tags_nophi = 0
 
-        # parse all the data_elements for PHI data
-        # Format: [tag] [Name] [VR] [value]
-        for data_element in dataset:
-
-            # extract tag and value (compare tag as lowercase)
-            tag = str(data_element.tag).lower()
-            tag = tag.replace(", ", ",")            
-            val = lrstrip(str(data_element.value))    
+        # parse all the data_elements for PHI data, one phi_table lookup per element
+        # Format: [tag] [Name] [value]
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for (tag, name, val) in elements:
 
             # tag does not exist in phi rule list (no DE-identification rule)
-            if not tag in dicom_phi_dict:
-                logging.debug("+++ unref tag: " + tag + ", name: " + data_element.name)
+            entry = phi_table.get(tag)
+            if entry is None:
+                tag = dicom_header.tag_string(tag)
+                if debug:
+                    logging.debug("+++ unref tag: " + tag + ", name: " + name)
                 undef_rule.append(tag)
                 tags_nokey += 1
                 continue
 
-            # extract is_phi and anon_rule
-            # Format: [Name] [VR] [VM] [version] [is_phi] [anonymization_rule]
-            rule = dicom_phi_dict[tag]
-            is_phi = rule[0][4]    # this is a boolean value
-            anon_rule = lrstrip(rule[0][5])
-            anon_rule = anon_rule.lower()
-
-            # extract year if anon_rule is "incrementdate"
-            # Format: yyyymmdd
-            if "incrementdate" in anon_rule:
-                try:
-                    yyyy = int(val[:4])
-                except:
-                    logging.error("+++ incorrect date: " + tag + "=" + str(val))
-                    yyyy = 1851
-
             # tag is not phi
-            if not is_phi:
+            (action, anon_rule) = entry
+            if action == ACTION_KEEP:
                 tags_nophi += 1
                 continue
 
-            # tag is phi, val is empty, anon_rule is empty()"
-            if (len(val) == 0 and "empty" in anon_rule):
-                logging.debug("+++ isphi (value is empty) tag: " + tag + ", name: " 
-                              + data_element.name + ", anon_rule: " + anon_rule)
+            # tag is phi, val is empty, anon_rule is empty()
+            if action == ACTION_EMPTY and len(val) == 0:
+                if debug:
+                    logging.debug("+++ isphi (value is empty) tag: " + dicom_header.tag_string(tag)
+                                  + ", name: " + name + ", anon_rule: " + anon_rule)
                 tags_blank += 1
                 continue
 
-            # tag is phi and
-            # anon_rule = "" or
-            # anon_rule = "remove" or
-            # (val = ""  and anon_rule = "empty") or
-            # (anon_rule = "incrementdate" and year of val > 1850)
-            elif (len(anon_rule) == 0 
-                  or "remove" in anon_rule
-                  or (len(val) > 0 and "empty" in anon_rule)
-                  or ("incrementdate" in anon_rule and yyyy > 1850)):
-                logging.debug("+++ isphi (defined rule) tag: " + tag + ", name: " 
-                              + data_element.name + ", anon_rule: " + anon_rule)
-                phi_rule.append(tag)
-                tags_isphi += 1
-
-            # tag matched=is_phi, undefined rule
-            else:
+            # tag is phi, any other value or rule
+            tag = dicom_header.tag_string(tag)
+            phi_rule.append(tag)
+            tags_isphi += 1
+
+            # extract year if anon_rule is "incrementdate"
+            # Format: yyyymmdd
+            defined = action != ACTION_UNKNOWN
+            if action == ACTION_INCREMENTDATE:
+                try:
+                    defined = int(val[:4]) > 1850
+                except:
+                    logging.error("+++ incorrect date: " + tag + "=" + str(val))
+            if debug and defined:
+                logging.debug("+++ isphi (defined rule) tag: " + tag + ", name: "
+                              + name + ", anon_rule: " + anon_rule)
+            elif debug:
                 logging.debug("+++ isphi (undefined rule) tag: " + tag + ", name: "
-                              + data_element.name + ", val_len: " + str(len(val))
+                              + name + ", val_len: " + str(len(val))
                               + ", anon_rule: " + anon_rule)
-                phi_rule.append(tag)
-                tags_isphi += 1
 
         # error if tag counts don't match
         if tags_total != (tags_blank + tags_nokey + tags_isphi + tags_nophi):
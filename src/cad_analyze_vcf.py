@@ -1,8 +1,16 @@
+import os
 import sys
 import logging
 import datetime
 import cad_config
 import meta_api
+import cad_writeback
+import meta_cursor
+import cad_pool
+import cad_vcf_scan
+import cad_compress
+import cad_cache
+import cad_fingerprint
 import vcf
 
 
@@ -11,7 +19,23 @@ import vcf
 #            (using pyVCF release 0.6.7 - VCFv4.0 and 4.1 parser)
 # Params   :
 #   $1 - format is filelist if filename=*.list, otherwise process as a single vcf file
+#        (plain, gzip or bgzip compressed)
 #        filelist - contains 1 vcf file name per line (must be FQDN), space allowed, quoted string is optional
+#
+# Inputs - cad_config.conf parameters:
+#   [vcf]
+#   pii_germlinesomatic_pct
+#   workers - processes analyzing vcf files in parallel, 1 = no pool
+#   early_exit - yes: stop reading once the pii verdict can no longer change
+#                (uncompressed files, the bound of the data lines comes from the file size)
+#   split_size_mb - files larger than this are scanned in byte ranges by split_workers
+#                   processes (not within a workers pool process, not with early_exit)
+#   split_workers
+#   bgzf_threads - threads decompressing the blocks of a bgzip file
+#   [scheduler]
+#   result_cache - verdicts of unchanged files are reused (cad_cache)
+#   content_dedup - yes: copies of a file under other paths reuse its verdict (cad_fingerprint)
+#   fingerprint_threads - threads fingerprinting a page of files for content_dedup
 
 # Change Log:
 # 20150505 - initial release
@@ -21,6 +45,45 @@ import vcf
 # 20150625 - process one or more
 # 20150625 - read from metaengine and save status to metaengine
 # 20150811 - process_vcf_file - reason message updated
+# 20261018 - results written back through the cad_writeback buffer
+# 20261018 - unprocessed files read from the meta engine pending set
+# 20261018 - pending set read page by page with meta_cursor.iter_pending
+# 20261018 - meta engine connection pool sized by redis_pool_size
+# 20261018 - vcf files analyzed by a cad_pool worker pool ([vcf] workers)
+# 20261018 - SS calls counted by cad_vcf_scan from the raw data lines
+# 20261018 - early exit mode ([vcf] early_exit), reason notes the early stop
+# 20261018 - large files split into byte ranges scanned in parallel ([vcf] split_size_mb)
+# 20261018 - gzip and bgzip files decoded as a stream (cad_compress)
+# 20261018 - verdicts of unchanged files read from the cad_cache result cache
+# 20261018 - content copies reuse the verdict of the original, duplicate_of field
+# 20261018 - buffered results, write errors reported once by writeback.flush()
+# 20261018 - a copy is counted as copy only if the analysis succeeded, as dicom
+# 20261018 - fingerprints computed by fingerprint_threads threads
+# 20261018 - process_vcf_file closes the stream when the vcf header cannot be read
+# 20261018 - early exit bounded by the file size, compressed files scanned whole
+# 20261018 - early_exit and the cad_vcf_scan version part of the cache rule version
+# 20261018 - duplicate_of written for copies only
+#
+#
+# functions
+#
+#
+# (rc, status, reason) = analyze_vcf_file(vcf_file)
+# cad_pool worker function, analyzer is the vcf_class instance inherited from the
+# process that created the pool
+analyzer = None
+
+def analyze_vcf_file(vcf_file):
+    return analyzer.process_vcf_file(vcf_file)
+
+
+# version = rule_version()
+# cad_cache rule version, the settings a vcf verdict and reason depend on: an early exit
+# run notes the stop in the reason, the scanner version covers cad_vcf_scan changes
+def rule_version():
+    return cad_cache.rule_version(['vcf', cad_config.vcf['pii_germlinesomatic_pct'],
+                                   cad_config.vcf['early_exit'].lower(),
+                                   cad_vcf_scan.SCAN_VERSION], [])
 #
 #
 # class - vcf_class
@@ -29,10 +92,11 @@ import vcf
 class vcf_class:
 
     def __init__(self):
+        self.writeback = cad_writeback.writeback_class('vcf')
         return
 
 
-    def append_medb_record(self, recid, status, reason):
+    def append_medb_record(self, recid, status, reason, duplicate_of=''):
 
         # *** SCHEMA DEFINITION ***
         d = {}
@@ -40,7 +104,11 @@ class vcf_class:
         d['privacy_timestamp']   = str(datetime.datetime.now())
         d['privacy_rule_status'] = status    # is_pii, not_pii, indeterminate, file_not_found, duplicate
         d['privacy_rule_reason'] = reason
-        return meta_api.append_to_record(recid, d)
+        if duplicate_of:
+            # file name of the same content, not written for originals so the
+            # duplicate_of index holds copies only
+            d['duplicate_of'] = duplicate_of
+        self.writeback.append(recid, d)
 
     
     def process_medb_vcf(self):
@@ -50,53 +118,76 @@ class vcf_class:
         if cad_config.scheduler['log_level'].upper() == 'DEBUG':
             debug_mode = 1;
             
-        rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode)        
+        rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode,
+                                        int(cad_config.scheduler['redis_pool_size']))
         if rc != 0:
             logging.critical("query_medb_vcf: init_redis_handle failed, rc=" + str(rc))
             return 1
         
-        # get unprocessed vcf files from metaengine db
-        dict ={}
-        (rc, dict) = meta_api.get_unprocessed_record('file_name', '*.vcf', 'privacy_rule_status')
-        if rc != 0:
-            logging.critical("query_medb_vcf: query db failed, rc=" + str(rc))
-            return 2
-        
-        # loop through dict items - determine vcf file pii status
-        logging.info("query_medb_vcf: unprocessed item count: " + str(len(dict)))
+        # loop through unprocessed vcf files from the metaengine vcf pending set,
+        # files are analyzed by the worker pool one page at a time, results come back
+        # in pending set order so counters match a serial run
         succ = 0
         fail = 0
         dupl = 0
-        processed_items = []
-        
-        for recid in dict:
-            file = dict[recid]
+        copy = 0
+        processed_items = set()
+
+        global analyzer
+        analyzer = self
+        batch_size = int(cad_config.scheduler['cursor_batch_size'])
+        pool = cad_pool.create(int(cad_config.vcf['workers']))
+        cache = cad_cache.open_cache('vcf', rule_version())
+        content = None
+        if cad_config.scheduler['content_dedup'].lower() == 'yes':
+            content = cad_fingerprint.content_index(
+                int(cad_config.scheduler['fingerprint_threads']))
+        try:
+            pending = meta_cursor.iter_pending('vcf', 'file_name', batch_size)
+            for (recid, file, result) in cad_pool.analyze_pending(
+                    pending, analyze_vcf_file, pool, batch_size, processed_items, cache, content):
             
-            # analyze new vcf file
-            if not file in processed_items:
-                (rc, status, reason) = self.process_vcf_file(file)
-                if rc == 0:
-                    succ += 1
-                else:
-                    fail += 1
+                # analyze new vcf file, a copy of an analyzed file gets its result
+                if not file in processed_items:
+                    (rc, status, reason) = result
+                    duplicate_of = ''
+                    if content is not None:
+                        duplicate_of = content.duplicate_of.get(file, '')
+                    if rc != 0:
+                        fail += 1
+                    elif duplicate_of:
+                        copy += 1
+                    else:
+                        succ += 1
                 
-                rc = self.append_medb_record(recid, status, reason)
-                if rc != 0:
-                    logging.error("query_medb_vcf: append record failed, recid=" + recid)
+                    # the result is buffered, write errors are reported by writeback.flush()
+                    self.append_medb_record(recid, status, reason, duplicate_of)
                 
-                # append successful, add to processed_items list to detect duplicates
-                if rc == 0:
-                    processed_items.append(file)
+                    # add to processed_items to detect duplicates
+                    processed_items.add(file)
   
-            # this is a duplicate file name
-            else:
-                dupl += 1
-                rc = self.append_medb_record(recid, 'duplicate', 'none')
-                if rc != 0:
-                    logging.error("query_medb_vcf: append record failed, recid=" + recid)
+                # this is a duplicate file name
+                else:
+                    dupl += 1
+                    self.append_medb_record(recid, 'duplicate', 'none')
+
+        except IOError as e:
+            logging.critical("query_medb_vcf: query db failed, " + str(e))
+            cad_pool.close(pool)
+            cad_cache.close(cache)
+            self.writeback.flush()
+            return 2
+        cad_pool.close(pool)
+        cad_cache.close(cache)
+
+        # write remaining buffered results
+        rc = self.writeback.flush()
+        if rc != 0:
+            logging.error("query_medb_vcf: append failed, rc=" + str(rc)
+            + ", records failed=" + str(self.writeback.failed))
                 
         logging.info("query_medb_vcf: completed, succ="
-        + str(succ) + ", fail=" + str(fail) + ", dupl=" + str(dupl))
+        + str(succ) + ", fail=" + str(fail) + ", dupl=" + str(dupl) + ", copy=" + str(copy))
                   
         return 0
 
@@ -106,14 +197,19 @@ class vcf_class:
     def process_vcf_file(self, vcf_file):
         
         # process vcf_file with PyVCF
+        vcf_stream = None
         try:
             vcf_file = vcf_file.lstrip()
             vcf_file = vcf_file.rstrip()
             logging.info("process_vcf_file: " + vcf_file)
-            vcf_reader = vcf.Reader(open(vcf_file, 'r'))
+            bgzf_threads = int(cad_config.vcf['bgzf_threads'])
+            vcf_stream = cad_compress.open_stream(vcf_file, bgzf_threads)
+            vcf_reader = vcf.Reader(vcf_stream, filename=vcf_file)
             
         except:
             logging.error("process_vcf_file: file open or read error: " + vcf_file)
+            if vcf_stream is not None:
+                vcf_stream.close()
             return 1, 'indeterminate', 'none'
         
         # determine if vcf is PII
@@ -122,14 +218,21 @@ class vcf_class:
         
         try:
             fmt = vcf_reader.formats['SS']
-            total_samples = 0
-            total_germlinesomatic = 0
-            for record in vcf_reader:
-                for key in record._sample_indexes:
-                    idx = record._sample_indexes[key]
-                    total_samples += 1
-                    if record.samples[idx]['SS'] == 1:
-                        total_germlinesomatic += 1
+            split_size = float(cad_config.vcf['split_size_mb']) * 1048576
+            split_workers = int(cad_config.vcf['split_workers'])
+            if (cad_config.vcf['early_exit'].lower() == 'yes'
+                    and not cad_compress.is_compressed(vcf_file)):
+                (total_samples, total_germlinesomatic, stopped) = cad_vcf_scan.scan(
+                    vcf_reader, pii_thres, os.path.getsize(vcf_file))
+            elif (split_workers > 1 and split_size > 0
+                    and os.path.getsize(vcf_file) > split_size
+                    and not cad_compress.is_compressed(vcf_file)
+                    and not cad_pool.in_worker()):
+                logging.debug("+++ split scan, workers=" + str(split_workers))
+                (total_samples, total_germlinesomatic, stopped) = cad_vcf_scan.scan_split(
+                    vcf_file, split_workers)
+            else:
+                (total_samples, total_germlinesomatic, stopped) = cad_vcf_scan.scan(vcf_reader)
             
             if total_samples == 0:
                 total_samples = 1
@@ -141,6 +244,8 @@ class vcf_class:
             else:
                 status = "not_pii"
                 reason = ("total germlinesomatic/total samples < " + str(pii_thres))
+            if stopped > 0:
+                reason += ", stopped early after " + str(stopped) + " lines"
             rc = 0
 
         except ValueError:
@@ -152,6 +257,9 @@ class vcf_class:
             status = "not_pii"
             reason = "FORMAT ID=SS definition not found"
             rc = 0
+
+        finally:
+            vcf_stream.close()
             
         logging.info("process_vcf_file: status: " + status + ", reason: " + reason)
         return rc, status, reason
@@ -0,0 +1,138 @@
+import os
+import ast
+import hashlib
+import logging
+import sqlite3
+import cad_config
+
+
+# Filename : cad_cache.py
+# Purpose  : persistent analysis result cache, a re-ingested file whose identity is
+#            unchanged gets its last verdict back without being opened
+#
+#            Identity is (st_dev, st_ino, st_size, st_mtime, st_ctime) from os.stat, ctime
+#            takes the place of the GPFS generation number (not returned by stat): a
+#            reused inode or a rewritten file gets a new ctime. A result is used only if
+#            it was produced by the same rule version, see rule_version().
+#            One row per caddy and inode, the latest result replaces the previous one.
+#
+# Inputs - cad_config.conf parameters:
+#   [scheduler]
+#   result_cache - sqlite database file, empty = no cache
+#
+# Usage:
+#   cache = cad_cache.open_cache(caddy, version)    - None if not configured
+#   result = cache.get(file)                         - None on a miss
+#   cache.put(file, result)                          - identity taken at get()
+#   cad_cache.close(cache)
+#
+# The analyzers' source is not part of the version, delete the cache file after an
+# upgrade that changes verdicts.
+
+# Change Log:
+# 20261018 - initial release
+#
+#
+# constants
+#
+#
+COMMIT_EVERY = 500    # puts per sqlite transaction
+#
+#
+# functions
+#
+#
+# version = rule_version(values, files)
+# hash of the configuration values and rule file contents a verdict depends on
+def rule_version(values, files):
+    h = hashlib.sha1()
+    for value in values:
+        h.update(str(value) + '\0')
+    for path in files:
+        with open(path, 'rb') as fp:
+            h.update(fp.read())
+    return h.hexdigest()
+
+
+# cache = open_cache(caddy, version)
+def open_cache(caddy, version):
+    path = cad_config.scheduler['result_cache']
+    if not path:
+        return None
+    try:
+        return result_cache(path, caddy, version)
+    except sqlite3.Error as e:
+        logging.error("open_cache: result cache disabled, " + path + ": " + str(e))
+        return None
+
+
+def close(cache):
+    if cache is not None:
+        cache.close()
+
+
+# (dev, ino, size, mtime, ctime) of file, None if it cannot be stat'ed
+def identity(file):
+    try:
+        st = os.stat(file)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, repr(st.st_mtime), repr(st.st_ctime))
+#
+#
+# class - result_cache
+#
+#
+class result_cache:
+
+    def __init__(self, path, caddy, version):
+        self.caddy = caddy
+        self.version = version
+        self.keys = {}
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results ("
+                        "caddy TEXT, dev INTEGER, ino INTEGER, size INTEGER, "
+                        "mtime TEXT, ctime TEXT, version TEXT, result TEXT, "
+                        "PRIMARY KEY (caddy, dev, ino))")
+        self.db.commit()
+
+
+    # result = get(file)
+    # cached result of file, None if the identity or the rule version changed
+    def get(self, file):
+        key = identity(file)
+        if key is None:
+            self.keys.pop(file, None)
+            return None
+        self.keys[file] = key
+
+        row = self.db.execute("SELECT size, mtime, ctime, version, result FROM results "
+                              "WHERE caddy = ? AND dev = ? AND ino = ?",
+                              (self.caddy, key[0], key[1])).fetchone()
+        if row is None or tuple(row[:3]) != key[2:] or row[3] != self.version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ast.literal_eval(row[4])
+
+
+    # remember the result of file under the identity read by get()
+    def put(self, file, result):
+        key = self.keys.pop(file, None)
+        if key is None:
+            return
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (self.caddy,) + key + (self.version, repr(result)))
+        self.puts += 1
+        if self.puts % COMMIT_EVERY == 0:
+            self.db.commit()
+
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        logging.info("result_cache: " + self.caddy + ", hits=" + str(self.hits)
+                     + ", misses=" + str(self.misses) + ", stored=" + str(self.puts))
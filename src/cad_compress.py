@@ -0,0 +1,290 @@
+import os
+import gzip
+import zlib
+import struct
+import collections
+import multiprocessing.pool
+
+
+# Filename : cad_compress.py
+# Purpose  : open plain, gzip and bgzip (BGZF) input files as a decompressed stream
+#
+#            gzip files are recognized by their magic bytes, not the file name. BGZF files
+#            (bgzip, tabix) are a series of gzip members of at most 64KB each, the size
+#            of every member is in its header so the compressed blocks are read ahead and
+#            decompressed by a thread pool (zlib releases the GIL) while the caller
+#            consumes the data in order. Other gzip files are decompressed by gzip.GzipFile.
+#
+#            pydicom needs seek()/tell(), open_file() wraps a compressed stream in a
+#            seekable_reader: data is decoded front to back, the last SEEK_WINDOW bytes are
+#            kept for backward seeks, forward seeks (e.g. over pixel data) decode and drop.
+#
+# Usage:
+#   fp = cad_compress.open_stream(path, threads)    - read(), readline(), iteration, close()
+#   fp = cad_compress.open_file(path)                - read(), seek(), tell(), close()
+#   cad_compress.is_compressed(path)
+
+# Change Log:
+# 20261018 - initial release
+#
+#
+# constants
+#
+#
+GZIP_MAGIC = '\x1f\x8b'
+BGZF_HEADER = struct.Struct('<4sI2xH')    # magic/method/flags, mtime, xfl/os, xlen
+BGZF_SUBFIELD = struct.Struct('<2sH')     # subfield id, length
+BGZF_TRAILER = struct.Struct('<iI')       # crc32, uncompressed size
+BLOCKS_PER_THREAD = 4                     # blocks read ahead per decompress thread
+READ_CHUNK = 65536                        # bytes decoded per read by seekable_reader
+SEEK_WINDOW = 1048576                     # bytes kept behind the position for backward seeks
+#
+#
+# functions
+#
+#
+def is_compressed(path):
+    with open(path, 'rb') as fp:
+        return fp.read(2) == GZIP_MAGIC
+
+
+# True if fp is at the start of a BGZF file (gzip member with the 'BC' extra subfield)
+def is_bgzf(fp):
+    header = fp.read(BGZF_HEADER.size)
+    fp.seek(0)
+    if len(header) < BGZF_HEADER.size or header[:4] != GZIP_MAGIC + '\x08\x04':
+        return False
+    extra = fp.read(BGZF_HEADER.size + BGZF_HEADER.unpack(header)[2])[BGZF_HEADER.size:]
+    fp.seek(0)
+    return block_size(extra) is not None
+
+
+# BSIZE of the BGZF 'BC' subfield, None if there is none
+def block_size(extra):
+    pos = 0
+    while pos + BGZF_SUBFIELD.size <= len(extra):
+        (sid, slen) = BGZF_SUBFIELD.unpack_from(extra, pos)
+        pos += BGZF_SUBFIELD.size
+        if sid == 'BC' and slen == 2:
+            return struct.unpack_from('<H', extra, pos)[0]
+        pos += slen
+    return None
+
+
+# data = inflate(block), raises IOError on a corrupt block like gzip.GzipFile
+def inflate(block):
+    (cdata, crc, size) = block
+    data = zlib.decompress(cdata, -15)
+    if zlib.crc32(data) != crc or len(data) != size:
+        raise IOError("BGZF block CRC or length mismatch")
+    return data
+
+
+# fp = open_stream(path, threads=1)
+# decompressed read-only stream of a plain, gzip or BGZF file
+def open_stream(path, threads=1):
+    fp = open(path, 'rb')
+    if fp.read(2) != GZIP_MAGIC:
+        fp.seek(0)
+        return fp
+    fp.seek(0)
+    if is_bgzf(fp):
+        return bgzf_reader(fp, path, threads)
+    return gzip.GzipFile(path, 'rb', fileobj=fp)
+
+
+# fp = open_file(path, threads=1)
+# seekable file object, compressed files are decoded as a stream
+def open_file(path, threads=1):
+    if is_compressed(path):
+        return seekable_reader(path, threads)
+    return open(path, 'rb')
+#
+#
+# decompress thread pool, one per process (created after a cad_pool fork)
+#
+#
+thread_pool = None
+thread_pool_pid = 0
+thread_pool_size = 0
+
+def get_thread_pool(threads):
+    global thread_pool, thread_pool_pid, thread_pool_size
+    if thread_pool_pid != os.getpid() or thread_pool_size < threads:
+        if thread_pool is not None and thread_pool_pid == os.getpid():
+            thread_pool.close()
+        thread_pool = multiprocessing.pool.ThreadPool(threads)
+        thread_pool_pid = os.getpid()
+        thread_pool_size = threads
+    return thread_pool
+#
+#
+# class - bgzf_reader
+#
+#
+class bgzf_reader:
+
+    def __init__(self, fp, path, threads):
+        self.fp = fp
+        self.name = path
+        self.threads = threads
+        self.buffer = ''
+        self.data = self.blocks()
+
+
+    # (cdata, crc, size) of the next BGZF block, None at end of file
+    def read_block(self):
+        header = self.fp.read(BGZF_HEADER.size)
+        if len(header) == 0:
+            return None
+        if len(header) < BGZF_HEADER.size or header[:4] != GZIP_MAGIC + '\x08\x04':
+            raise IOError("not a BGZF block: " + self.name)
+        xlen = BGZF_HEADER.unpack(header)[2]
+        extra = self.fp.read(xlen)
+        bsize = block_size(extra)
+        if bsize is None:
+            raise IOError("BGZF block size missing: " + self.name)
+        rest = self.fp.read(bsize + 1 - BGZF_HEADER.size - xlen)
+        if len(rest) < BGZF_TRAILER.size:
+            raise IOError("truncated BGZF block: " + self.name)
+        (crc, size) = BGZF_TRAILER.unpack(rest[-BGZF_TRAILER.size:])
+        return rest[:-BGZF_TRAILER.size], crc, size
+
+
+    # decompressed blocks in file order, up to threads * BLOCKS_PER_THREAD are
+    # decompressed ahead of the caller
+    def blocks(self):
+        if self.threads <= 1:
+            while True:
+                block = self.read_block()
+                if block is None:
+                    return
+                yield inflate(block)
+
+        pool = get_thread_pool(self.threads)
+        pending = collections.deque()
+        eof = False
+        while True:
+            while not eof and len(pending) < self.threads * BLOCKS_PER_THREAD:
+                block = self.read_block()
+                if block is None:
+                    eof = True
+                else:
+                    pending.append(pool.apply_async(inflate, (block,)))
+            if len(pending) == 0:
+                return
+            yield pending.popleft().get()
+
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            data = next(self.data, None)
+            if data is None:
+                break
+            self.buffer += data
+        if size < 0:
+            size = len(self.buffer)
+        out = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return out
+
+
+    def readline(self):
+        while '\n' not in self.buffer:
+            data = next(self.data, None)
+            if data is None:
+                break
+            self.buffer += data
+        end = self.buffer.find('\n') + 1
+        if end == 0:
+            end = len(self.buffer)
+        line = self.buffer[:end]
+        self.buffer = self.buffer[end:]
+        return line
+
+
+    def __iter__(self):
+        return self.lines()
+
+
+    def lines(self):
+        for data in self.data:
+            lines = (self.buffer + data).split('\n')
+            self.buffer = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if self.buffer:
+            yield self.buffer
+            self.buffer = ''
+
+
+    def close(self):
+        self.fp.close()
+#
+#
+# class - seekable_reader
+#
+#
+class seekable_reader:
+
+    def __init__(self, path, threads=1):
+        self.name = path
+        self.threads = threads
+        self.stream = open_stream(path, threads)
+        self.buffer = ''    # decoded data starting at offset base
+        self.base = 0
+        self.pos = 0
+
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence != 0:
+            raise IOError("seek from end not supported: " + self.name)
+
+        # behind the window, decode again from the start
+        if offset < self.base:
+            self.stream.close()
+            self.stream = open_stream(self.name, self.threads)
+            self.buffer = ''
+            self.base = 0
+        self.pos = offset
+
+
+    def tell(self):
+        return self.pos
+
+
+    def read(self, size=-1):
+        # drop data behind the window, skipped data is decoded but not kept
+        keep = self.pos - SEEK_WINDOW
+        if keep > self.base:
+            if keep - self.base < len(self.buffer):
+                self.buffer = self.buffer[keep - self.base:]
+            else:
+                skip = keep - self.base - len(self.buffer)
+                while skip > 0:
+                    data = self.stream.read(min(skip, READ_CHUNK))
+                    if not data:
+                        break
+                    skip -= len(data)
+                self.buffer = ''
+            self.base = keep
+
+        while size < 0 or self.base + len(self.buffer) < self.pos + size:
+            data = self.stream.read(READ_CHUNK)
+            if not data:
+                break
+            self.buffer += data
+
+        start = self.pos - self.base
+        if size < 0:
+            out = self.buffer[start:]
+        else:
+            out = self.buffer[start:start + size]
+        self.pos += len(out)
+        return out
+
+
+    def close(self):
+        self.stream.close()
@@ -1,5 +1,6 @@
 import sys
 import os
+import fnmatch
 import ConfigParser
 import collections
 
@@ -16,9 +17,11 @@ import collections
 #    dicom          (dict)
 #    caddies        (list)
 #    search_pattern (list)
+#    caddy_pattern  (dict)
 
 # Change Log:
 # 20150613 - initial release
+# 20261018 - added caddy_pattern and match_caddy()
 #
 #
 # functions
@@ -30,6 +33,16 @@ def populate_dict(section):
     for item in c.items(section):
         dict[item[0]] = item[1]
     return dict
+
+
+# return the caddy whose search_pattern matches the file name, '' if none
+def match_caddy(file_name):
+    name = os.path.basename(file_name).lower()
+    for caddy in caddies:
+        for pattern in caddy_pattern[caddy]:
+            if fnmatch.fnmatch(name, pattern):
+                return caddy
+    return ''
 #
 #
 # main program
@@ -55,10 +68,12 @@ caddies.append('dicom')
 
 # build caddy search pattern list
 search_pattern = list()
+caddy_pattern = collections.defaultdict(list)
 for caddy in caddies:
     e = c.get(caddy, 'search_pattern')
     plist = e.split(',')
     for item in plist:
         search_pattern.append(item)
+        caddy_pattern[caddy].append(item.strip().lower())
 pass
 
@@ -0,0 +1,159 @@
+import os
+import re
+import stat
+import Queue
+import fnmatch
+import threading
+
+
+# Filename : cad_crawl.py
+# Purpose  : parallel directory crawler for cad_meta_ingest, directories are listed and
+#            their entries stat'ed by a pool of threads so that many metadata requests
+#            are outstanding at once on a high latency (network) file system
+#
+#            The threads share one queue of work items: a directory to list, or a chunk
+#            of the names of a listed directory to stat. A thread that lists a directory
+#            queues its subdirectories and all but the first STAT_CHUNK names, any idle
+#            thread picks them up, so a wide directory is stat'ed by every thread.
+#            os.lstat and os.listdir release the GIL.
+#
+#            Python 2 has no os.scandir (the DirEntry type cache), every entry costs one
+#            lstat, which gives the type and is the stat returned for a regular file.
+#            Matching symbolic links are stat'ed again and treated as os.walk does: a link
+#            to a directory is not descended, a link to a file is a file. Directories
+#            that cannot be listed are skipped (os.walk without onerror).
+#
+#            Files are yielded in no particular order.
+#
+#            cad_meta_ingest uses the crawler when no walk_snapshot is configured, every
+#            run crawls the whole tree; with a snapshot cad_snapshot.walk is used instead.
+#
+# Usage:
+#   match = cad_crawl.compile_patterns(patterns)     - one regex for all fnmatch patterns
+#   for (filepath, st) in cad_crawl.crawl(root_dir, match, threads):
+
+# Change Log:
+# 20261018 - initial release
+#
+#
+# constants
+#
+#
+STAT_CHUNK = 256          # names stat'ed per work item
+RESULT_QUEUE_SIZE = 64    # work item results buffered ahead of the caller
+#
+#
+# functions
+#
+#
+# match = compile_patterns(patterns)
+# match(name) is true if the name matches one of the fnmatch patterns
+def compile_patterns(patterns):
+    regex = '|'.join(['(?:' + fnmatch.translate(pattern) + ')' for pattern in patterns])
+    if not regex:
+        return lambda name: False
+    return re.compile(regex).match
+
+
+# (filepath, os.stat) of every file below root_dir whose name matches
+def crawl(root_dir, match, threads):
+    crawler = crawl_class(match, threads)
+    return crawler.run(root_dir)
+#
+#
+# class - crawl_class
+#
+#
+class crawl_class:
+
+    def __init__(self, match, threads):
+        self.match = match
+        self.threads = max(1, threads)
+        self.work = Queue.Queue()
+        self.results = Queue.Queue(RESULT_QUEUE_SIZE)
+        self.stop = threading.Event()
+
+
+    def run(self, root_dir):
+        self.work.put((root_dir, None))
+        workers = [threading.Thread(target=self.worker) for i in range(self.threads)]
+        for t in workers:
+            t.daemon = True
+            t.start()
+
+        # the last work item done ends the crawl
+        waiter = threading.Thread(target=self.wait_done)
+        waiter.daemon = True
+        waiter.start()
+
+        try:
+            while True:
+                files = self.results.get()
+                if files is None:
+                    break
+                for item in files:
+                    yield item
+        finally:
+            # the caller may stop early, unblock the threads and let them run out
+            self.stop.set()
+            while waiter.is_alive():
+                try:
+                    self.results.get(timeout=0.1)
+                except Queue.Empty:
+                    pass
+            for t in workers:
+                self.work.put(None)
+
+
+    def wait_done(self):
+        self.work.join()
+        self.results.put(None)
+
+
+    def worker(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            try:
+                if not self.stop.is_set():
+                    files = self.process(item)
+                    if len(files) > 0:
+                        self.results.put(files)
+            finally:
+                self.work.task_done()
+
+
+    # list a directory (names None) or stat a chunk of its names
+    def process(self, item):
+        (dir, names) = item
+        if names is None:
+            try:
+                names = os.listdir(dir)
+            except OSError:
+                return []
+            for i in range(STAT_CHUNK, len(names), STAT_CHUNK):
+                self.work.put((dir, names[i:i + STAT_CHUNK]))
+            names = names[:STAT_CHUNK]
+
+        files = []
+        for name in names:
+            path = os.path.join(dir, name)
+            try:
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    # a link to a directory is not descended, only the target of a
+                    # matching name is of interest
+                    if not self.match(name):
+                        continue
+                    st = os.stat(path)
+                    if stat.S_ISDIR(st.st_mode):
+                        continue
+                elif stat.S_ISDIR(st.st_mode):
+                    self.work.put((path, None))
+                    continue
+            except OSError:
+                continue
+            if self.match(name):
+                files.append((path, st))
+        return files
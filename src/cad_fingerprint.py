@@ -0,0 +1,158 @@
+import os
+import hashlib
+import multiprocessing.pool
+
+
+# Filename : cad_fingerprint.py
+# Purpose  : find files with identical content under different paths so one
+#            classification serves every copy
+#
+#            The quick fingerprint is the file size plus a sha1 of the first and last
+#            EDGE_SIZE bytes, files no larger than 2 * EDGE_SIZE are hashed whole. Files
+#            whose quick fingerprints collide are compared with a sha1 of the full content
+#            before they are treated as copies.
+#
+#            prepare() computes the fingerprints of a page of files on a pool of threads
+#            (file reads and sha1 of large buffers release the GIL), match() then only
+#            compares them in page order. The threads end with each prepare() call, none
+#            are left running when the caller forks.
+#
+# Usage:
+#   index = cad_fingerprint.content_index(threads)
+#   index.prepare(files)            - fingerprint files ahead of match(), optional
+#   original = index.match(file)    - earlier file with the same content, None if new
+#   index.duplicate_of.get(file)    - original of a file matched as a copy
+#   index.results[original]         - result of the original, kept by cad_pool
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - fingerprints of a page computed on a thread pool by prepare()
+#
+#
+# constants
+#
+#
+EDGE_SIZE = 65536      # bytes hashed at the head and at the tail
+READ_CHUNK = 1048576   # bytes read per block by the full hash
+#
+#
+# functions
+#
+#
+# (size, digest) = quick_fingerprint(file), raises IOError/OSError
+def quick_fingerprint(file):
+    h = hashlib.sha1()
+    with open(file, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        h.update(fp.read(EDGE_SIZE))
+        if size > 2 * EDGE_SIZE:
+            fp.seek(-EDGE_SIZE, 2)
+        h.update(fp.read(EDGE_SIZE))
+    return size, h.hexdigest()
+
+
+# key = quick_key(file)
+# quick_fingerprint, None if the file cannot be read
+def quick_key(file):
+    try:
+        return quick_fingerprint(file)
+    except (IOError, OSError):
+        return None
+
+
+# digest = full_key(file)
+# full_hash, None if the file cannot be read
+def full_key(file):
+    try:
+        return full_hash(file)
+    except (IOError, OSError):
+        return None
+
+
+# digest = full_hash(file), raises IOError
+def full_hash(file):
+    h = hashlib.sha1()
+    with open(file, 'rb') as fp:
+        while True:
+            block = fp.read(READ_CHUNK)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+#
+#
+# class - content_index
+#
+#
+class content_index:
+
+    def __init__(self, threads=1):
+        self.threads = threads
+        self.keys = {}            # file -> quick fingerprint from prepare(), None if unreadable
+        self.quick = {}           # quick fingerprint -> [file, ...] with distinct content
+        self.full = {}            # file -> full hash, computed on collision only
+        self.duplicate_of = {}    # copy -> original
+        self.results = {}         # original -> analysis result
+
+
+    # prepare(files)
+    # compute the quick fingerprints of files, and the full hashes of the files whose
+    # quick fingerprint collides, concurrently, match() picks them up
+    def prepare(self, files):
+        if self.threads <= 1 or len(files) == 0:
+            return
+        pool = multiprocessing.pool.ThreadPool(self.threads)
+        try:
+            for (file, key) in zip(files, pool.map(quick_key, files)):
+                self.keys[file] = key
+
+            # files colliding with an indexed file or with another file of this page
+            count = {}
+            for file in files:
+                count[self.keys[file]] = count.get(self.keys[file], 0) + 1
+            hash_files = set()
+            for file in files:
+                key = self.keys[file]
+                if key is not None and (count[key] > 1 or len(self.quick.get(key, [])) > 0):
+                    hash_files.add(file)
+                    hash_files.update(self.quick.get(key, []))
+            hash_files = [file for file in hash_files if file not in self.full]
+            for (file, digest) in zip(hash_files, pool.map(full_key, hash_files)):
+                if digest is not None:
+                    self.full[file] = digest
+        finally:
+            pool.close()
+            pool.join()
+
+
+    # original = match(file)
+    # the first file seen with the same content, None if file is new (it is added)
+    # or cannot be read
+    def match(self, file):
+        if file in self.keys:
+            key = self.keys.pop(file)
+        else:
+            key = quick_key(file)
+        if key is None:
+            return None
+
+        candidates = self.quick.setdefault(key, [])
+        if file in candidates:
+            return None
+        if len(candidates) > 0:
+            try:
+                digest = self.full_hash(file)
+                for original in candidates:
+                    if self.full_hash(original) == digest:
+                        self.duplicate_of[file] = original
+                        return original
+            except (IOError, OSError):
+                return None
+        candidates.append(file)
+        return None
+
+
+    def full_hash(self, file):
+        if file not in self.full:
+            self.full[file] = full_hash(file)
+        return self.full[file]
@@ -1,8 +1,9 @@
 import sys
 import os.path
 import logging
+import tempfile
 import cad_config
-import cad_gpfs_ingest
+import cad_ingest_server
 
 
 # Filename : cad_gpfs_exec.py
@@ -10,10 +11,14 @@ import cad_gpfs_ingest
 # Params   :
 #   $1 - command - "LIST", "TEST"
 #   $2 - filelist
+#   $3 - OPTS of the EXEC rule, callback directory of the scan (LIST)
 
 # Change Log:
 # 20150505 - initial release
 # 20150605 - added logging
+# 20261018 - filelist forwarded to the cad_ingest_server daemon, ingested here if none runs
+# 20261018 - LIST exits with the ingest rc, a failed filelist fails mmapplypolicy
+# 20261018 - LIST writes its filelist into the callback directory of the scan
 #
 #
 # main program
@@ -27,9 +32,26 @@ format='%(asctime)s, %(process)d %(module)s %(lineno)d - %(levelname)s %(message
 logging.debug("main: started, argv= " + str(sys.argv))
 
 if sys.argv[1] == 'LIST':
-    # process filelist
-    gpfs = cad_gpfs_ingest.gpfs_class()
-    gpfs.process_filelist(sys.argv[2])
+    # report the filelist to the scan, apply_query_policy moves the watermark only if
+    # its ingest server ingested every reported filelist
+    if len(sys.argv) > 3 and sys.argv[3]:
+        try:
+            (fd, name) = tempfile.mkstemp(dir=sys.argv[3])
+            os.write(fd, os.path.abspath(sys.argv[2]) + "\n")
+            os.close(fd)
+        except OSError as e:
+            logging.error("main: filelist not reported: " + sys.argv[3] + ": " + str(e))
+            exit(1)
+
+    # process filelist, in the ingest server if one is listening
+    rc = cad_ingest_server.forward(sys.argv[2])
+    if rc is None:
+        import cad_gpfs_ingest
+        gpfs = cad_gpfs_ingest.gpfs_class()
+        rc = gpfs.process_filelist(sys.argv[2])
+    if rc != 0:
+        logging.error("main: ingest failed, rc=" + str(rc) + ", filelist=" + sys.argv[2])
+        exit(rc)
     
 elif sys.argv[1] == 'TEST':
     if os.path.isdir(sys.argv[2]):
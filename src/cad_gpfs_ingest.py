@@ -1,23 +1,67 @@
 import sys
 import subprocess
 import logging
-import re
 import os.path
 import datetime
+import time
+import json
 import tempfile
+import shutil
 import hashlib
 import cad_config
+import cad_ingest_server
+import cad_pool
 import meta_api
 
 
 # Filename : cad_gpfs_ingest.py
 # Purpose  : Independent program to search gpfs file system and ingest metadata
 #            into the Meta Engine
+#
+# Inputs - cad_config.conf parameters:
+#   [gpfs]
+#   gpfs_dev          - GPFS file system device names, comma separated
+#   mmfs_bin          - directory of the GPFS commands (mmgetstate, mmapplypolicy, mmlsattr)
+#   single_pass       - yes: one mmapplypolicy per file system for all its directories,
+#                       selected with PATH_NAME LIKE and the fileset of the directory,
+#                       no: one mmapplypolicy per directory
+#   filelist_workers  - processes ingesting byte ranges of a large filelist
+#   filelist_split_mb - larger filelists are split, 0 = never split
+#   watermark_file    - start time of the last successful scan of every directory, the
+#                       next scan selects files modified or changed after it,
+#                       empty = every scan selects all files (job_delta_days only).
+#                       A watermark moves only when the ingest server of this process
+#                       (ingest_socket) ingested every filelist of the scan
 
 # Change Log:
 # 20150505 - initial release
 # 20150610 - converted json config file to cad_config module parameters
 # 20150610 - converted all runtime messages to python loggong
+# 20261018 - process_filelist inserts rows in batches with meta_api.add_new_records
+# 20261018 - filelists ingested by the cad_ingest_server daemon while mmapplypolicy runs
+# 20261018 - filelist rows split on the fixed layout, one timestamp per batch, malformed
+#            rows skipped, large filelists ingested in byte ranges by a process pool
+# 20261018 - mount points discovered once, single pass policy scan per file system
+# 20261018 - incremental scan from a per directory watermark, to the second
+# 20261018 - '_' and '%' of directory names escaped in the PATH_NAME LIKE pattern
+# 20261018 - ingest_filelist uses the ingest server's process pool for large filelists
+# 20261018 - single pass scan restricted to the fileset of each directory, nested filesets
+#            are not selected, per directory scan if the fileset is unknown
+# 20261018 - watermark moved only if this process's ingest server ingested every
+#            filelist the LIST callbacks of the scan report in the callback directory
+#
+#
+# constants
+#
+#
+# filelist row: InodeNumber GenNumber SnapId [ShowArgs] -- FullPathToFile
+# fields before ' --' that are integers, and the schema names of the ShowArgs
+ROW_FIELDS = 14
+INT_FIELDS = (0, 1, 2, 5, 6, 9, 10, 11, 12)
+SHOW_FIELDS = ((3, 'fileset_name'), (4, 'pool_name'), (5, 'file_size'), (6, 'kb_allocated'),
+               (7, 'user_id'), (8, 'group_id'), (9, 'creation_timed'),
+               (10, 'modification_timed'), (11, 'change_timed'), (12, 'access_timed'),
+               (13, 'dmapi_state'))
 #
 #
 # functions
@@ -39,6 +83,223 @@ def exec_shell(cmd):
 
     logging.debug("exec_shell: rc=" + str(p.returncode))
     return p.returncode, out
+
+
+def mmfs_command(name):
+    return os.path.join(cad_config.gpfs['mmfs_bin'] or '/usr/lpp/mmfs/bin', name)
+
+
+# (rc, mounts) = gpfs_mounts()
+# mount point -> device of the mounted gpfs_dev file systems, one df for all directories
+def gpfs_mounts():
+    devices = [d.strip() for d in cad_config.gpfs['gpfs_dev'].split(',') if d.strip()]
+    (rc, out) = exec_shell("df -P")
+    mounts = {}
+    if rc != 0:
+        return rc, mounts
+    for line in out[1:]:
+        cols = line.split(None, 5)
+        if len(cols) == 6 and cols[0] in devices:
+            mounts[cols[5]] = cols[0]
+    return 0, mounts
+
+
+# mount point of the file system holding dir, None if not on a mounted GPFS file system
+def mount_point(mounts, dir):
+    best = None
+    for mp in mounts:
+        if dir == mp or dir.startswith(mp.rstrip('/') + '/'):
+            if best is None or len(mp) > len(best):
+                best = mp
+    return best
+
+
+# fileset = fileset_name(dir)
+# name of the fileset holding dir (mmlsattr -L), None if it cannot be read
+def fileset_name(dir):
+    (rc, out) = exec_shell(mmfs_command('mmlsattr') + " -L '" + dir.replace("'", "'\\''") + "'")
+    if rc != 0:
+        return None
+    for line in out:
+        (key, sep, value) = line.partition(':')
+        if sep and key.strip() == 'fileset name' and value.strip():
+            return value.strip()
+    return None
+
+
+# deepest directory containing every dir
+def common_dir(dirs):
+    parts = [d.rstrip('/').split('/') for d in dirs]
+    common = os.path.commonprefix(parts)
+    return '/'.join(common) or '/'
+
+
+# pattern = like_prefix(dir)
+# LIKE pattern of the paths below dir, the wildcards '_' and '%' and the escape
+# character of a directory name match literally (ESCAPE '\'), quotes are doubled
+def like_prefix(dir):
+    path = dir.rstrip('/')
+    for c in ('\\', '_', '%'):
+        path = path.replace(c, '\\' + c)
+    return "'" + path.replace("'", "''") + "/%' ESCAPE '\\'"
+
+
+# policy condition selecting the files below dirs, and only those modified or changed
+# after the watermark of the directory if it has one, and only those in the fileset of
+# the directory if filesets has it (a filesystem scope scan crosses fileset junctions)
+def path_rule(dirs, marks={}, filesets={}):
+    r = []
+    for d in dirs:
+        rule = "PATH_NAME LIKE " + like_prefix(d)
+        if d in marks:
+            mark = "TIMESTAMP('" + marks[d] + "')"
+            rule = (rule + " AND (MODIFICATION_TIME > " + mark
+                    + " OR CHANGE_TIME > " + mark + ")")
+        if d in filesets:
+            rule = rule + " AND FILESET_NAME = '" + filesets[d].replace("'", "''") + "'"
+        if rule.find(" AND ") > 0:
+            rule = "(" + rule + ")"
+        r.append(rule)
+    return "(" + " or ".join(r) + ")"
+
+
+# marks = load_watermarks()
+# directory -> 'YYYY-MM-DD HH:MM:SS' local time of its last successful scan
+def load_watermarks():
+    path = cad_config.gpfs['watermark_file']
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            marks = json.load(f)
+        return dict([(d.encode('utf-8'), mark.encode('utf-8')) for (d, mark) in marks.items()])
+    except (IOError, ValueError) as e:
+        logging.error("load_watermarks: full scan, unreadable watermark file: " + path + ": " + str(e))
+        return {}
+
+
+# written to a temporary file and renamed, a crash leaves the previous marks
+def save_watermarks(marks):
+    path = cad_config.gpfs['watermark_file']
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as f:
+        json.dump(marks, f, indent=1, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+# (file_name, fields) = parse_row(row), None if the row is malformed
+def parse_row(row):
+    (head, sep, tail) = row.partition(' --')
+    if not sep:
+        return None
+    fields = head.split()
+    if len(fields) != ROW_FIELDS:
+        return None
+    for i in INT_FIELDS:
+        if not fields[i].isdigit():
+            return None
+    if tail.endswith('\n'):
+        tail = tail[:-1]
+    return tail.lstrip(), fields
+
+
+# (rc, count, skipped) = ingest_rows(rows, batch_size)
+# insert the filelist rows in batches, rows inserted and malformed rows skipped
+def ingest_rows(rows, batch_size):
+    count = 0
+    skipped = 0
+    batch = []
+    pending = []
+    sha224 = hashlib.sha224
+    match_caddy = cad_config.match_caddy
+    timestamp = str(datetime.datetime.now())
+
+    for row in rows:
+        if row == "\n":    # skip blank line
+            continue
+
+        p = parse_row(row)
+        if p is None:
+            logging.error("ingest_rows: malformed row skipped: " + row[:200].rstrip())
+            skipped += 1
+            continue
+
+        # *** SCHEMA DEFINITION ***
+        (f, fields) = p
+        d = {}
+        d['timestamp']          = timestamp
+        d['file_name']          = f
+        d['filename_hash']      = sha224(f).hexdigest()
+        for (i, name) in SHOW_FIELDS:
+            d[name] = fields[i]
+
+        # insert rows in batches, one meta engine round trip per batch
+        # new rows are queued in the pending set of the matching caddy
+        batch.append(d)
+        pending.append(match_caddy(f))
+        if len(batch) < batch_size:
+            continue
+        (rc, ids) = meta_api.add_new_records(batch, pending)
+        if rc != 0:
+            logging.error("ingest_rows: abort - meta_api add_new_records failed, rc=" + str(rc))
+            return 2, count, skipped
+        count += len(ids)
+        batch = []
+        pending = []
+        timestamp = str(datetime.datetime.now())
+
+    # insert remaining rows
+    if len(batch) > 0:
+        (rc, ids) = meta_api.add_new_records(batch, pending)
+        if rc != 0:
+            logging.error("ingest_rows: abort - meta_api add_new_records failed, rc=" + str(rc))
+            return 2, count, skipped
+        count += len(ids)
+    return 0, count, skipped
+
+
+# [(start, end), ...] = split_ranges(filelist, parts)
+# byte ranges of the filelist, each starts at a line boundary
+def split_ranges(filelist, parts):
+    size = os.path.getsize(filelist)
+    bounds = [0]
+    with open(filelist, 'rb') as fh:
+        for i in range(1, parts):
+            pos = size * i // parts
+            if pos <= bounds[-1]:
+                continue
+            fh.seek(pos - 1)
+            fh.readline()
+            pos = fh.tell()
+            if pos > bounds[-1] and pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+
+# rows starting in [start, end)
+def range_rows(fh, start, end):
+    fh.seek(start)
+    pos = start
+    while pos < end:
+        row = fh.readline()
+        if not row:
+            break
+        pos += len(row)
+        yield row
+
+
+# (rc, count, skipped) = ingest_range((filelist, start, end, batch_size))
+# cad_pool worker function, the meta engine connection pool is reopened after the fork
+def ingest_range(args):
+    (filelist, start, end, batch_size) = args
+    try:
+        with open(filelist, 'rb') as fh:
+            return ingest_rows(range_rows(fh, start, end), batch_size)
+    except IOError as e:
+        logging.error("ingest_range: " + filelist + ": " + str(e))
+        return 1, 0, 0
 #
 #
 # class - gpfs_class
@@ -49,7 +310,7 @@ class gpfs_class:
     def __init__(self):
         try:
             # abort if mmgetstate is not in active state
-            cmd = "/usr/lpp/mmfs/bin/mmgetstate | grep active | wc -l"
+            cmd = mmfs_command("mmgetstate") + " | grep active | wc -l"
             out = subprocess.check_output(cmd, shell=True)
             if int(out) != 1:
                 logging.critical("__init__: GPFS not in active state")
@@ -68,7 +329,7 @@ class gpfs_class:
         # this is the base gpfs policy used in mmapplypolicy
         base_policy = """
 define(LAST_MODIFIED,(DAYS(CURRENT_TIMESTAMP)-DAYS(MODIFICATION_TIME)))
-RULE EXTERNAL LIST 'AllFiles' EXEC '/usr/local/bin/python cad_gpfs_exec.py' ESCAPE '%/, '
+RULE EXTERNAL LIST 'AllFiles' EXEC '/usr/local/bin/python cad_gpfs_exec.py' ESCAPE '%/, ' OPTS '{callback_dir}'
 RULE 'ListAllFiles' LIST 'AllFiles' DIRECTORIES_PLUS
 SHOW( VARCHAR( FILESET_NAME )   || ' ' ||
       VARCHAR( POOL_NAME )      || ' ' ||
@@ -106,85 +367,201 @@ SHOW( VARCHAR( FILESET_NAME )   || ' ' ||
             pattern = p.replace('*', '%')
             r = r + x + "lower(NAME) like \'" + pattern + "'"
             x = " or "
-        select_rule = r + ")\n"
+        select_rule = r + ")"
         logging.debug("apply_query_policy: select_rule: " + select_rule)
 
 
-        # write gpfs policy file
-        f = tempfile.NamedTemporaryFile(delete=False)
-        f.write(base_policy)
-        f.write(select_rule)
-        policy_file = f.name
-        logging.debug("apply_query_policy: policy_file: " + policy_file)
-        f.close()
+        # discover the GPFS mount points once for all directories
+        (rc, mounts) = gpfs_mounts()
+        if rc != 0:
+            logging.error("apply_query_policy: check GPFS mount failed, rc=" + str(rc))
+            return 3
 
+        if len(mounts) == 0:
+            logging.error("apply_query_policy: GPFS file system not mounted: "
+            + cad_config.gpfs['gpfs_dev'])
+            return 4
 
-        # loop through directories we want to search for new files      
-        returncode = 0
+
+        # group the directories we want to search for new files by file system,
+        # single pass: one scan per file system, else one scan per directory.
+        # A single pass scan crosses the fileset junctions below the directories, each
+        # directory is held to its own fileset as a per directory scan is, a directory
+        # whose fileset cannot be read is scanned on its own
+        single_pass = cad_config.gpfs['single_pass'].lower() == 'yes'
+        groups = []
+        by_mount = {}
+        filesets = {}
         for key in cad_config.directories:
             dir = cad_config.directories[key]
             
-            # abort if gpfs mount point not found
-            cmd ="df -h | grep " + cad_config.gpfs['gpfs_dev'] + " | awk '{print $6}'"
-            (rc, out) = exec_shell(cmd)
-            if rc != 0:
-                logging.error("apply_query_policy: check GPFS mount failed: " + cmd)
-                for m in out:
-                    logging.error("+++ " + m)
-                return 3
-            
-            if out == "":
-                logging.error("apply_query_policy: GPFS file system not mounted: "
-                + cad_config.gpfs['gpfs_dev'])
-                return 4
-
-            # create gwd and lwd if not exist
-            gpfs_mp = out[0]
-            gwd = gpfs_mp + "/" + cad_config.gpfs['gwd']
-            if not os.path.exists(gwd):
-                os.makedirs(gwd)
-                logging.info("apply_query_policy: created directory: " + gwd)
-            
-            lwd = gpfs_mp + "/" + cad_config.gpfs['lwd']
-            if not os.path.exists(lwd):
-                os.makedirs(lwd)
-                logging.info("apply_query_policy: created directory: " + lwd)
-    
-            # skip this directory if not under gpfs_mp
-            if dir[:len(gpfs_mp)] != gpfs_mp:
+            # skip this directory if not under a gpfs mount point
+            gpfs_mp = mount_point(mounts, dir)
+            if gpfs_mp is None:
                 logging.error("directory is not in GPFS file system: " + dir)
                 continue
-            
-            debuglevel = '0'
-            if cad_config.scheduler['log_level'].upper() == 'DEBUG':
-                debuglevel = '1'
-    
-            # run mmapplypolicy to query file metadata (use "-I defer" for testing)
-            cmd = ('/usr/lpp/mmfs/bin/mmapplypolicy '+ dir
-                + ' -P ' + policy_file 
-                + ' -B ' + cad_config.gpfs['maxfiles']
-                + ' -m ' + cad_config.gpfs['threadlevel']
-                + ' -g ' + gwd
-                + ' -s ' + lwd
-                + ' -N ' + cad_config.gpfs['nodelist']
-            #   + ' -I prepare '
-                + ' -L ' + debuglevel
-                + ' --scope fileset')
-            (rc, out) = exec_shell(cmd)
-            
-            if rc == 0:
-                logging.info("apply_query_policy: directory scan successful: " + dir)
+
+            if single_pass:
+                fileset = fileset_name(dir)
+                if fileset is None:
+                    logging.error("apply_query_policy: fileset unknown, scanned alone: " + dir)
+                    groups.append((gpfs_mp, [dir]))
+                    continue
+                filesets[dir] = fileset
+
+            if single_pass and gpfs_mp in by_mount:
+                by_mount[gpfs_mp].append(dir)
             else:
+                groups.append((gpfs_mp, [dir]))
+                by_mount[gpfs_mp] = groups[-1][1]
+
+
+        # the EXEC callbacks of mmapplypolicy forward their filelists to this process,
+        # the server keeps the rc of every filelist it ingested
+        server = cad_ingest_server.start(self)
+        if server is not None:
+            server.results = {}
+
+        # the watermark of a directory moves to the start of its scan once the scan
+        # succeeded and this process's server ingested every filelist the callbacks of the
+        # scan reported, files changed during the scan are selected again by the next one.
+        # A callback ingesting its own filelist (no ingest_socket), forwarding it to the
+        # server of another process or running on another node is not seen here, a failed
+        # ingest there would be skipped for good: the scan counts as failed
+        marks = load_watermarks()
+        returncode = 0
+        for (gpfs_mp, dirs) in groups:
+            start = time.strftime('%Y-%m-%d %H:%M:%S')
+            (rc, filelists) = self.run_policy(gpfs_mp, dirs, base_policy, select_rule, marks,
+                                              filesets)
+            if rc != 0:
                 returncode = 5
-                logging.error("apply_query_policy: directory scan failed: " + dir)
-                for m in out:
-                    logging.error("+++ " + m)
+                continue
+            if server is None:
+                if cad_config.gpfs['watermark_file']:
+                    logging.error("apply_query_policy: watermark not moved, filelists not "
+                    + "ingested by this process: " + ", ".join(dirs))
+                    returncode = 5
+                continue
+            unseen = [l for l in filelists if l not in server.results]
+            failed = [l for l in filelists if server.results.get(l, 0) != 0]
+            if len(unseen) > 0 or len(failed) > 0:
+                logging.error("apply_query_policy: watermark not moved, filelists failed="
+                + str(len(failed)) + ", not ingested by this process=" + str(len(unseen))
+                + ": " + ", ".join(dirs))
+                returncode = 5
+                continue
+            for dir in dirs:
+                marks[dir] = start
+            save_watermarks(marks)
 
-        os.remove(policy_file)        
+        cad_ingest_server.stop(server)
         return returncode
 
 
+    # (rc, filelists) = run_policy(gpfs_mp, dirs, base_policy, select_rule, marks, filesets)
+    # one mmapplypolicy over the directories of the file system mounted at gpfs_mp,
+    # several directories need the fileset of each of them. filelists are the filelists
+    # of the LIST callbacks, each callback writes its own into the callback directory
+    # (OPTS of the EXEC rule) created in the global work directory for this scan
+    def run_policy(self, gpfs_mp, dirs, base_policy, select_rule, marks, filesets={}):
+
+        # one directory is scanned in its fileset, several directories in different
+        # filesets are scanned across fileset junctions below their common directory,
+        # PATH_NAME and FILESET_NAME select the directories and leave out nested
+        # filesets and other trees below the common directory
+        if len(dirs) == 0:
+            logging.error("run_policy: no directories")
+            return 1, []
+        scope = 'fileset'
+        if len(dirs) > 1:
+            missing = [d for d in dirs if d not in filesets]
+            if len(missing) > 0:
+                logging.error("run_policy: fileset unknown: " + ", ".join(missing))
+                return 1, []
+            scope = 'filesystem'
+
+        # create gwd and lwd if not exist
+        gwd = gpfs_mp + "/" + cad_config.gpfs['gwd']
+        if not os.path.exists(gwd):
+            os.makedirs(gwd)
+            logging.info("run_policy: created directory: " + gwd)
+        
+        lwd = gpfs_mp + "/" + cad_config.gpfs['lwd']
+        if not os.path.exists(lwd):
+            os.makedirs(lwd)
+            logging.info("run_policy: created directory: " + lwd)
+
+        # the callbacks of every node see the global work directory
+        callback_dir = tempfile.mkdtemp(prefix='cad_callbacks.', dir=gwd)
+
+        # write gpfs policy file, restricted to the directories and their watermarks
+        f = tempfile.NamedTemporaryFile(delete=False)
+        f.write(base_policy.replace('{callback_dir}', callback_dir))
+        f.write(select_rule + " AND " + path_rule(dirs, marks, filesets) + "\n")
+        policy_file = f.name
+        logging.debug("run_policy: policy_file: " + policy_file)
+        f.close()
+    
+        debuglevel = '0'
+        if cad_config.scheduler['log_level'].upper() == 'DEBUG':
+            debuglevel = '1'
+
+        # run mmapplypolicy to query file metadata (use "-I defer" for testing)
+        # from the deepest directory containing all of them
+        cmd = (mmfs_command('mmapplypolicy') + ' ' + common_dir(dirs)
+            + ' -P ' + policy_file 
+            + ' -B ' + cad_config.gpfs['maxfiles']
+            + ' -m ' + cad_config.gpfs['threadlevel']
+            + ' -g ' + gwd
+            + ' -s ' + lwd
+            + ' -N ' + cad_config.gpfs['nodelist']
+        #   + ' -I prepare '
+            + ' -L ' + debuglevel
+            + ' --scope ' + scope)
+        (rc, out) = exec_shell(cmd)
+        os.remove(policy_file)        
+
+        filelists = []
+        for name in os.listdir(callback_dir):
+            with open(os.path.join(callback_dir, name)) as f:
+                filelists.append(f.read().rstrip('\n'))
+        shutil.rmtree(callback_dir, ignore_errors=True)
+        
+        if rc == 0:
+            logging.info("run_policy: directory scan successful: " + ", ".join(dirs))
+        else:
+            logging.error("run_policy: directory scan failed: " + ", ".join(dirs))
+            for m in out:
+                logging.error("+++ " + m)
+        return rc, filelists
+
+
+    # rc = connect(pool_size)
+    # meta engine connection pool shared by the threads of this process
+    def connect(self, pool_size=1):
+        debug_mode = 0;
+        if cad_config.scheduler['log_level'].upper() == 'DEBUG':
+            debug_mode = 1;
+            
+        rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode,
+                                        pool_size)
+        if rc != 0:
+            logging.error("connect: failed to get redis db handle, rc=" + str(rc))
+        return rc
+
+
     def process_filelist(self, filelist):
+        if self.connect() != 0:
+            logging.error("process_filelist: abort - no redis db handle")
+            return 1
+        return self.ingest_filelist(filelist)
+
+
+    # rc = ingest_filelist(filelist, workers, pool)
+    # workers - processes for a filelist larger than filelist_split_mb, None = filelist_workers
+    # pool    - cad_pool process pool of workers processes to use, None = one per call
+    def ingest_filelist(self, filelist, workers=None, pool=None):
         # process filelist generated by the gpfs policy engine
         # Format: InodeNumber GenNumber SnapId [OptionalShowArgs] -- FullPathToFile
         #   [ShowArgs]:
@@ -200,61 +577,49 @@ SHOW( VARCHAR( FILESET_NAME )   || ' ' ||
         #   access_timed       :int 13
         #   dmapi_state        :'R','P',"M' 14
 
-        count = 0
-        logging.debug("process_filelist: started: " + filelist)
-        
-        debug_mode = 0;
-        if cad_config.scheduler['log_level'].upper() == 'DEBUG':
-            debug_mode = 1;
-            
-        rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode)
-        if rc != 0:
-            logging_error("process_filelist: abort - failed to get redis db handle, rc=" + str(rc))
+        batch_size = int(cad_config.scheduler['ingest_batch_size'])
+        logging.debug("ingest_filelist: started: " + filelist)
+
+        if workers is None:
+            workers = int(cad_config.gpfs['filelist_workers'] or 1)
+        split_size = float(cad_config.gpfs['filelist_split_mb'] or 0) * 1048576
+
+        try:
+            size = os.path.getsize(filelist)
+        except OSError as e:
+            logging.error("ingest_filelist: abort - " + str(e))
             return 1
 
-        with open(filelist, 'r') as fh:
-            for row in fh:
-                if row == "\n":    # skip blank line
-                    continue
-                
+        # a large filelist is ingested in byte ranges by a process pool
+        if workers > 1 and split_size > 0 and size > split_size and not cad_pool.in_worker():
+            ranges = [(filelist, start, end, batch_size)
+                      for (start, end) in split_ranges(filelist, workers)]
+            if pool is not None:
+                results = pool.map(ingest_range, ranges)
+            else:
+                pool = cad_pool.create(workers)
                 try:
-                    #              in1   gen2  snp3    fs4   po5   sz6   kb7
-                    #              uid8  gid9  rt10  mt11  ct12  at13  dm14 
-                    #              file15
-                    p = re.match("(\d+) (\d+) (\d+)\s+(\S+) (\S+) (\d+) (\d+) "
-                                 "(\S+) (\S+) (\d+) (\d+) (\d+) (\d+) (\S+) --"
-                                 "(.*)", row)
-                except:
-                    logging.error("process_filelist: regex error: " + str(row))
-                    continue
-                
-                # *** SCHEMA DEFINITION ***
-                d = {}
-                f = p.group(15).lstrip()
-                d['timestamp']          = str(datetime.datetime.now())
-                d['file_name']          = f
-                d['filename_hash']      = hashlib.sha224(f).hexdigest()
-                d['fileset_name']       = p.group(4)
-                d['pool_name']          = p.group(5)
-                d['file_size']          = p.group(6)
-                d['kb_allocated']       = p.group(7)
-                d['user_id']            = p.group(8)
-                d['group_id']           = p.group(9)
-                d['creation_timed']     = p.group(10)
-                d['modification_timed'] = p.group(11)
-                d['change_timed']       = p.group(12)
-                d['access_timed']       = p.group(13)
-                d['dmapi_state']        = p.group(14)
-
-                rc = meta_api.add_new_record(d)
-                if rc == 0:
-                    count += 1
-                else:
-                    logging_error("process_filelist: abort - meta_api add_new_record failed, rc=" + str(rc))
-                    return 2
-                
-        fh.close()
-        logging.debug("process_filelist: completed: " + filelist + " - rows=" + str(count))
+                    results = pool.map(ingest_range, ranges)
+                finally:
+                    cad_pool.close(pool)
+        else:
+            results = [ingest_range((filelist, 0, size, batch_size))]
+
+        rc = 0
+        count = 0
+        skipped = 0
+        for (range_rc, range_count, range_skipped) in results:
+            if rc == 0:
+                rc = range_rc
+            count += range_count
+            skipped += range_skipped
+
+        if skipped > 0:
+            logging.error("ingest_filelist: " + filelist + " - malformed rows skipped=" + str(skipped))
+        if rc != 0:
+            logging.error("ingest_filelist: failed: " + filelist + " - rows=" + str(count) + ", rc=" + str(rc))
+            return rc
+        logging.debug("ingest_filelist: completed: " + filelist + " - rows=" + str(count))
         return 0
 #
 #
@@ -0,0 +1,247 @@
+import os
+import sys
+import socket
+import logging
+import threading
+import SocketServer
+import cad_config
+import cad_pool
+
+
+# Filename : cad_ingest_server.py
+# Purpose  : local ingest daemon for the mmapplypolicy EXEC callbacks
+#
+#            mmapplypolicy runs cad_gpfs_exec.py once per -B maxfiles chunk. Instead of
+#            connecting to the meta engine and ingesting the chunk itself, cad_gpfs_exec.py
+#            forwards the filelist path over a Unix socket to this server, which keeps one
+#            meta engine connection pool open for the whole scan and ingests the filelists
+#            of concurrent callbacks on up to ingest_threads threads (meta_api releases the
+#            GIL, rows are inserted with pipelined add_new_records batches).
+#
+#            The server runs as a thread of cad_gpfs_ingest.apply_query_policy while
+#            mmapplypolicy runs. Nodes of the nodelist other than the local one can run it
+#            as a standalone daemon (main program below). A callback that finds no server
+#            ingests the filelist itself.
+#
+#            Protocol, one request per connection:
+#              client: "LIST <filelist>\n"      server: "<rc>\n" after the filelist is ingested
+#
+#            results, if set to a dict, maps every filelist the server ingested to its rc,
+#            apply_query_policy checks the filelists of a scan against it
+#
+# Inputs - cad_config.conf parameters:
+#   [gpfs]
+#   ingest_socket  - Unix socket path, empty = every callback ingests its own filelist.
+#                    Keep it in a directory writable by the owner only, not in /tmp.
+#   ingest_threads - filelists ingested at the same time
+#   filelist_workers, filelist_split_mb - a filelist larger than filelist_split_mb is
+#                    ingested in byte ranges by a pool of filelist_workers processes,
+#                    forked once by start() before any thread of the server exists
+#
+# Usage:
+#   server = cad_ingest_server.start(gpfs)      - gpfs: cad_gpfs_ingest.gpfs_class
+#   cad_ingest_server.stop(server)
+#   rc = cad_ingest_server.forward(filelist)     - None if no server is listening
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - socket created under umask 077, default path moved out of /tmp
+# 20261018 - large filelists split over a process pool forked at start
+# 20261018 - results: rc of every filelist ingested, for the watermark of the scan
+#
+#
+# constants
+#
+#
+CONNECT_TIMEOUT = 5.0    # seconds to reach the server, the reply is waited for without limit
+#
+#
+# functions
+#
+#
+def socket_path():
+    return cad_config.gpfs['ingest_socket']
+
+
+# True if a server accepts connections on path
+def listening(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(CONNECT_TIMEOUT)
+    try:
+        s.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        s.close()
+
+
+# server = start(gpfs)
+# serve filelists on a background thread, None if not configured, already served by
+# another process or the socket cannot be created
+def start(gpfs):
+    path = socket_path()
+    if not path:
+        return None
+
+    if os.path.exists(path):
+        if listening(path):
+            logging.info("start: ingest server already running: " + path)
+            return None
+        os.remove(path)
+
+    # the process pool is forked before the meta engine connections and the server
+    # threads exist, a fork from the threaded server could copy a lock held by a thread
+    threads = int(cad_config.gpfs['ingest_threads'] or 1)
+    pool = cad_pool.create(int(cad_config.gpfs['filelist_workers'] or 1))
+    if gpfs.connect(threads) != 0:
+        logging.error("start: ingest server not started, no redis db handle")
+        cad_pool.close(pool)
+        return None
+
+    # the socket is bound under umask 077, it is accessible to its owner from the
+    # start and no other user can connect before a chmod
+    mask = os.umask(0077)
+    try:
+        server = ingest_server(path, gpfs, threads, pool)
+    except socket.error as e:
+        logging.error("start: ingest server not started: " + path + ": " + str(e))
+        cad_pool.close(pool)
+        return None
+    finally:
+        os.umask(mask)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logging.info("start: ingest server listening: " + path)
+    return server
+
+
+def stop(server):
+    if server is None:
+        return
+    server.shutdown()
+    server.server_close()
+    cad_pool.close(server.pool)
+    if os.path.exists(server.server_address):
+        os.remove(server.server_address)
+    logging.info("stop: ingest server stopped, filelists=" + str(server.requests)
+                 + ", failed=" + str(server.failed))
+
+
+# rc = forward(filelist)
+# rc of the server's ingest_filelist, None if no server could be reached (the caller
+# ingests the filelist itself). A server that fails after the request was sent
+# returns 1, the filelist may be partly ingested and is not ingested again.
+def forward(filelist):
+    path = socket_path()
+    if not path or not os.path.exists(path):
+        return None
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(CONNECT_TIMEOUT)
+    try:
+        s.connect(path)
+        s.settimeout(None)
+        s.sendall("LIST " + os.path.abspath(filelist) + "\n")
+    except socket.error as e:
+        logging.debug("forward: no ingest server: " + path + ": " + str(e))
+        s.close()
+        return None
+
+    try:
+        reply = s.makefile('r').readline()
+        return int(reply)
+    except (socket.error, ValueError):
+        logging.error("forward: no reply from ingest server: " + filelist)
+        return 1
+    finally:
+        s.close()
+#
+#
+# class - ingest_server
+#
+#
+class ingest_server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, gpfs, threads, pool=None):
+        SocketServer.UnixStreamServer.__init__(self, path, ingest_handler)
+        self.gpfs = gpfs
+        self.pool = pool
+        self.workers = 1
+        if pool is not None:
+            self.workers = int(cad_config.gpfs['filelist_workers'])
+        self.slots = threading.BoundedSemaphore(threads)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        self.results = None    # filelist -> rc, not kept by the standalone daemon
+
+
+    # rc = ingest(filelist)
+    def ingest(self, filelist):
+        # large filelists are split over the pool forked by start(), the
+        # concurrent filelists share it
+        with self.slots:
+            rc = self.gpfs.ingest_filelist(filelist, self.workers, self.pool)
+        with self.lock:
+            self.requests += 1
+            if rc != 0:
+                self.failed += 1
+            if self.results is not None:
+                self.results[filelist] = rc
+        return rc
+
+
+class ingest_handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        request = self.rfile.readline().rstrip('\n')
+        if not request:    # listening() probe
+            return
+        if not request.startswith("LIST "):
+            logging.error("ingest_handler: invalid request: " + request[:200])
+            self.wfile.write("1\n")
+            return
+
+        filelist = request[len("LIST "):]
+        try:
+            rc = self.server.ingest(filelist)
+        except Exception as e:
+            logging.error("ingest_handler: " + filelist + ": " + str(e))
+            rc = 1
+        self.wfile.write(str(rc) + "\n")
+#
+#
+# main program (standalone daemon, e.g. on the other nodes of the nodelist)
+#
+#
+if __name__ == "__main__":
+    import time
+    import signal
+    import cad_gpfs_ingest
+
+    # initiate logging
+    log_level = cad_config.scheduler['log_level'].upper()
+    log_file = cad_config.scheduler['log_file']
+    logging.basicConfig(level=log_level, filename=log_file, filemode='a',
+    format='%(asctime)s, %(process)d %(module)s %(lineno)d - %(levelname)s %(message)s')
+    logging.info("main: cad_ingest_server started")
+
+    server = start(cad_gpfs_ingest.gpfs_class())
+    if server is None:
+        sys.exit("cad_ingest_server.py - not started, see log file")
+
+    # SIGTERM and SIGINT stop the server and remove the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(server)
+    print "cad_ingest_server.py - done"
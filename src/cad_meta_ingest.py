@@ -1,20 +1,41 @@
 import sys
 import os
 import logging
-import fnmatch
 import stat
 import datetime
 import time
 import cad_config
+import cad_crawl
+import cad_snapshot
 import meta_api
 
 
 # Filename : cad_meta_ingest.py
 # Purpose  : Independent program to search generic file system and ingest metadata
 #            into the Meta Engine
+#
+# Inputs - cad_config.conf parameters:
+#   [scheduler]
+#   walk_snapshot            - snapshot database, only new or modified files are ingested
+#                              (cad_snapshot), empty = walk and ingest every file
+#   walk_snapshot_stat_files - yes (default): stat every known file, detects files rewritten
+#                              in place, no: only new files and files of changed directories
+#   crawl_threads            - threads listing and stat'ing directories (cad_crawl, or
+#                              cad_snapshot with walk_snapshot), <= 1 = serial walk
+#
+# Which walk: with walk_snapshot set (shipped default) a scheduled rescan ingests only
+# the changes, an unchanged directory costs one stat and is not listed again. Leave it
+# empty for one-off scans or trees that change wholesale between runs: cad_crawl then
+# lists and stats the whole tree every run, with no snapshot database to keep.
 
 # Change Log:
 # 20150629 - initial release
+# 20261018 - ingest_metadata inserts records in batches with meta_api.add_new_records
+# 20261018 - incremental scan with a cad_snapshot directory snapshot, one stat per file
+# 20261018 - parallel cad_crawl directory crawler, search patterns compiled into one regex
+# 20261018 - snapshot walk runs its stat and listdir calls on crawl_threads threads
+# 20261018 - walk_snapshot_stat_files defaults to yes
+# 20261018 - snapshot walk streams directories to the threads, choice of walk documented
 
 
 class meta_class:
@@ -38,12 +59,44 @@ class meta_class:
 			logging_error("meta_class: abort - failed to get redis db handle, rc=" + str(rc))
 			sys.exit("cad_meta_ingest.py - abort")
 
+		self.snapshot = None
+		if cad_config.scheduler['walk_snapshot']:
+			stat_files = cad_config.scheduler['walk_snapshot_stat_files'].lower() != 'no'
+			self.snapshot = cad_snapshot.snapshot_class(cad_config.scheduler['walk_snapshot'], stat_files)
+
+		# match_pattern(file) is true if the file name matches a search_pattern
+		self.match_pattern = cad_crawl.compile_patterns(cad_config.search_pattern)
+		self.crawl_threads = 1
+		if cad_config.scheduler['crawl_threads']:
+			self.crawl_threads = int(cad_config.scheduler['crawl_threads'])
 		return
+
+
+	# yield (filepath, os.stat) of the matching files below root_dir,
+	# with a snapshot only the files that are new or modified since the last run
+	def walk_files(self, root_dir):
+		if self.snapshot is not None:
+			for item in self.snapshot.walk(root_dir, self.match_pattern, self.crawl_threads):
+				yield item
+			return
+
+		if self.crawl_threads > 1:
+			for item in cad_crawl.crawl(root_dir, self.match_pattern, self.crawl_threads):
+				yield item
+			return
+
+		for root, directories, files in os.walk(root_dir):
+			for file in files:
+				if self.match_pattern(file):
+					filepath = os.path.join(root, file)
+					yield filepath, os.stat(filepath)
 	
 
 
 	def ingest_metadata(self, days):
 		
+		batch_size = int(cad_config.scheduler['ingest_batch_size'])
+
 		# loop through directories we want to search for new files
 		for key in cad_config.directories:
 			root_dir = cad_config.directories[key]
@@ -53,59 +106,81 @@ class meta_class:
 				logging.error("ingest_metadata: directory not found: " + root_dir)
 				continue
 			
-			# perform os.walk and match filename pattern
+			# walk the directory (or the changes since the snapshot) and match filename pattern
 			logging.info("ingest_metadata: processing directory: " + root_dir)
 			count = 0
-			for root, directories, files in os.walk(root_dir):
-				for file in files:
-					for pattern in cad_config.search_pattern:
-						
-						# skip this file if pattern not match
-						if not fnmatch.fnmatch(file, pattern):
-							continue
+			batch = []
+			pending = []
+			for (filepath, mode) in self.walk_files(root_dir):
 						
-						# skip this file if days > 0 and mtime > days
-						filepath = os.path.join(root, file)
-						if days > 0:								
-							mode = os.stat(filepath)
-							delta_mtime_days = (time.time() - mode.st_mtime) / 86400.0																
-							if delta_mtime_days > float(days):
-								logging.debug("ingest_metadata: skipping: " + filepath + ", delta_mtime_days=" + str(delta_mtime_days))
-								continue
-						
-						# add this file to metaengine database
-						#   timestamp
-						#   fileset_name
-						#   file_size 
-						#   user_id
-						#   group_id
-						#   modification_timed
-						#   change_timed
-						#   access_timed
-
-						logging.debug("ingest_metadata: " + filepath)
-						mode = os.stat(filepath)
-						
-						# *** SCHEMA DEFINITION ***
-						d = {}							
-						d['timestamp']          = str(datetime.datetime.now())
-						d['file_name']          = filepath
-						d['file_size']          = str(mode.st_size)
-						d['user_id']            = str(mode.st_uid)
-						d['group_id']           = str(mode.st_gid)
-						d['modification_timed'] = str(int(mode.st_mtime / 86400.0))
-						d['change_timed']       = str(int(mode.st_ctime / 86400.0))
-						d['access_timed']       = str(int(mode.st_atime / 86400.0))
-						logging.debug("ingest_metadata: metadata: " + str(d))
-						
-						rc = meta_api.add_new_record(d)
-						if rc == 0:
-							count += 1
-						else:
-							logging_error("ingest_metadata: abort - meta_api add_new_record failed, rc=" + str(rc))
-							return 1
+				# skip this file if days > 0 and mtime > days
+				if days > 0:								
+					delta_mtime_days = (time.time() - mode.st_mtime) / 86400.0																
+					if delta_mtime_days > float(days):
+						logging.debug("ingest_metadata: skipping: " + filepath + ", delta_mtime_days=" + str(delta_mtime_days))
+						continue
+				
+				# add this file to metaengine database
+				#   timestamp
+				#   fileset_name
+				#   file_size 
+				#   user_id
+				#   group_id
+				#   modification_timed
+				#   change_timed
+				#   access_timed
+
+				logging.debug("ingest_metadata: " + filepath)
+				
+				# *** SCHEMA DEFINITION ***
+				d = {}							
+				d['timestamp']          = str(datetime.datetime.now())
+				d['file_name']          = filepath
+				d['file_size']          = str(mode.st_size)
+				d['user_id']            = str(mode.st_uid)
+				d['group_id']           = str(mode.st_gid)
+				d['modification_timed'] = str(int(mode.st_mtime / 86400.0))
+				d['change_timed']       = str(int(mode.st_ctime / 86400.0))
+				d['access_timed']       = str(int(mode.st_atime / 86400.0))
+				logging.debug("ingest_metadata: metadata: " + str(d))
+				
+				# insert records in batches, one meta engine round trip per batch
+				# new records are queued in the pending set of the matching caddy
+				batch.append(d)
+				pending.append(cad_config.match_caddy(filepath))
+				if self.snapshot is not None:
+					self.snapshot.record(filepath, mode)
+				if len(batch) < batch_size:
+					continue
+				(rc, ids) = meta_api.add_new_records(batch, pending)
+				if rc != 0:
+					logging.error("ingest_metadata: abort - meta_api add_new_records failed, rc=" + str(rc))
+					self.rollback_snapshot()
+					return 1
+				count += len(ids)
+				batch = []
+				pending = []
+
+			# insert remaining records of this directory
+			if len(batch) > 0:
+				(rc, ids) = meta_api.add_new_records(batch, pending)
+				if rc != 0:
+					logging.error("ingest_metadata: abort - meta_api add_new_records failed, rc=" + str(rc))
+					self.rollback_snapshot()
+					return 1
+				count += len(ids)
+
+			# the snapshot moves forward once the directory is ingested
+			if self.snapshot is not None:
+				self.snapshot.commit()
 			logging.info("ingest_metadata: files ingested=" + str(count))
 		return 0
+
+
+	# the files of a failed directory are ingested again on the next run
+	def rollback_snapshot(self):
+		if self.snapshot is not None:
+			self.snapshot.rollback()
 #
 #
 # main program (unit testing)
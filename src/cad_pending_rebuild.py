@@ -0,0 +1,52 @@
+import sys
+import logging
+import cad_config
+import meta_api
+
+
+# Filename : cad_pending_rebuild.py
+# Purpose  : seed the meta engine caddy pending sets (pending:<caddy>) with records that
+#            were ingested before the pending sets existed. Records are found with the
+#            full get_unprocessed_record scan, run once after upgrading.
+#
+# Inputs - cad_config.conf parameters:
+#   [vcf], [dicom]
+#   search_pattern
+
+# Change Log:
+# 20261018 - initial release
+#
+#
+# main program
+#
+#
+if __name__ == "__main__":
+
+    # initiate logging to stdout
+    log_level = cad_config.scheduler['log_level'].upper()
+    logging.basicConfig(level=log_level, stream=sys.stdout,
+                        format='%(asctime)s, %(process)d %(module)s %(lineno)d - %(levelname)s %(message)s')
+
+    debug_mode = 0;
+    if log_level == 'DEBUG':
+        debug_mode = 1;
+
+    rc = meta_api.init_redis_handle(cad_config.scheduler['redis_hostname'], debug_mode)
+    if rc != 0:
+        logging.critical("main: init_redis_handle failed, rc=" + str(rc))
+        sys.exit("cad_pending_rebuild.py - abort")
+
+    # scan every caddy search pattern for records without privacy_rule_status
+    for caddy in cad_config.caddies:
+        for pattern in cad_config.caddy_pattern[caddy]:
+            result = meta_api.get_unprocessed_record('file_name', pattern, 'privacy_rule_status')
+            if not isinstance(result, tuple):
+                logging.info("main: " + caddy + " " + pattern + ": no unprocessed records")
+                continue
+
+            (rc, dict) = result
+            rc = meta_api.add_pending_records(caddy, dict.keys())
+            logging.info("main: " + caddy + " " + pattern + ": added "
+                         + str(len(dict)) + " records, rc=" + str(rc))
+
+    sys.exit("cad_pending_rebuild.py - done")
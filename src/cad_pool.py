@@ -0,0 +1,115 @@
+import itertools
+import multiprocessing
+
+
+# Filename : cad_pool.py
+# Purpose  : fan file analysis out over a multiprocessing pool, page by page, while the
+#            caller consumes the results in meta engine pending set order
+#
+# Usage:
+#   pool = cad_pool.create(workers)
+#   for (recid, file, result) in cad_pool.analyze_pending(pending, func, pool, batch, done,
+#                                                         cache, content):
+#
+#   pending - iterator of (recid, file), e.g. meta_cursor.iter_pending()
+#   func    - module level function, result = func(file)
+#   done    - set of files the caller has already accounted for, result is None for these.
+#             A file listed more than once in a page is analyzed once and its result is
+#             returned for every listing the caller has not added to done.
+#   cache   - cad_cache.result_cache or None, files with a cached result are not analyzed,
+#             results with rc == 0 (result[0]) are stored
+#   content - cad_fingerprint.content_index or None, a file with the same content as an
+#             analyzed file is not analyzed, it gets the result of the original. The
+#             fingerprints of a page are computed by content.prepare() before dispatch.
+#
+# workers <= 1 returns no pool and files are analyzed in the calling process.
+#
+# Pool workers are daemon processes and cannot create a pool of their own, check
+# in_worker() before nesting.
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - in_worker() for nested pools
+# 20261018 - results looked up in and saved to a cad_cache result cache
+# 20261018 - copies found by cad_fingerprint reuse the result of the original
+# 20261018 - fingerprints of a page computed concurrently before dispatch
+#
+#
+# functions
+#
+#
+# pool = create(workers)
+def create(workers):
+    if workers <= 1:
+        return None
+    return multiprocessing.Pool(workers)
+
+
+# True in a pool worker process
+def in_worker():
+    return multiprocessing.current_process().daemon
+
+
+# release the worker processes
+def close(pool):
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+# yield the pending items batch at a time
+def pages(pending, batch):
+    page = []
+    for item in pending:
+        page.append(item)
+        if len(page) >= batch:
+            yield page
+            page = []
+    if len(page) > 0:
+        yield page
+
+
+# yield (recid, file, result) in pending order, results are streamed back as the
+# workers finish them
+def analyze_pending(pending, func, pool, batch, done, cache=None, content=None):
+    for page in pages(pending, batch):
+
+        # files of this page that need analysis, in order of first listing
+        files = []
+        listed = set()
+        cached = {}
+        for (recid, file) in page:
+            if file not in done and file not in listed:
+                listed.add(file)
+                if cache is not None:
+                    result = cache.get(file)
+                    if result is not None:
+                        cached[file] = result
+                        continue
+                files.append(file)
+
+        # copies are matched in page order, the fingerprints are computed ahead on threads
+        if content is not None:
+            content.prepare(files)
+            files = [file for file in files if content.match(file) is None]
+
+        if pool is None:
+            results = itertools.imap(func, files)
+        else:
+            results = pool.imap(func, files)
+
+        for (recid, file) in page:
+            if file in done:
+                yield recid, file, None
+            elif file in cached:
+                yield recid, file, cached[file]
+            else:
+                if content is not None and file in content.duplicate_of:
+                    cached[file] = content.results[content.duplicate_of[file]]
+                else:
+                    cached[file] = results.next()
+                    if content is not None:
+                        content.results[file] = cached[file]
+                if cache is not None and cached[file][0] == 0:
+                    cache.put(file, cached[file])
+                yield recid, file, cached[file]
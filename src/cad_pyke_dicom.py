@@ -2,7 +2,7 @@ import sys
 import os
 import logging
 import cad_config
-import dicom
+import dicom_header
 from pyke import knowledge_engine, krb_traceback, goal
 
 
@@ -17,11 +17,67 @@ from pyke import knowledge_engine, krb_traceback, goal
 #   [dicom]
 #   log_file
 #   rules_file
+#   header_only - yes: pixel data and large values are not read (dicom_header)
 
 # Change Log:
 # 20150715 - initial release
+# 20261018 - data elements read with dicom_header, header_only skips pixel data
+# 20261018 - one pyke engine per process, reset between files, conclusions read in one pass
+# 20261018 - classify() split out, reference engine for cad_rules_dicom (test_rules_dicom.py)
+# 20261018 - conclusions read with goal.compile().prove(), no pyke internals
+# 20261018 - the four conclusion lists read with one goal (conclusion facts)
+#
+#
+# functions
+#
+#
+# pyke engine of this process, the rule base is compiled once into compiled_krb/
+# and forked workers (cad_pool) inherit the loaded engine
+engine = None
+
+def init_engine():
+    global engine
+    if engine is None:
+        engine = knowledge_engine.engine(__file__)
+    return engine
+
 
+# conclusions = classify([(tag, value), ...])
+# {'isphi_tag': [tag, ...], 'nokey_tag': [...], 'blank_tag': [...], 'nophi_tag': [...]}
+def classify(attributes):
+
+    # reuse the process engine, facts of the previous file are dropped by reset()
+    engine = init_engine()
+    engine.reset()
+
+    # add tag and value of each data element as pyke specific fact
+    for (tag, val) in attributes:
+        engine.add_case_specific_fact('dicom_file', 'attribute_is', (tag, val))
+
+    # forward chaining runs on activation, every conclusion is asserted as a
+    # dicom_file.conclusion(name, tag) fact as well and read back with one goal
+    engine.activate('cad_pyke_dicom')
+    return conclusion_tags(engine)
 
+
+# goal listing every conclusion, compiled once
+conclusion_goal = goal.compile('dicom_file.conclusion($name, $tag)')
+
+
+# {name: [tag, ...]} asserted as dicom_file.conclusion(name, $tag) by the last activation,
+# in assertion order, read with the public goal API in one pass over the asserted facts
+def conclusion_tags(engine):
+    conclusions = dict()
+    for name in ('isphi_tag', 'nokey_tag', 'blank_tag', 'nophi_tag'):
+        conclusions[name] = list()
+    try:
+        with conclusion_goal.prove(engine) as gen:
+            for (vars, plan) in gen:
+                conclusions[vars['name']].append(vars['tag'])
+    except KeyError:
+        # no dicom_file fact base yet, nothing was asserted
+        pass
+    return conclusions
 #
 #
 # (rc, status, reason) = process_dicom_file(dicom_file)
@@ -29,59 +85,26 @@ from pyke import knowledge_engine, krb_traceback, goal
 #
 def process_dicom_file(dicom_file):
     
-    phi_rule = list()
-    undef_rule = list()
-
-    # extract dicom dataset
+    # extract dicom data elements
     try:
         logging.info("process_dicom_file: " + dicom_file)
-        dataset = dicom.read_file(dicom_file)
+        header_only = cad_config.dicom['header_only'].lower() == 'yes'
+        elements = dicom_header.read_elements(dicom_file, header_only)
 
     except:
         logging.error("process_dicom_file: file open error: " + dicom_file)
         return 1, 'file_not_found', 'none', 'none'
 
-    tags_total = len(dataset)
-    tags_blank = 0
-    tags_nokey = 0
-    tags_isphi = 0
-    tags_nophi = 0
-    
-    engine = knowledge_engine.engine(__file__)
-    engine.reset()
-    goal_isphi = goal.compile('dicom_file.isphi_tag($tag)')
-    goal_nokey = goal.compile('dicom_file.nokey_tag($tag)')
-    goal_blank = goal.compile('dicom_file.blank_tag($tag)')
-    goal_nophi = goal.compile('dicom_file.nophi_tag($tag)')
-
-    # extract tag and value from dicom file and add as pyke specific fact
-    for data_element in dataset:
-        tag = str(data_element.tag).lower()
-        tag = tag.replace(", ", ",")            
-        val = str(data_element.value)
-        val = val.rstrip().lstrip()
-        engine.add_case_specific_fact('dicom_file', 'attribute_is', (tag, val))
+    tags_total = len(elements)
 
-    engine.activate('cad_pyke_dicom')
-    # engine.get_kb('dicom_file').dump_specific_facts()
-    
-    with goal_isphi.prove(engine) as gen:
-        for vars, plan in gen:
-            tags_isphi += 1
-            phi_rule.append(vars['tag'])
-
-    with goal_nokey.prove(engine) as gen:
-        for vars, plan in gen:
-            tags_nokey += 1
-            undef_rule.append(vars['tag'])
-
-    with goal_blank.prove(engine) as gen:
-        for vars, plan in gen:
-            tags_blank += 1
-
-    with goal_nophi.prove(engine) as gen:
-        for vars, plan in gen:
-            tags_nophi += 1
+    conclusions = classify([(dicom_header.tag_string(tag), val) for (tag, name, val) in elements])
+
+    phi_rule = conclusions['isphi_tag']
+    undef_rule = conclusions['nokey_tag']
+    tags_isphi = len(phi_rule)
+    tags_nokey = len(undef_rule)
+    tags_blank = len(conclusions['blank_tag'])
+    tags_nophi = len(conclusions['nophi_tag'])
             
     # error if tag counts don't match
     if tags_total != (tags_blank + tags_nokey + tags_isphi + tags_nophi):
@@ -2,6 +2,7 @@ import sys
 import logging
 import csv
 import meta_api
+import meta_cursor
 import cad_config
 
 
@@ -12,6 +13,9 @@ import cad_config
 
 # Change Log:
 # 20150730 - initial release
+# 20261018 - records read page by page with meta_cursor.iter_records
+# 20261018 - only the report fields are read from the meta engine
+# 20261018 - duplicate_of column, fields missing from a record are reported empty
 #
 
 def generate_report(search, list_history):
@@ -24,14 +28,9 @@ def generate_report(search, list_history):
 		logging.critical("generate_reports: init_redis_handle failed, rc=" + str(rc))
 		return 1
 
-	# retrieve metadata records from metaengine db
+	# metadata records are read from metaengine db page by page, twice
 	logging.info("generate_report: retrieve 'file_format'=" + search)
-	
-	rdict = {}
-	rc,rdict = meta_api.get_records('file_format', search.lower())
-	if rc != 0:
-		logging.critical("generate_reports: query db failed, rc=" + str(rc))
-		return 2
+	batch_size = int(cad_config.scheduler['cursor_batch_size'])
 	
 	# format data into csv file
 	adict = {}
@@ -39,47 +38,44 @@ def generate_report(search, list_history):
 	fh = open(report_name, 'wb')
 	writer = csv.writer(fh)
 	
-	# write header
+	# write header, the report columns are the only fields read from metaengine db
 	if search == "vcf":
-		writer.writerow(["file_format", "file_name", "privacy_timestamp", "privacy_rule_status", 
-		                 "privacy_rule_reason"])
+		report_fields = ["file_format", "file_name", "privacy_timestamp", "privacy_rule_status", 
+		                 "privacy_rule_reason", "duplicate_of"]
 	else:    # dicom
-		writer.writerow(["file_format", "file_name", "privacy_timestamp", "privacy_rule_status", 
-		                 "privacy_dicom_phi_rule", "privacy_dicom_unref_rule"])
+		report_fields = ["file_format", "file_name", "privacy_timestamp", "privacy_rule_status", 
+		                 "privacy_dicom_phi_rule", "privacy_dicom_unref_rule", "duplicate_of"]
+	writer.writerow(report_fields)
 
-	# filter out old entries, save list of latest entries in new_dict
-	new_dict ={}
-	for key in rdict:
-		adict = rdict[key]
-		file_name = adict['file_name']
-		if file_name in new_dict:
-			if adict['privacy_timestamp'] > new_dict[file_name]:
-				new_dict[file_name] = adict['privacy_timestamp']
-		else:
-			new_dict[file_name] = adict['privacy_timestamp']
-
-	# write entries
-	for key in rdict:
-		adict = rdict[key]
-		
-		# skip over old entries if list_history=False
+	try:
+		# filter out old entries, save list of latest entries in new_dict
+		new_dict ={}
 		if not list_history:
-			if adict['privacy_timestamp'] != new_dict[adict['file_name']]:
-				continue
+			for (key, adict) in meta_cursor.iter_records('file_format', search.lower(), batch_size,
+			                                             ['file_name', 'privacy_timestamp']):
+				file_name = adict['file_name']
+				if file_name in new_dict:
+					if adict['privacy_timestamp'] > new_dict[file_name]:
+						new_dict[file_name] = adict['privacy_timestamp']
+				else:
+					new_dict[file_name] = adict['privacy_timestamp']
+
+		# write entries
+		for (key, adict) in meta_cursor.iter_records('file_format', search.lower(), batch_size,
+		                                             report_fields):
 			
-		try:
-			writer.writerow([adict['file_format'], 
-				             adict['file_name'], 
-				             adict['privacy_timestamp'],
-				             adict['privacy_rule_status'],
-				             adict['privacy_rule_reason']])
-		except KeyError:    # dicom
-			writer.writerow([adict['file_format'], 
-		                     adict['file_name'], 
-		                     adict['privacy_timestamp'],
-		                     adict['privacy_rule_status'],
-		                     adict['privacy_dicom_phi_rule'],
-		                     adict['privacy_dicom_unref_rule']])
+			# skip over old entries if list_history=False
+			if not list_history:
+				if adict['privacy_timestamp'] != new_dict[adict['file_name']]:
+					continue
+				
+			writer.writerow([adict.get(f, '') for f in report_fields])
+
+	except IOError as e:
+		logging.critical("generate_reports: query db failed, " + str(e))
+		fh.close()
+		return 2
+
 	fh.close()
 	return 0
 #
@@ -0,0 +1,174 @@
+import os
+import re
+import logging
+import cad_config
+import dicom_header
+
+
+# Filename : cad_rules_dicom.py
+# Purpose  : process dicom formatted file, determine PHI state with the cad_pyke_dicom.krb
+#            rules evaluated as set lookups against an indexed dicom_phi_rules.kfb fact table
+#            (same conclusions as the pyke engine without backtracking)
+#
+# Inputs - cad_config.conf parameters:
+#   [dicom]
+#   header_only - yes: pixel data and large values are not read (dicom_header)
+#
+# Rules (cad_pyke_dicom.krb), in firing order:
+#   not_phi              - nophi_tag: tag has a universal_fact_not_phi
+#   not_phi_blank_value  - blank_tag: is_phi rule 'empty()' and value == ''
+#   is_phi_unknown_tag   - nokey_tag: tag has neither fact
+#   is_phi_no_rule       - isphi_tag: is_phi rule ''
+#   is_phi_empty         - isphi_tag: is_phi rule 'empty()' and value != ''
+#   is_phi_remove        - isphi_tag: is_phi rule 'remove()'
+#   is_phi_incrementdate - isphi_tag: is_phi rule 'incrementdate(this|@dateinc)'
+#   is_phi_unknown_rule  - isphi_tag: is_phi and none of the 4 rules above
+#
+# Each conclusion list keeps pyke's assertion order: rule order, then data element order,
+# a tag is asserted once per conclusion.
+
+# Change Log:
+# 20261018 - initial release
+#
+#
+# fact table
+#
+#
+RULE_NONE = ''
+RULE_EMPTY = 'empty()'
+RULE_REMOVE = 'remove()'
+RULE_INCREMENTDATE = 'incrementdate(this|@dateinc)'
+KNOWN_RULES = frozenset([RULE_NONE, RULE_EMPTY, RULE_REMOVE, RULE_INCREMENTDATE])
+
+fact_pattern = re.compile(r"^\s*universal_fact_(is_phi|not_phi)\('([^']*)',\s*'([^']*)',\s*'([^']*)'\)")
+
+# tag -> set of is_phi anonymization rules, set of not_phi tags
+is_phi_rules = None
+not_phi_tags = None
+
+
+# load the universal facts of dicom_phi_rules.kfb once per process
+def load_facts(kfb_file=None):
+    global is_phi_rules, not_phi_tags
+    if kfb_file is None:
+        kfb_file = os.path.dirname(os.path.realpath(__file__)) + '/dicom_phi_rules.kfb'
+
+    is_phi_rules = dict()
+    not_phi_tags = set()
+    with open(kfb_file, 'r') as fp:
+        for line in fp:
+            m = fact_pattern.match(line)
+            if m is None:
+                continue
+            (fact, tag, name, rule) = m.groups()
+            if fact == 'is_phi':
+                is_phi_rules.setdefault(tag, set()).add(rule)
+            else:
+                not_phi_tags.add(tag)
+#
+#
+# functions
+#
+#
+# conclusions = classify([(tag, value), ...])
+# {'isphi_tag': [tag, ...], 'nokey_tag': [...], 'blank_tag': [...], 'nophi_tag': [...]}
+def classify(attributes):
+    if is_phi_rules is None:
+        load_facts()
+
+    nophi = list()
+    blank = list()
+    nokey = list()
+    isphi = [list(), list(), list(), list(), list()]    # one list per is_phi_* rule
+
+    for (tag, val) in attributes:
+        rules = is_phi_rules.get(tag)
+        if tag in not_phi_tags:
+            nophi.append(tag)
+        elif rules is None:
+            nokey.append(tag)
+        if rules is None:
+            continue
+
+        if RULE_EMPTY in rules and val == '':
+            blank.append(tag)
+        if RULE_NONE in rules:
+            isphi[0].append(tag)
+        if RULE_EMPTY in rules and val != '':
+            isphi[1].append(tag)
+        if RULE_REMOVE in rules:
+            isphi[2].append(tag)
+        if RULE_INCREMENTDATE in rules:
+            isphi[3].append(tag)
+        if rules.isdisjoint(KNOWN_RULES):
+            isphi[4].append(tag)
+
+    conclusions = dict()
+    conclusions['nophi_tag'] = unique(nophi)
+    conclusions['blank_tag'] = unique(blank)
+    conclusions['nokey_tag'] = unique(nokey)
+    conclusions['isphi_tag'] = unique(isphi[0] + isphi[1] + isphi[2] + isphi[3] + isphi[4])
+    return conclusions
+
+
+# tags in first assertion order
+def unique(tags):
+    seen = set()
+    out = list()
+    for tag in tags:
+        if tag not in seen:
+            seen.add(tag)
+            out.append(tag)
+    return out
+#
+#
+# (rc, status, phi_rule, undef_rule) = process_dicom_file(dicom_file)
+#
+#
+def process_dicom_file(dicom_file):
+
+    # extract dicom data elements
+    try:
+        logging.info("process_dicom_file: " + dicom_file)
+        header_only = cad_config.dicom['header_only'].lower() == 'yes'
+        elements = dicom_header.read_elements(dicom_file, header_only)
+
+    except:
+        logging.error("process_dicom_file: file open error: " + dicom_file)
+        return 1, 'file_not_found', 'none', 'none'
+
+    tags_total = len(elements)
+    conclusions = classify([(dicom_header.tag_string(tag), val) for (tag, name, val) in elements])
+
+    phi_rule = conclusions['isphi_tag']
+    undef_rule = conclusions['nokey_tag']
+    tags_isphi = len(phi_rule)
+    tags_nokey = len(undef_rule)
+    tags_blank = len(conclusions['blank_tag'])
+    tags_nophi = len(conclusions['nophi_tag'])
+
+    # error if tag counts don't match
+    if tags_total != (tags_blank + tags_nokey + tags_isphi + tags_nophi):
+        logging.error("process_dicom_file: tag count mismatch,"
+                      + " total:" + str(tags_total)
+                      + " blank:" + str(tags_blank)
+                      + " nokey:" + str(tags_nokey)
+                      + " isphi:" + str(tags_isphi)
+                      + " nophi:" + str(tags_nophi))
+        return 2, 'indeterminate', 'none', 'none'
+
+    # construct return parameters
+    if tags_isphi == 0 and tags_nokey == 0:
+        status = "not_phi"
+    else:
+        status = "is_phi"
+
+    # we are done, print status and reason
+    logging.info("process_dicom_file: status: " + status)
+    logging.info("process_dicom_file: reason: tag counts -"
+                 + " total:" + str(tags_total)
+                 + " blank:" + str(tags_blank)
+                 + " nokey:" + str(tags_nokey)
+                 + " isphi:" + str(tags_isphi)
+                 + " nophi:" + str(tags_nophi))
+    return 0, status, str(phi_rule), str(undef_rule)
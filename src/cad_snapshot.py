@@ -0,0 +1,209 @@
+import os
+import marshal
+import collections
+import multiprocessing.pool
+import sqlite3
+
+
+# Filename : cad_snapshot.py
+# Purpose  : persistent directory snapshot for incremental file system scans
+#            (cad_meta_ingest), a scan yields only files that are new or modified since
+#            the last committed scan
+#
+#            The snapshot holds the mtime, file names and subdirectories of every
+#            directory, and (inode, size, mtime) of every file recorded by the caller.
+#            A directory whose mtime is unchanged has the same entries, it is not listed
+#            again and its recorded files are not stat'ed, only its subdirectories are.
+#            The work of a scan is one stat per directory plus the changed entries.
+#
+#            All file names are kept, match is applied on every walk: after a change of
+#            the search patterns the files of unchanged directories that match now are
+#            not recorded and are yielded.
+#
+#            A file rewritten in place does not change its directory's mtime, set
+#            stat_files to stat the recorded files of unchanged directories as well.
+#
+#            With threads > 1 the stat and listdir calls run on a thread pool, the
+#            directories are streamed to it depth first with WINDOW per thread in flight,
+#            memory holds those and the paths of the directories still to visit.
+#
+# Usage:
+#   snap = cad_snapshot.snapshot_class(path, stat_files=False)
+#   for (filepath, st) in snap.walk(root_dir, match, threads):    - match(name) selects files
+#       snap.record(filepath, st)                                   - file ingested
+#   snap.commit()    or    snap.rollback()
+#   snap.close()
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - all file names of a directory kept, match applied on every walk
+# 20261018 - stat and listdir calls of a directory level run on a thread pool
+# 20261018 - directories streamed to the pool depth first, WINDOW in flight per thread
+#
+#
+# constants
+#
+#
+WINDOW = 4    # directories in flight per thread
+#
+#
+# class - snapshot_class
+#
+#
+class snapshot_class:
+
+    def __init__(self, path, stat_files=False):
+        self.stat_files = stat_files
+        self.db = sqlite3.connect(path)
+        self.db.text_factory = str
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs ("
+                        "path TEXT PRIMARY KEY, mtime TEXT, subdirs BLOB, files BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                        "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime TEXT)")
+        self.db.commit()
+
+
+    # yield (filepath, os.stat) of matching files not recorded with the same
+    # (inode, size, mtime), symbolic links to directories are not followed (os.walk)
+    #
+    # directories are walked depth first and streamed to a pool of threads, at most
+    # WINDOW per thread are in flight: the stat and listdir calls run on the pool, the
+    # snapshot database is read and written by the calling thread only
+    def walk(self, root_dir, match, threads=1):
+        pool = None
+        if threads > 1:
+            pool = multiprocessing.pool.ThreadPool(threads)
+
+        def submit(dir):
+            task = self.scan_task(dir, match)
+            if pool is None:
+                result = self.scan_dir(task)
+                return lambda: result
+            return pool.apply_async(self.scan_dir, (task,)).get
+
+        try:
+            stack = [root_dir]
+            inflight = collections.deque()
+            while len(stack) > 0 or len(inflight) > 0:
+                while len(stack) > 0 and len(inflight) < WINDOW * threads:
+                    inflight.append(submit(stack.pop()))
+                result = inflight.popleft()()
+                if result is None:
+                    continue
+
+                (dir, row, mtime, subdirs, files, found) = result
+                if row is None or row[0] != mtime:
+                    if row is not None:
+                        self.forget(dir, row[1], row[2], subdirs, files)
+                    self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                                    (dir, mtime, sqlite3.Binary(marshal.dumps(subdirs)),
+                                     sqlite3.Binary(marshal.dumps(files))))
+                for item in found:
+                    yield item
+                for name in reversed(subdirs):
+                    stack.append(os.path.join(dir, name))
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
+    # task = scan_task(dir, match)
+    # snapshot of dir for scan_dir: (dir, match, row, known), row is (mtime, subdirs, files)
+    # or None, known maps the recorded matching files to (inode, size, mtime)
+    def scan_task(self, dir, match):
+        row = self.db.execute("SELECT mtime, subdirs, files FROM dirs WHERE path = ?",
+                              (dir,)).fetchone()
+        known = {}
+        if row is not None:
+            row = (row[0], marshal.loads(str(row[1])), marshal.loads(str(row[2])))
+            for name in row[2]:
+                if not match(name):
+                    continue
+                state = self.db.execute("SELECT inode, size, mtime FROM files WHERE path = ?",
+                                        (os.path.join(dir, name),)).fetchone()
+                if state is not None:
+                    known[name] = state
+        return dir, match, row, known
+
+
+    # (dir, row, mtime, subdirs, files, found) = scan_dir(task)
+    # file system side of a directory, runs on a pool thread: a directory whose mtime is
+    # unchanged is not listed again, found are the matching files to yield, None if dir
+    # is gone
+    def scan_dir(self, task):
+        (dir, match, row, known) = task
+        try:
+            mtime = repr(os.stat(dir).st_mtime)
+        except OSError:
+            return None
+
+        if row is not None and row[0] == mtime:
+            (subdirs, files) = (row[1], row[2])
+            stat_all = self.stat_files
+        else:
+            try:
+                (subdirs, files) = self.list_dir(dir)
+            except OSError:
+                return None
+            stat_all = True
+
+        found = []
+        for name in files:
+            if not match(name):
+                continue
+            state = known.get(name)
+            if state is not None and not stat_all:
+                continue
+            filepath = os.path.join(dir, name)
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                continue
+            if state is None or state != (st.st_ino, st.st_size, repr(st.st_mtime)):
+                found.append((filepath, st))
+        return dir, row, mtime, subdirs, files, found
+
+
+    # (subdirs, files) = list_dir(dir)
+    # subdirectories to descend into (as os.walk: no symbolic links) and file names
+    def list_dir(self, dir):
+        subdirs = []
+        files = []
+        for name in os.listdir(dir):
+            path = os.path.join(dir, name)
+            if os.path.isdir(path):
+                if not os.path.islink(path):
+                    subdirs.append(name)
+            else:
+                files.append(name)
+        return subdirs, files
+
+
+    # drop the snapshot of entries removed from dir
+    def forget(self, dir, old_subdirs, old_files, subdirs, files):
+        for name in set(old_files) - set(files):
+            self.db.execute("DELETE FROM files WHERE path = ?", (os.path.join(dir, name),))
+        for name in set(old_subdirs) - set(subdirs):
+            path = os.path.join(dir, name)
+            for table in ('dirs', 'files'):
+                # the subtree is path itself and the paths from path + '/' up to path + '0'
+                self.db.execute("DELETE FROM " + table + " WHERE path = ? OR "
+                                "(path >= ? AND path < ?)", (path, path + '/', path + '0'))
+
+
+    # remember the state of an ingested file
+    def record(self, filepath, st):
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                        (filepath, st.st_ino, st.st_size, repr(st.st_mtime)))
+
+
+    def commit(self):
+        self.db.commit()
+
+
+    def rollback(self):
+        self.db.rollback()
+
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,293 @@
+import os
+import re
+import vcf
+import cad_pool
+import cad_compress
+
+
+# Filename : cad_vcf_scan.py
+# Purpose  : count germline/somatic (SS) sample calls of a vcf file straight from the
+#            data lines, without building PyVCF _Record and _Call objects
+#            (header parsed by pyVCF release 0.6.7 vcf.Reader)
+#
+#            The data lines are checked the way vcf.Reader.next() parses them, so a line
+#            that raises in PyVCF raises the same exception here (ValueError for a bad
+#            POS, INFO or numeric sample value) and the counts, ratio and verdict of
+#            cad_analyze_vcf are unchanged. Sample values are checked with the pure python
+#            parser rules (vcf.parser._parse_samples), not the optional cython cparse.
+#
+#            The FORMAT column is parsed once per distinct FORMAT string, sample values of
+#            that format are checked once per distinct text (most calls of a cohort vcf
+#            repeat, e.g. 0/0:.:.)
+#
+#            Early exit: given the threshold and the size of an uncompressed file, the
+#            data lines still to come are bounded by the unread bytes over the shortest
+#            line that can pass the checks (every sample column present), no extra pass
+#            over the file is made. The scan stops as soon as the ratio test can no
+#            longer change, i.e. germline/somatic calls exceed the threshold share of every
+#            possible total, or stay at or below it even if every remaining call is one.
+#            Lines after the stop point are not read, a malformed line there is not seen.
+#            The size of a compressed file's data is not known without decoding it, those
+#            files are scanned whole.
+#
+#            Split scan: the data lines of a large file are cut at line boundaries into byte
+#            ranges, each range is scanned by a pool worker (header parsed again by the
+#            worker) and the counts are summed. An error is raised as the first failing
+#            range reports it, i.e. the same error a serial scan stops at.
+#
+# Usage:
+#   vcf_reader = vcf.Reader(open(vcf_file, 'r'))
+#   (total_samples, total_germlinesomatic, stopped) = cad_vcf_scan.scan(vcf_reader)
+#
+#   (total_samples, total_germlinesomatic, stopped) = cad_vcf_scan.scan(vcf_reader,
+#                                               pii_thres, os.path.getsize(vcf_file))
+#   stopped - data lines read when the scan stopped early, 0 = whole file read
+#
+#   (total_samples, total_germlinesomatic, stopped) = cad_vcf_scan.scan_split(vcf_file, workers)
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - early exit once the pii threshold test is settled
+# 20261018 - split scan of large files over a worker pool
+# 20261018 - count_data_lines of compressed files
+# 20261018 - early exit bound from the file size, count_data_lines pass removed
+# 20261018 - SCAN_VERSION for the result cache rule version
+#
+#
+# constants
+#
+#
+SCAN_VERSION = 2    # raised when the counts or the early stop of a scan change (cad_cache)
+NUMERIC_TYPES = ('Integer', 'Float')    # single values converted with int()/float()
+LIST_TYPES = ('Integer', 'Float', 'Numeric')    # comma separated values converted
+MEMO_SIZE = 65536    # distinct sample texts remembered per FORMAT
+#
+#
+# class - sample_format
+#
+#
+# checks the sample columns of one FORMAT string
+class sample_format:
+
+    def __init__(self, vcf_reader, fmt):
+        # same field names, types and numbers as PyVCF (raises on invalid FORMAT)
+        samp_fmt = vcf_reader._parse_sample_format(fmt)
+        self.nfields = len(samp_fmt._fields)
+        self.checks = [(i, samp_fmt._types[i], samp_fmt._nums[i])
+                       for i in range(self.nfields)
+                       if samp_fmt._types[i] in LIST_TYPES]
+        self.ss = None
+        if 'SS' in samp_fmt._fields:
+            self.ss = samp_fmt._fields.index('SS')
+        self.memo = {}
+
+
+    # hit = is_germlinesomatic(sample)
+    # True when the SS value of the sample == 1, raises ValueError as PyVCF does
+    def is_germlinesomatic(self, sample):
+        hit = self.memo.get(sample)
+        if hit is not None:
+            return hit
+
+        vals = sample.split(':')
+
+        hit = False
+        for (i, entry_type, entry_num) in self.checks:
+            if i >= len(vals):
+                break
+            val = vals[i]
+            if val == '.' or val == './.':
+                continue
+
+            if entry_num == 1 or ',' not in val:
+                if entry_type in NUMERIC_TYPES:
+                    # int() accepts a subset of float(), float() decides validity
+                    # and int(val) == 1 exactly when float(val) == 1
+                    if float(val) == 1 and i == self.ss:
+                        hit = True
+            else:
+                for v in val.split(','):
+                    if v != '.':
+                        float(v)
+
+        if len(vals) > self.nfields:
+            raise IndexError("sample has more fields than FORMAT: " + sample)
+
+        if len(self.memo) >= MEMO_SIZE:
+            self.memo.clear()
+        self.memo[sample] = hit
+        return hit
+#
+#
+# functions
+#
+#
+# raise as vcf.Reader._parse_alt would for a malformed ALT column
+def check_alt(vcf_reader, alt):
+    for a in alt.split(','):
+        if a == '.':
+            continue
+        if a == '':
+            raise IndexError("empty ALT allele")
+        if '[' in a or ']' in a:
+            vcf_reader._parse_alt(a)
+
+
+# length = min_line_bytes(indexes)
+# fewest bytes a data line can have without raising in scan(): the columns up to the
+# last sample index present (9 + k columns, 8 + k separators), a POS digit, an ALT
+# character and the newline
+def min_line_bytes(indexes):
+    k = indexes[-1] + 1
+    return 8 + k + 3
+
+
+# (total_samples, total_germlinesomatic, stopped) = scan(vcf_reader, pii_thres, data_bytes)
+# vcf_reader is positioned after the header, total_samples counts one call per
+# distinct sample name per data line, no early exit unless pii_thres and data_bytes
+# (the size of the uncompressed file) are given
+def scan(vcf_reader, pii_thres=None, data_bytes=0):
+    separator = re.compile(vcf_reader._separator)
+    nsamples = len(vcf_reader.samples)
+    indexes = sorted(vcf_reader._sample_indexes.values())
+    all_columns = indexes == range(nsamples)
+    formats = {}
+
+    # the data lines still to come are bounded by the bytes not read yet over the
+    # shortest possible line, lines are stripped by the reader so the bytes read are
+    # undercounted and the bound stays an upper bound
+    early_exit = pii_thres is not None and data_bytes > 0 and len(indexes) > 0
+    if early_exit:
+        min_line = min_line_bytes(indexes)
+    read_bytes = sum([len(line) + 1 for line in vcf_reader._header_lines])
+
+    total_samples = 0
+    total_germlinesomatic = 0
+    lines = 0
+    for line in vcf_reader.reader:
+        row = separator.split(line.rstrip())
+        int(row[1])
+        check_alt(vcf_reader, row[4])
+        vcf_reader._parse_info(row[7])
+
+        # samples are parsed only when there is a FORMAT column
+        hits = []
+        if len(row) > 8:
+            fmt = row[8]
+            samp_fmt = formats.get(fmt)
+            if samp_fmt is None:
+                samp_fmt = formats[fmt] = sample_format(vcf_reader, fmt)
+            hits = [samp_fmt.is_germlinesomatic(sample) for sample in row[9:9 + nsamples]]
+
+        if len(indexes) > 0:
+            if len(hits) <= indexes[-1]:
+                raise IndexError("missing sample columns, line: " + line[:80])
+            if samp_fmt.ss is None:
+                raise AttributeError("SS not in FORMAT " + fmt)
+
+        total_samples += len(indexes)
+        if all_columns:
+            total_germlinesomatic += sum(hits)
+        else:
+            total_germlinesomatic += sum([hits[idx] for idx in indexes])
+        lines += 1
+
+        # most calls the whole file can have, the ratio test is done in float
+        # as cad_analyze_vcf does
+        if early_exit:
+            read_bytes += len(line) + 1
+            remaining = max(data_bytes - read_bytes, 0) // min_line * len(indexes)
+            if remaining > 0:
+                total_max = float(total_samples + remaining)
+                if (total_germlinesomatic / total_max > pii_thres
+                        or (total_germlinesomatic + remaining) / total_max <= pii_thres):
+                    return total_samples, total_germlinesomatic, lines
+
+    return total_samples, total_germlinesomatic, 0
+
+
+# offset = data_offset(fp)
+# byte offset of the first data line, after the ## lines and the column header line
+def data_offset(fp):
+    while True:
+        line = fp.readline()
+        if not line:
+            break
+        text = line.strip()
+        if text and not text.startswith('##'):
+            break
+    return fp.tell()
+
+
+# [(start, end), ...] = split_ranges(vcf_file, parts)
+# byte ranges of the data lines, each starts at a line boundary (uncompressed files only)
+def split_ranges(vcf_file, parts):
+    size = os.path.getsize(vcf_file)
+    with open(vcf_file, 'rb') as fp:
+        start = data_offset(fp)
+        bounds = [start]
+        for i in range(1, parts):
+            pos = start + (size - start) * i // parts
+            if pos <= bounds[-1]:
+                continue
+            fp.seek(pos - 1)
+            fp.readline()
+            pos = fp.tell()
+            if pos > bounds[-1] and pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+
+# lines starting in [start, end)
+def range_lines(fp, start, end):
+    fp.seek(start)
+    pos = start
+    while pos < end:
+        line = fp.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
+
+
+# (total_samples, total_germlinesomatic, error) = scan_range((vcf_file, start, end))
+# cad_pool worker function, error is the exception the scan stopped at or None
+def scan_range(args):
+    (vcf_file, start, end) = args
+    try:
+        vcf_reader = vcf.Reader(open(vcf_file, 'r'))
+        fp = open(vcf_file, 'rb')
+        try:
+            vcf_reader.reader = (line.strip() for line in range_lines(fp, start, end)
+                                 if line.strip())
+            (total_samples, total_germlinesomatic, stopped) = scan(vcf_reader)
+        finally:
+            fp.close()
+            vcf_reader._reader.close()
+    except Exception as e:
+        return 0, 0, e
+    return total_samples, total_germlinesomatic, None
+
+
+# (total_samples, total_germlinesomatic, stopped) = scan_split(vcf_file, workers)
+# same counts as scan() of the whole file, stopped is always 0
+def scan_split(vcf_file, workers):
+    ranges = split_ranges(vcf_file, workers)
+    pool = cad_pool.create(workers)
+    try:
+        if pool is None:
+            results = map(scan_range, [(vcf_file, start, end) for (start, end) in ranges])
+        else:
+            results = pool.map(scan_range, [(vcf_file, start, end) for (start, end) in ranges])
+    finally:
+        cad_pool.close(pool)
+
+    total_samples = 0
+    total_germlinesomatic = 0
+    for (samples, germlinesomatic, error) in results:
+        if error is not None:
+            raise error
+        total_samples += samples
+        total_germlinesomatic += germlinesomatic
+    return total_samples, total_germlinesomatic, 0
@@ -0,0 +1,120 @@
+import logging
+import time
+import threading
+import Queue
+import cad_config
+import meta_api
+
+
+# Filename : cad_writeback.py
+# Purpose  : write-behind buffer for analysis results, fields appended to meta engine
+#            records are collected and written with one meta_api.append_to_records call,
+#            written records are removed from the caddy pending set
+#
+#            Full buffers are written by a background thread, meta_api releases the GIL
+#            while it waits on the meta engine so file analysis continues meanwhile.
+#
+# Inputs - cad_config.conf parameters:
+#   [scheduler]
+#   writeback_batch_size     - flush when this many records are buffered
+#   writeback_interval_sec   - flush when the oldest buffered record is this old
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - batches written by a background thread, flush() waits for completion
+# 20261018 - writer thread started on first batch
+# 20261018 - append() returns nothing, write errors are reported by flush() only
+#
+#
+# class - writeback_class
+#
+#
+class writeback_class:
+
+    def __init__(self, caddy):
+        self.caddy = caddy
+        self.batch_size = int(cad_config.scheduler['writeback_batch_size'])
+        self.interval = float(cad_config.scheduler['writeback_interval_sec'])
+        self.records = {}
+        self.first_time = 0
+        self.written = 0
+        self.failed = 0
+        self.rc = 0
+
+        # at most 2 batches wait for the writer, append() blocks beyond that
+        self.queue = Queue.Queue(2)
+        self.writer = None
+
+
+    # append(recid, dict)
+    # buffer the fields of one record, the record is written later: write errors are
+    # logged by the writer thread and returned by flush()
+    def append(self, recid, d):
+        if len(self.records) == 0:
+            self.first_time = time.time()
+
+        # fields appended twice to the same record before a flush are merged
+        if recid in self.records:
+            self.records[recid].update(d)
+        else:
+            self.records[recid] = d
+
+        if (len(self.records) >= self.batch_size
+                or time.time() - self.first_time >= self.interval):
+            self.put(self.records)
+            self.records = {}
+
+
+    # rc = flush()
+    # write all buffered records to the meta engine and wait for the writer,
+    # rc is the first error since the last flush()
+    def flush(self):
+        if len(self.records) > 0:
+            self.put(self.records)
+            self.records = {}
+        self.queue.join()
+
+        rc = self.rc
+        self.rc = 0
+        return rc
+
+
+    # queue a batch for the writer thread, the thread is started on first use so
+    # worker processes forked before that (cad_pool) do not inherit it
+    def put(self, records):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_batches)
+            self.writer.daemon = True
+            self.writer.start()
+        self.queue.put(records)
+
+
+    # writer thread, one append_to_records call per queued batch
+    def write_batches(self):
+        while True:
+            records = self.queue.get()
+            try:
+                rc = self.write(records)
+            except Exception as e:
+                logging.error("writeback: write failed, " + str(e))
+                self.failed += len(records)
+                rc = 3
+            if rc != 0 and self.rc == 0:
+                self.rc = rc
+            self.queue.task_done()
+
+
+    def write(self, records):
+        (rc, missing) = meta_api.append_to_records(records, self.caddy)
+        if rc == 0:
+            self.written += len(records)
+        elif rc == 2:
+            self.written += len(records) - len(missing)
+            self.failed += len(missing)
+            logging.error("writeback: append failed, recid not found: " + str(missing))
+        else:
+            self.failed += len(records)
+            logging.error("writeback: append_to_records failed, rc=" + str(rc)
+                          + ", records=" + str(len(records)))
+        logging.debug("writeback: flushed " + str(len(records)) + " records, rc=" + str(rc))
+        return rc
@@ -0,0 +1,162 @@
+import struct
+import dicom
+import cad_compress
+from dicom.filereader import read_dataset
+from dicom.dataelem import RawDataElement
+
+
+# Filename : dicom_header.py
+# Purpose  : read the top level data elements of a dicom file for PHI classification
+#            (using pydicom release 0.9.8)
+#
+#            header_only mode stops before PixelData and defers values larger than
+#            defer_size, neither is read from disk. Their value is reported as DEFERRED
+#            when not empty, '' when empty. PixelData is skipped (including encapsulated
+#            fragments) and elements after it are read as usual, so the element list
+#            matches a full dicom.read_file(). Deflated files are inflated whole by
+#            pydicom, they are read in one pass with deferred values.
+#
+#            gzip compressed files are decoded as a stream (cad_compress.open_file).
+#
+# Usage:
+#   for (tag, name, value) in dicom_header.read_elements(dicom_file):
+#       tag   - integer tag (gggg << 16 | eeee), sorted ascending
+#       name  - dicom dictionary name
+#       value - str(value) stripped of leading/trailing spaces
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - gzip compressed dicom files
+# 20261018 - deflated transfer syntax read whole, PixelData was dropped
+#
+#
+# constants
+#
+#
+DEFERRED = '<deferred>'    # non-empty value that was not read
+DEFER_SIZE = 1024          # values larger than this are not read in header_only mode
+
+PIXEL_DATA = 0x7fe00010
+DEFLATED_UID = '1.2.840.10008.1.2.1.99'    # Deflated Explicit VR Little Endian
+SEQUENCE_DELIMITER = (0xfffe, 0xe0dd)
+EXPLICIT_LENGTH_VRS = ('OB', 'OW', 'OF', 'SQ', 'UT', 'UN')    # 4 byte length field
+#
+#
+# functions
+#
+#
+# '(gggg,eeee)' tag string as used by the phi rules
+def tag_string(tag):
+    return "(%04x,%04x)" % (tag >> 16, tag & 0xffff)
+
+
+def element_name(tag):
+    try:
+        return dicom.datadict.dictionary_description(tag)
+    except KeyError:
+        return 'Unknown'
+
+
+# add (name, value) of every element in dataset to elements, deferred values are not read
+def collect(dataset, elements):
+    for tag in dataset.keys():
+        raw = dict.__getitem__(dataset, tag)
+        if isinstance(raw, RawDataElement) and raw.value is None and raw.length != 0:
+            elements[int(tag)] = (element_name(tag), DEFERRED)
+        else:
+            data_element = dataset[tag]
+            elements[int(tag)] = (data_element.name, str(data_element.value).strip())
+
+
+# value = skip_pixel_data(fp, is_implicit_VR, is_little_endian)
+# skip the PixelData element at the file position, value is DEFERRED or '' (empty),
+# None if there is no PixelData element
+def skip_pixel_data(fp, is_implicit_VR, is_little_endian):
+    endian = '<' if is_little_endian else '>'
+    header = fp.read(8)
+    if len(header) < 8:
+        return None
+    (group, elem) = struct.unpack(endian + 'HH', header[:4])
+    if (group << 16 | elem) != PIXEL_DATA:
+        fp.seek(-8, 1)
+        return None
+
+    if is_implicit_VR:
+        length = struct.unpack(endian + 'L', header[4:])[0]
+    elif header[4:6] in EXPLICIT_LENGTH_VRS:
+        length = struct.unpack(endian + 'L', fp.read(4))[0]
+    else:
+        length = struct.unpack(endian + 'H', header[6:])[0]
+
+    if length != 0xffffffff:
+        fp.seek(length, 1)
+        if length == 0:
+            return ''
+        return DEFERRED
+
+    # encapsulated pixel data, skip items up to the sequence delimiter
+    while True:
+        item = fp.read(8)
+        if len(item) < 8:
+            break
+        (group, elem, length) = struct.unpack(endian + 'HHL', item)
+        if (group, elem) == SEQUENCE_DELIMITER:
+            break
+        fp.seek(length, 1)
+    return DEFERRED
+
+
+# uid = transfer_syntax(dataset), None if the file has no file meta information
+def transfer_syntax(dataset):
+    file_meta = getattr(dataset, 'file_meta', None)
+    if file_meta is None:
+        return None
+    return getattr(file_meta, 'TransferSyntaxUID', None)
+
+
+# list = read_deflated(dicom_file)
+# elements of a deflated file: pydicom inflates the data set into a buffer of its own,
+# the file position does not follow it and PixelData cannot be skipped in the file.
+# The whole inflated data set is read, values larger than DEFER_SIZE are not converted.
+def read_deflated(dicom_file):
+    elements = {}
+    fp = cad_compress.open_file(dicom_file)
+    try:
+        dataset = dicom.read_file(fp, defer_size=DEFER_SIZE)
+        collect(dataset, elements)
+    finally:
+        fp.close()
+    return [(tag,) + elements[tag] for tag in sorted(elements)]
+
+
+# list = read_elements(dicom_file, header_only=True)
+# [(tag, name, value), ...] of the top level data elements, raises on read errors
+def read_elements(dicom_file, header_only=True):
+    fp = cad_compress.open_file(dicom_file)
+    if not header_only:
+        try:
+            dataset = dicom.read_file(fp)
+        finally:
+            fp.close()
+        return [(int(data_element.tag), data_element.name, str(data_element.value).strip())
+                for data_element in dataset]
+
+    elements = {}
+    try:
+        dataset = dicom.read_file(fp, defer_size=DEFER_SIZE, stop_before_pixels=True)
+        if transfer_syntax(dataset) == DEFLATED_UID:
+            fp.close()
+            return read_deflated(dicom_file)
+        collect(dataset, elements)
+
+        # pixel data and the elements following it
+        value = skip_pixel_data(fp, dataset.is_implicit_VR, dataset.is_little_endian)
+        if value is not None:
+            elements[PIXEL_DATA] = (element_name(PIXEL_DATA), value)
+            trailing = read_dataset(fp, dataset.is_implicit_VR, dataset.is_little_endian,
+                                    defer_size=DEFER_SIZE)
+            collect(trailing, elements)
+    finally:
+        fp.close()
+
+    return [(tag,) + elements[tag] for tag in sorted(elements)]
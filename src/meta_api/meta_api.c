@@ -6,10 +6,21 @@
 // 20150625 - rewritten pyAddNewRecord
 // 20150625 - added pyAppendToRecord, pyGetUnprocessedRecord
 // 21050628 - added debugMode to manage printf to stdout
+// 20261018 - added pyAddNewRecords, pipelined bulk insert
+// 20261018 - added pyAppendToRecords, pipelined batch append
+// 20261018 - added pending:<caddy> sets, pyGetPendingRecords, pyAddPendingRecords
+// 20261018 - added pyScanKeys, pyScanSet, pyGetRecordsById for paged record cursors
+// 20261018 - record fields fetched with pipelined HGETALL into sized python strings
+// 20261018 - get_records, get_records_by_id take an optional field list (HMGET)
+// 20261018 - global dbhandle replaced by a bounded connection pool, the GIL is released
+//            around every meta engine call so python threads can overlap db i/o
+// 20261018 - removed pyGetPendingRecords, pending sets are read page by page with
+//            pyScanSet and pyGetRecordsById (meta_cursor.iter_pending)
+// 20261018 - pyAddNewRecords rejects empty dicts, pyAddNewRecord(s) check the connection
 //
 // Compile command:
-// cd /root/pyproj/meta_api    
-// gcc -fPIC -shared -I/usr/local/include/python2.7 -lpython2.7 \ 
+// cd /root/pyproj/meta_api
+// gcc -fPIC -shared -I/usr/local/include/python2.7 -lpython2.7 -lpthread \
 // -ometa_api.so meta_api.c libmetaengine.a ../hiredis/libhiredis.a
 
 
@@ -18,95 +29,433 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <pthread.h>
 #include "/root/pyproj/hiredis/hiredis.h"
 #include "metaengine.h"
 
 
+// connection pool
+// Every python call takes a connection from the pool for the duration of the call, so
+// concurrent python threads never share a redisContext. Connections are opened on demand
+// up to poolSize, callers wait (without the GIL) while all of them are in use.
+// A connection that saw a meta engine error is closed instead of returned to the pool.
+#define ME_POOL_MAX 64
+
+typedef struct meHandle {
+    redisContext *c;
+    int generation;    // handles of an older generation are closed on release
+} meHandle;
+
+static meHandle *poolIdle[ME_POOL_MAX];
+static int poolIdleCount = 0;
+static int poolOpen = 0;
+static int poolSize = 0;
+static int poolGeneration = 0;
+static char poolHost[256];
+static pthread_mutex_t poolLock = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t poolCond = PTHREAD_COND_INITIALIZER;
+
 // global variables
-redisContext *dbhandle;
-int *debugMode;    // 1=true, 0=false
+int debugMode = 0;    // 1=true, 0=false
+
+
+
+// meHandle *h = acquireHandle()
+// take an idle connection, open a new one or wait for one, call without the GIL
+
+
+
+static meHandle *acquireHandle(void) {
+
+    meHandle *h;
+    char host[256];
+
+    pthread_mutex_lock(&poolLock);
+    while (poolIdleCount == 0 && poolOpen >= poolSize) {
+        pthread_cond_wait(&poolCond, &poolLock);
+    }
+    if (poolIdleCount > 0) {
+        h = poolIdle[--poolIdleCount];
+        pthread_mutex_unlock(&poolLock);
+        return h;
+    }
+    poolOpen++;
+    h = malloc(sizeof(meHandle));
+    h->generation = poolGeneration;
+    strcpy(host, poolHost);
+    pthread_mutex_unlock(&poolLock);
+
+    h->c = MEconnectRedis(host, 6379);
+    if (debugMode) {
+        printf("acquireHandle: new connection to %s\n", host);
+    }
+    return h;
+}
+
+
+
+// releaseHandle( h, rc )
+// return a connection to the pool, rc=3 (meta engine error) closes the connection
+
+
+
+static void releaseHandle(meHandle *h, int rc) {
+
+    pthread_mutex_lock(&poolLock);
+    if (rc == 3 || h->c == NULL || h->c->err || h->generation != poolGeneration) {
+        if (h->generation == poolGeneration) {
+            poolOpen--;
+        }
+        if (h->c) redisFree(h->c);
+        free(h);
+    }
+    else {
+        poolIdle[poolIdleCount++] = h;
+    }
+    pthread_cond_signal(&poolCond);
+    pthread_mutex_unlock(&poolLock);
+}
+
+
+
+// poolAtForkChild()
+// a forked child (multiprocessing) must not share the parent's sockets,
+// it starts with an empty pool for the same host
+
+
+
+static void poolAtForkChild(void) {
+
+    int i;
+    pthread_mutex_init(&poolLock, NULL);
+    pthread_cond_init(&poolCond, NULL);
+    for ( i=0; i<poolIdleCount; ++i ) {
+        redisFree(poolIdle[i]->c);
+        free(poolIdle[i]);
+    }
+    poolIdleCount = 0;
+    poolOpen = 0;
+    poolGeneration++;
+}
+
+
+
+// int n = dictToArrays( py_dict, &keys, &vals )
+// copy the C string pointers of a dict of strings into malloc'd arrays (free both arrays),
+// the strings stay owned by the dict, call with the GIL held
+// n: number of kv-pairs, -1=key or value is not a string
 
 
-// python def : rc = init_redis_handle( hostname, debug_mode )
-// rc: 0=success, 1=input format error
+
+static int dictToArrays(PyObject *py_dict, char ***keys, char ***vals) {
+
+    PyObject* py_key;
+    PyObject* py_val;
+    Py_ssize_t pos = 0;
+    int n = 0;
+
+    *keys = malloc((PyDict_Size(py_dict)+1) * sizeof(char *));
+    *vals = malloc((PyDict_Size(py_dict)+1) * sizeof(char *));
+    while (PyDict_Next(py_dict, &pos, &py_key, &py_val)) {
+        if (!PyString_Check(py_key) || !PyString_Check(py_val)) {
+            free(*keys);
+            free(*vals);
+            return -1;
+        }
+        (*keys)[n] = PyString_AsString(py_key);
+        (*vals)[n] = PyString_AsString(py_val);
+        n++;
+    }
+    return n;
+}
+
+
+
+// int rc = drainReplies( c, count )
+// read and discard count pipelined replies, call without the GIL
+// rc: 0=success, 3=meta engine error
+
+
+
+static int drainReplies(redisContext *c, int count) {
+
+    int i, rc = 0;
+    redisReply *reply;
+
+    for ( i=0; i<count; ++i ) {
+        if (redisGetReply(c, (void **)&reply) != REDIS_OK) {
+            return 3;    // connection error, remaining replies are lost
+        }
+        if (reply->type == REDIS_REPLY_ERROR) {
+            rc = 3;
+        }
+        freeReplyObject(reply);
+    }
+    return rc;
+}
+
+
+
+// python def : rc = init_redis_handle( hostname, debug_mode [, pool_size] )
+// set up the connection pool (default 4 connections), calling it again with the same
+// hostname keeps the open connections
+// rc: 0=success, 1=input format error, 3=meta engine error
 
 
 static PyObject * pyInitRedisHandle(PyObject *self, PyObject *args) {
 
     char *hostname;
-    int* debug;
+    int debug;
+    int size = 4;
 
-    if (!PyArg_ParseTuple(args, "si", &hostname, &debug)) {
+    if (!PyArg_ParseTuple(args, "si|i", &hostname, &debug, &size)) {
         return Py_BuildValue("i", 1);   /* ERROR - PyArg_ParseTuple */
     }
-    dbhandle = MEconnectRedis((char*)hostname, 6379);
+    if (strlen(hostname) >= sizeof(poolHost)) {
+        return Py_BuildValue("i", 1);   /* ERROR - hostname too long */
+    }
+    if (size < 1) size = 1;
+    if (size > ME_POOL_MAX) size = ME_POOL_MAX;
+
+    // a new hostname retires every open connection
+    int i;
+    pthread_mutex_lock(&poolLock);
+    if (poolSize == 0 || strcmp(poolHost, hostname) != 0) {
+        for ( i=0; i<poolIdleCount; ++i ) {
+            redisFree(poolIdle[i]->c);
+            free(poolIdle[i]);
+        }
+        poolIdleCount = 0;
+        poolOpen = 0;
+        poolGeneration++;
+        strcpy(poolHost, hostname);
+    }
+    poolSize = size;
     debugMode = debug;
+    pthread_cond_broadcast(&poolCond);
+    pthread_mutex_unlock(&poolLock);
     if (debugMode) {
-        printf("pyInitRedisHandle: debugMode=%i\n", debugMode);
+        printf("pyInitRedisHandle: debugMode=%i, pool_size=%i\n", debugMode, poolSize);
     }
 
-    return Py_BuildValue("i", 0);       /* SUCCESS */
+    // open the first connection now, like the single handle did
+    int rc = 0;
+    meHandle *h;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    if (h->c == NULL || h->c->err) {
+        rc = 3;
+    }
+    releaseHandle(h, rc);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("i", rc);
 }
 
 
 
 // python def : rc = add_new_record( dict )
 // loop through input dict object and add each kv-pair to the meta engine as one record
-// rc: 0=success, 1=input format error, 2=input format error - dict iterator
+// rc: 0=success, 1=input format error, 2=input format error - dict iterator,
+//     3=no meta engine connection
 
 
 
 static PyObject * pyAddNewRecord(PyObject *self, PyObject *args) {
 
     PyObject* py_dict;
-    PyObject* py_iter;
-    PyObject* py_key;
-    PyObject* py_val;
+    char **keys, **vals;
 
     // retrieve dictionary object
     if (!PyArg_ParseTuple(args, "O!", &PyDict_Type, &py_dict)) {
         return Py_BuildValue("i", 1);   // ERROR - PyArg_ParseTuple
     }
 
-    // retrieve iterator
-    py_iter = PyObject_GetIter(py_dict);
-    if (!py_iter) { 
-        return Py_BuildValue("i", 2);   // ERROR - Not an iterator
+    // retrieve key-value pairs
+    int kvcount = dictToArrays(py_dict, &keys, &vals);
+    if (kvcount < 0) {
+        return Py_BuildValue("i", 2);   // ERROR - key or value is not a string
     }
 
-    // loop through key-value pairs
-    int recid;
-    int kvcount = 0;
-    while (py_key = PyIter_Next(py_iter)) {
-        py_val = PyDict_GetItem(py_dict, py_key);
+    // loop through key-value pairs, add kv pair into meta engine
+    int i, recid = 0, rc = 0;
+    meHandle *h;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    if (h->c == NULL || h->c->err) {
+        rc = 3;    // ERROR - no meta engine connection
+    }
+    for ( i=0; rc == 0 && i<kvcount; ++i ) {
+        if (debugMode) {
+            printf("pyAddNewRecord: %s - %s\n", keys[i], vals[i]);
+        }
+        if (i == 0) {
+            recid = MEaddNewKeyValue(h->c, keys[i], vals[i]);
+        }
+        else {
+            MEaddKeyValue(h->c, recid, keys[i], vals[i]);
+        }
+    }
+    releaseHandle(h, rc);
+    Py_END_ALLOW_THREADS
+    free(keys);
+    free(vals);
 
-    char * key = PyString_AsString(py_key);
-    char * val = PyString_AsString(py_val);
     if (debugMode) {
-        printf("pyAddNewRecord: %s - %s\n", key, val);
+        printf("pyAddNewRecord: total kv count: %i\n", kvcount);
     }
+    return Py_BuildValue("i", rc);   // 0 = SUCCESS
+}
+
+
+
+// python def : (rc, list) = add_new_records( list_of_dicts [, list_of_caddies] )
+// add every dict in the input list as one new record, all kv-pairs of the batch are sent
+// to the meta engine as a single pipeline (same redis layout as MEaddNewKeyValue/MEaddKeyValue)
+// list_of_caddies: caddy name per record ('' = none), the record is added to the
+//     pending set of that caddy (pending:<caddy>)
+// rc: 0=success, 1=input format error, 2=input format error - list item is not a dict
+//     or an empty dict (no record would be written under its id), 3=meta engine error
+// list: [recid, ...] in the same order as the input list
+
+
 
-    // add kv pair into meta engine
-    kvcount++;
-    if (kvcount == 1) {
-        recid = MEaddNewKeyValue(dbhandle, key, val);
+static PyObject * pyAddNewRecords(PyObject *self, PyObject *args) {
+
+    PyObject* py_list;
+    PyObject* py_pending = NULL;
+    PyObject* py_dict;
+    PyObject* py_ids;
+    PyObject* py_key;
+
+    // retrieve list object and optional caddy list
+    if (!PyArg_ParseTuple(args, "O!|O!", &PyList_Type, &py_list, &PyList_Type, &py_pending)) {
+        return Py_BuildValue("(i[])", 1);   // ERROR - PyArg_ParseTuple
     }
-    else {
-        MEaddKeyValue(dbhandle, recid, key, val);
+
+    // validate input before anything is sent to the meta engine
+    int i, j;
+    int recCount = PyList_Size(py_list);
+    int fldCount = 0;
+    if (py_pending && PyList_Size(py_pending) != recCount) {
+        return Py_BuildValue("(i[])", 1);   // ERROR - caddy list does not match record list
     }
-    Py_DECREF(py_key);
-}
-Py_DECREF(py_iter);
-if (debugMode) {
-    printf("pyAddNewRecord: total kv count: %i\n", kvcount);
+    for ( i=0; i<recCount; ++i ) {
+        if (py_pending && !PyString_Check(PyList_GetItem(py_pending, i))) {
+            return Py_BuildValue("(i[])", 1);   // ERROR - caddy name is not a string
+        }
+        py_dict = PyList_GetItem(py_list, i);
+        if (!PyDict_Check(py_dict) || PyDict_Size(py_dict) == 0) {
+            return Py_BuildValue("(i[])", 2);   // ERROR - list item is not a dict or is empty
+        }
+        fldCount += PyDict_Size(py_dict);
+    }
+    if (recCount == 0) {
+        return Py_BuildValue("(i[])", 0);
+    }
+
+    // copy the kv-pairs of every record, record i owns kv-pairs kvStart[i] .. kvStart[i+1]-1
+    int n, rc = 0;
+    char **keys, **vals;
+    char **allKeys = malloc((fldCount+1) * sizeof(char *));
+    char **allVals = malloc((fldCount+1) * sizeof(char *));
+    char **caddies = calloc(recCount, sizeof(char *));
+    int *kvStart = malloc((recCount+1) * sizeof(int));
+    kvStart[0] = 0;
+    for ( i=0; i<recCount; ++i ) {
+        n = dictToArrays(PyList_GetItem(py_list, i), &keys, &vals);
+        if (n < 0) {
+            rc = 1;    // ERROR - key or value is not a string
+            break;
+        }
+        for ( j=0; j<n; ++j ) {
+            allKeys[kvStart[i]+j] = keys[j];
+            allVals[kvStart[i]+j] = vals[j];
+        }
+        kvStart[i+1] = kvStart[i] + n;
+        free(keys);
+        free(vals);
+        if (py_pending) {
+            caddies[i] = PyString_AsString(PyList_GetItem(py_pending, i));
+        }
+    }
+
+    long lastId = 0;
+    long recid;
+    int cmdCount = 0;
+    meHandle *h;
+    redisReply *reply;
+    if (rc == 0) {
+        Py_BEGIN_ALLOW_THREADS
+        h = acquireHandle();
+
+        // reserve a block of record ids with one round trip (MEaddNewKeyValue uses INCR next_id)
+        reply = NULL;
+        if (h->c != NULL && !h->c->err) {
+            reply = redisCommand(h->c, "INCRBY next_id %d", recCount);
+        }
+        if (reply == NULL || reply->type != REDIS_REPLY_INTEGER) {
+            rc = 3;    // ERROR - meta engine
+        }
+        else {
+            lastId = (long)reply->integer;
+        }
+        if (reply) freeReplyObject(reply);
+
+        // queue all kv-pairs of the batch
+        for ( i=0; rc == 0 && i<recCount; ++i ) {
+            recid = lastId - recCount + 1 + i;
+            for ( j=kvStart[i]; j<kvStart[i+1]; ++j ) {
+                if (debugMode) {
+                    printf("pyAddNewRecords: %li: %s - %s\n", recid, allKeys[j], allVals[j]);
+                }
+                redisAppendCommand(h->c, "HSET id:%d %s %s", (int)recid, allKeys[j], allVals[j]);
+                redisAppendCommand(h->c, "SADD %s:%s %d", allKeys[j], allVals[j], (int)recid);
+                redisAppendCommand(h->c, "SADD %s %s", allKeys[j], allVals[j]);
+                redisAppendCommand(h->c, "SADD allkeys %s", allKeys[j]);
+                cmdCount += 4;
+            }
+            if (caddies[i] && strlen(caddies[i]) > 0) {
+                redisAppendCommand(h->c, "SADD pending:%s %d", caddies[i], (int)recid);
+                cmdCount++;
+            }
+        }
+
+        // drain the pipeline, 4 replies per kv-pair and 1 per pending set entry
+        if (rc == 0) {
+            rc = drainReplies(h->c, cmdCount);
+        }
+        releaseHandle(h, rc);
+        Py_END_ALLOW_THREADS
+    }
+    free(allKeys);
+    free(allVals);
+    free(caddies);
+    free(kvStart);
+
+    if (debugMode) {
+        printf("pyAddNewRecords: records: %i, total kv count: %i\n", recCount, fldCount);
+    }
+    if (rc != 0) {
+        return Py_BuildValue("(i[])", rc);  // ERROR - input format or meta engine
+    }
+
+    py_ids = PyList_New(0);
+    for ( i=0; i<recCount; ++i ) {
+        py_key = PyInt_FromLong(lastId - recCount + 1 + i);
+        PyList_Append(py_ids, py_key);
+        Py_DECREF(py_key);
+    }
+
+    // return 2 parameters: rc, list
+    return Py_BuildValue("iN", 0, py_ids);
 }
-return Py_BuildValue("i", 0);   // SUCCESS
-} 
 
 
 
-// python def : rc = append_to_record( recid, dict )
+// python def : rc = append_to_record( recid, dict [, caddy] )
 // Append new fields into an existing record. New fields are stored in the dict object as KV pairs
+// If caddy is given the record is removed from the caddy pending set.
 // rc: 0=success, 1=input format error, 2=recid not found, 3=input format error - dict iterator
 
 
@@ -114,54 +463,257 @@ return Py_BuildValue("i", 0);   // SUCCESS
 static PyObject * pyAppendToRecord(PyObject *self, PyObject *args) {
 
     PyObject* py_dict;
-    PyObject* py_iter;
-    PyObject* py_key;
-    PyObject* py_val;
+    char **keys, **vals;
 
     int recid, rc;
-    char *allData;
-    unsigned size;
+    redisReply *reply;
+    char *caddy = "";
 
 
-    // retrieve record id and dictionary object
-    if (!PyArg_ParseTuple(args, "iO!", &recid, &PyDict_Type, &py_dict)) {
+    // retrieve record id, dictionary object and optional caddy name
+    if (!PyArg_ParseTuple(args, "iO!|s", &recid, &PyDict_Type, &py_dict, &caddy)) {
         return Py_BuildValue("i", 1);   // ERROR - PyArg_ParseTuple
     }
 
+    // retrieve key-value pairs
+    int kvcount = dictToArrays(py_dict, &keys, &vals);
+    if (kvcount < 0) {
+        return Py_BuildValue("i", 3);   // ERROR - key or value is not a string
+    }
+
+    int i;
+    meHandle *h;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+
     // abort if record id does not exist
-    rc = MEgetAllFieldsById(dbhandle, recid, &allData, &size);
-    if (size == 0) {
-        return Py_BuildValue("i", 2);   // ERROR - record ID not found   
+    reply = redisCommand(h->c, "EXISTS id:%d", recid);
+    rc = (reply != NULL && reply->type == REDIS_REPLY_INTEGER && reply->integer == 1) ? 0 : 2;
+    if (reply) freeReplyObject(reply);
+
+    // loop through key-value pairs and append to record
+    for ( i=0; rc == 0 && i<kvcount; ++i ) {
+        if (debugMode) {
+            printf("pyAppendToRecord: %s - %s\n", keys[i], vals[i]);
+        }
+        MEaddKeyValue(h->c, recid, keys[i], vals[i]);
+    }
+    if (rc == 0 && strlen(caddy) > 0) {
+        reply = redisCommand(h->c, "SREM pending:%s %d", caddy, recid);
+        if (reply) freeReplyObject(reply);
     }
+    releaseHandle(h, 0);
+    Py_END_ALLOW_THREADS
+    free(keys);
+    free(vals);
 
-    // retrieve iterator
-    py_iter = PyObject_GetIter(py_dict);
-    if (!py_iter) { 
-        return Py_BuildValue("i", 3);   // ERROR - Not an iterator
+    if (rc != 0) {
+        return Py_BuildValue("i", 2);   // ERROR - record ID not found
+    }
+    if (debugMode) {
+        printf("pyAppendToRecord: total kv count: %i\n", kvcount);
     }
+    return Py_BuildValue("i", 0);   // SUCCESS
+}
 
-    // loop through key-value pairs and append to record
-    int kvcount = 0;
-    while (py_key = PyIter_Next(py_iter)) {
-        py_val = PyDict_GetItem(py_dict, py_key);
 
-    char * key = PyString_AsString(py_key);
-    char * val = PyString_AsString(py_val);
+
+// python def : (rc, list) = append_to_records( dict_of_dicts [, caddy] )
+// Append new fields into existing records, input is {recid: {key: value, ...}, ...}.
+// Record existence and the current field values are read in one pipeline, all writes of
+// the batch are sent in a second pipeline (index clean-up matches MEaddKeyValue).
+// If caddy is given the records are removed from the caddy pending set.
+// rc: 0=success, 1=input format error, 2=one or more recid not found (other records are
+//     written), 3=meta engine error
+// list: [recid, ...] not found in the meta engine
+
+
+
+static PyObject * pyAppendToRecords(PyObject *self, PyObject *args) {
+
+    PyObject* py_rdict;
+    PyObject* py_dict;
+    PyObject* py_recid;
+    PyObject* py_missing;
+    Py_ssize_t rpos;
+    char *caddy = "";
+
+    // retrieve dictionary object and optional caddy name
+    if (!PyArg_ParseTuple(args, "O!|s", &PyDict_Type, &py_rdict, &caddy)) {
+        return Py_BuildValue("(i[])", 1);   // ERROR - PyArg_ParseTuple
+    }
+
+    // validate input and count fields
+    int recCount = 0;
+    int fldCount = 0;
+    rpos = 0;
+    while (PyDict_Next(py_rdict, &rpos, &py_recid, &py_dict)) {
+        if (!(PyInt_Check(py_recid) || PyLong_Check(py_recid)) || !PyDict_Check(py_dict)) {
+            return Py_BuildValue("(i[])", 1);   // ERROR - input format
+        }
+        fldCount += PyDict_Size(py_dict);
+        recCount++;
+    }
+    if (recCount == 0) {
+        return Py_BuildValue("(i[])", 0);
+    }
+
+    // copy record ids and kv-pairs, record r owns kv-pairs kvStart[r] .. kvStart[r+1]-1
+    int i, j, f, r, n, rc = 0;
+    char **keys, **vals;
+    long *recids = malloc(recCount * sizeof(long));
+    int *kvStart = malloc((recCount+1) * sizeof(int));
+    char **allKeys = malloc((fldCount+1) * sizeof(char *));
+    char **allVals = malloc((fldCount+1) * sizeof(char *));
+    int *exists = calloc(recCount, sizeof(int));
+    int *cleanup = calloc(fldCount+1, sizeof(int));
+    redisReply **oldval = calloc(fldCount+1, sizeof(redisReply *));
+    redisReply *reply;
+
+    r = 0;
+    rpos = 0;
+    kvStart[0] = 0;
+    while (PyDict_Next(py_rdict, &rpos, &py_recid, &py_dict)) {
+        n = dictToArrays(py_dict, &keys, &vals);
+        if (n < 0) {
+            rc = 1;    // ERROR - key or value is not a string
+            break;
+        }
+        for ( j=0; j<n; ++j ) {
+            allKeys[kvStart[r]+j] = keys[j];
+            allVals[kvStart[r]+j] = vals[j];
+        }
+        free(keys);
+        free(vals);
+        recids[r] = PyInt_AsLong(py_recid);
+        kvStart[r+1] = kvStart[r] + n;
+        r++;
+    }
+
+    int emptyCount = 0;
+    meHandle *h;
+    if (rc == 0) {
+        Py_BEGIN_ALLOW_THREADS
+        h = acquireHandle();
+
+        // pipeline 1: record existence and current value of every field to be written
+        for ( r=0; r<recCount; ++r ) {
+            redisAppendCommand(h->c, "EXISTS id:%d", (int)recids[r]);
+            for ( f=kvStart[r]; f<kvStart[r+1]; ++f ) {
+                redisAppendCommand(h->c, "HGET id:%d %s", (int)recids[r], allKeys[f]);
+            }
+        }
+        for ( r=0; rc == 0 && r<recCount; ++r ) {
+            if (redisGetReply(h->c, (void **)&reply) != REDIS_OK) {
+                rc = 3;
+                break;
+            }
+            exists[r] = (reply->type == REDIS_REPLY_INTEGER && reply->integer == 1);
+            freeReplyObject(reply);
+            for ( f=kvStart[r]; f<kvStart[r+1]; ++f ) {
+                if (redisGetReply(h->c, (void **)&oldval[f]) != REDIS_OK) {
+                    rc = 3;
+                    break;
+                }
+            }
+        }
+
+        // pipeline 2: drop stale index entries and write the new kv-pairs of existing records,
+        // records with a new status are taken off the caddy pending set
+        for ( r=0; rc == 0 && r<recCount; ++r ) {
+            if (!exists[r]) {
+                continue;
+            }
+            for ( f=kvStart[r]; f<kvStart[r+1]; ++f ) {
+                if (debugMode) {
+                    printf("pyAppendToRecords: %li: %s - %s\n", recids[r], allKeys[f], allVals[f]);
+                }
+                if (oldval[f]->type == REDIS_REPLY_STRING && strcmp(oldval[f]->str, allVals[f]) != 0) {
+                    cleanup[f] = 1;
+                    redisAppendCommand(h->c, "SREM %s:%s %d", allKeys[f], oldval[f]->str, (int)recids[r]);
+                    redisAppendCommand(h->c, "SCARD %s:%s", allKeys[f], oldval[f]->str);
+                }
+                redisAppendCommand(h->c, "HSET id:%d %s %s", (int)recids[r], allKeys[f], allVals[f]);
+                redisAppendCommand(h->c, "SADD %s:%s %d", allKeys[f], allVals[f], (int)recids[r]);
+                redisAppendCommand(h->c, "SADD %s %s", allKeys[f], allVals[f]);
+                redisAppendCommand(h->c, "SADD allkeys %s", allKeys[f]);
+            }
+            if (strlen(caddy) > 0) {
+                redisAppendCommand(h->c, "SREM pending:%s %d", caddy, (int)recids[r]);
+            }
+        }
+
+        // drain pipeline 2 in queue order, value sets left without records are removed
+        // like MEaddKeyValue does
+        for ( r=0; rc == 0 && r<recCount; ++r ) {
+            if (!exists[r]) {
+                continue;
+            }
+            for ( f=kvStart[r]; rc == 0 && f<kvStart[r+1]; ++f ) {
+                n = cleanup[f] ? 6 : 4;
+                for ( i=0; i<n; ++i ) {
+                    if (redisGetReply(h->c, (void **)&reply) != REDIS_OK) {
+                        rc = 3;
+                        break;
+                    }
+                    if (reply->type == REDIS_REPLY_ERROR) {
+                        rc = 3;
+                    }
+                    else if (cleanup[f] && i == 1 && reply->type == REDIS_REPLY_INTEGER
+                             && reply->integer == 0) {
+                        redisAppendCommand(h->c, "SREM %s %s", allKeys[f], oldval[f]->str);
+                        emptyCount++;
+                    }
+                    freeReplyObject(reply);
+                }
+            }
+            if (rc == 0 && strlen(caddy) > 0) {
+                rc = drainReplies(h->c, 1);
+            }
+        }
+        if (rc == 0) {
+            rc = drainReplies(h->c, emptyCount);
+        }
+        releaseHandle(h, rc);
+        Py_END_ALLOW_THREADS
+    }
+
+    // records not found
+    py_missing = PyList_New(0);
+    for ( r=0; rc == 0 && r<recCount; ++r ) {
+        if (!exists[r]) {
+            py_recid = PyInt_FromLong(recids[r]);
+            PyList_Append(py_missing, py_recid);
+            Py_DECREF(py_recid);
+        }
+    }
+
+    for ( f=0; f<fldCount; ++f ) {
+        if (oldval[f]) freeReplyObject(oldval[f]);
+    }
+    free(oldval);
+    free(cleanup);
+    free(exists);
+    free(allKeys);
+    free(allVals);
+    free(kvStart);
+    free(recids);
+
     if (debugMode) {
-        printf("pyAppendToRecord: %s - %s\n", key, val);
+        printf("pyAppendToRecords: records: %i, not found: %i\n",
+               recCount, (int)PyList_Size(py_missing));
+    }
+    if (rc != 0) {
+        Py_DECREF(py_missing);
+        return Py_BuildValue("(i[])", rc);  // ERROR - input format or meta engine
+    }
+    if (PyList_Size(py_missing) > 0) {
+        rc = 2;    // ERROR - record ID not found
     }
 
-    // add kv pair into meta engine
-    kvcount++;
-    MEaddKeyValue(dbhandle, recid, key, val);
-    Py_DECREF(py_key);
-}
-Py_DECREF(py_iter);
-if (debugMode) {
-    printf("pyAppendToRecord: total kv count: %i\n", kvcount);
+    // return 2 parameters: rc, list
+    return Py_BuildValue("iN", rc, py_missing);
 }
-return Py_BuildValue("i", 0);   // SUCCESS
-} 
 
 
 
@@ -181,115 +733,474 @@ static PyObject * pyGetUnprocessedRecord(PyObject *self, PyObject *args) {
     }
 
     // get all recID that matches the searckKey and searchVal
-    int *allId;    
+    // loop through all recIDs, keep recid[searchKey] when exceptKey is not found
+    int rc, i;
+    int *allId = NULL;
     unsigned size = 0;
     unsigned unprocessed_record_count = 0;
-    MEsearchId(dbhandle, searchKey, searchVal, &allId, &size);
+    char *value;
+    char **values = NULL;
+    meHandle *h;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    MEsearchId(h->c, searchKey, searchVal, &allId, &size);
+    if (size > 0) {
+        values = calloc(size, sizeof(char *));
+    }
+    for ( i=0; i<size; ++i ) {
+        value = NULL;
+        rc = MEgetSingleFieldById(h->c, allId[i], exceptKey, &value);
+        if (rc > 0 || value == 0) {
+            unprocessed_record_count += 1;
+            free(value);
+            value = NULL;
+            MEgetSingleFieldById(h->c, allId[i], searchKey, &value);
+            values[i] = value;
+        }
+        else {
+            free(value);
+        }
+    }
+    releaseHandle(h, 0);
+    Py_END_ALLOW_THREADS
+
     if (size == 0) {
         return Py_BuildValue("i", 2);   // ERROR - no record found
     }
 
-    // build output dict object
-    int rc, i;
-    long recid;
-    char *value=NULL;
+    // build output dict object (recid: recid[searchKey])
     PyObject* py_dict;
     PyObject* py_key;
     PyObject* py_val;
     py_dict = PyDict_New();
-
-    // loop through all recIDs
     for ( i=0; i<size; ++i ) {
-        recid = *(allId+i);
-        rc = MEgetSingleFieldById(dbhandle, recid, exceptKey, &value);
-
-        // exceptKey not found, create kv and add to py_dict (recid: recid[searchKey])
-        if (rc > 0 || value == 0) {
-            unprocessed_record_count += 1;
-            rc = MEgetSingleFieldById(dbhandle, recid, searchKey, &value);
-            py_key = PyInt_FromLong(recid);
-            py_val = PyString_FromString(value);
+        if (values[i]) {
+            py_key = PyInt_FromLong(allId[i]);
+            py_val = PyString_FromString(values[i]);
             PyDict_SetItem(py_dict, py_key, py_val);
+            Py_DECREF(py_key);
+            Py_DECREF(py_val);
+            free(values[i]);
         }
-        free(value);
     }
+    free(values);
     free(allId);
-    
+
     if (debugMode) {
         printf("pyGetUnprocessedRecord: total records: %i\n", size);
         printf("pyGetUnprocessedRecord: unprocessed records: %i\n", unprocessed_record_count);
     }
 
     // return 2 parameters: rc, dict
-    return Py_BuildValue("iO", 0, py_dict);
+    return Py_BuildValue("iN", 0, py_dict);
 }
 
 
 
-// python def : (rc, dict) = get_records( search_key, search_value )
+// python def : rc = add_pending_records( caddy, list_of_recids )
+// add existing records to the caddy pending set, used to seed the set for records that
+// were ingested before pending sets existed
+// rc: 0=success, 1=input format error, 3=meta engine error
+
+
+
+static PyObject * pyAddPendingRecords(PyObject *self, PyObject *args) {
+
+    char *caddy;
+    PyObject* py_list;
+    PyObject* py_recid;
+
+    // retrieve caddy name and list object
+    if (!PyArg_ParseTuple(args, "sO!", &caddy, &PyList_Type, &py_list)) {
+        return Py_BuildValue("i", 1);   // ERROR - PyArg_ParseTuple
+    }
+
+    int i, rc = 0;
+    int recCount = PyList_Size(py_list);
+    int *ids = malloc((recCount+1) * sizeof(int));
+    for ( i=0; i<recCount; ++i ) {
+        py_recid = PyList_GetItem(py_list, i);
+        if (!(PyInt_Check(py_recid) || PyLong_Check(py_recid))) {
+            free(ids);
+            return Py_BuildValue("i", 1);   // ERROR - recid is not an integer
+        }
+        ids[i] = (int)PyInt_AsLong(py_recid);
+    }
+
+    meHandle *h;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    for ( i=0; i<recCount; ++i ) {
+        redisAppendCommand(h->c, "SADD pending:%s %d", caddy, ids[i]);
+    }
+    rc = drainReplies(h->c, recCount);
+    releaseHandle(h, rc);
+    Py_END_ALLOW_THREADS
+    free(ids);
+
+    if (debugMode) {
+        printf("pyAddPendingRecords: %s records: %i\n", caddy, recCount);
+    }
+    return Py_BuildValue("i", rc);
+}
+
+
+
+// int rc = fetchRecords( h, ids, count, py_fields, py_rdict )
+// retrieve the fields of the listed records and add (recid: {key: value, ...}) to py_rdict.
+// py_fields NULL: all fields with HGETALL, otherwise only the listed fields with HMGET.
+// Commands are pipelined ME_FETCH_CHUNK records at a time and python strings are built
+// straight from the length-prefixed reply buffers (no fixed ME_STRING_MAX_LENGTH slots).
+// Call with the GIL held, it is released while the replies of a chunk are read.
+// records that do not exist or have none of the listed fields are left out
+// rc: 0=success, 3=meta engine error
+
+
+
+#define ME_FETCH_CHUNK 1000
+
+static int fetchRecords(meHandle *h, const int *ids, int count, PyObject *py_fields,
+                        PyObject *py_rdict) {
+
+    int i, j, k, chunk, rc = 0;
+    redisReply *reply, *fk, *fv;
+    redisReply **replies = calloc(ME_FETCH_CHUNK, sizeof(redisReply *));
+    PyObject* py_adict;
+    PyObject* py_key;
+    PyObject* py_val;
+
+    // HMGET argv: HMGET id:<recid> field ...
+    int argc = 0;
+    const char **argv = NULL;
+    size_t *argvlen = NULL;
+    char idkey[32];
+    if (py_fields) {
+        argc = 2 + PyList_Size(py_fields);
+        argv = malloc(argc * sizeof(char *));
+        argvlen = malloc(argc * sizeof(size_t));
+        argv[0] = "HMGET";
+        argvlen[0] = 5;
+        argv[1] = idkey;
+        for ( j=2; j<argc; ++j ) {
+            argv[j] = PyString_AsString(PyList_GetItem(py_fields, j-2));
+            argvlen[j] = PyString_Size(PyList_GetItem(py_fields, j-2));
+        }
+    }
+
+    for ( i=0; rc == 0 && i<count; i+=chunk ) {
+        chunk = (count-i < ME_FETCH_CHUNK) ? count-i : ME_FETCH_CHUNK;
+        for ( k=0; k<chunk; ++k ) {
+            if (py_fields) {
+                argvlen[1] = sprintf(idkey, "id:%d", ids[i+k]);
+                redisAppendCommandArgv(h->c, argc, argv, argvlen);
+            }
+            else {
+                redisAppendCommand(h->c, "HGETALL id:%d", ids[i+k]);
+            }
+        }
+
+        // wait for the replies of the chunk without the GIL
+        Py_BEGIN_ALLOW_THREADS
+        for ( k=0; k<chunk; ++k ) {
+            if (redisGetReply(h->c, (void **)&replies[k]) != REDIS_OK) {
+                replies[k] = NULL;
+                rc = 3;    // ERROR - connection lost
+                break;
+            }
+        }
+        Py_END_ALLOW_THREADS
+
+        for ( k=0; k<chunk && replies[k]; ++k ) {
+            reply = replies[k];
+            replies[k] = NULL;
+            if (rc != 0 || reply->type != REDIS_REPLY_ARRAY || reply->elements == 0) {
+                freeReplyObject(reply);
+                continue;
+            }
+
+            // HGETALL reply is a flat array: key, value, key, value ...
+            // HMGET reply is an array of values (nil if missing) in py_fields order
+            py_adict = PyDict_New();
+            if (py_fields) {
+                for ( j=0; j<reply->elements; ++j ) {
+                    fv = reply->element[j];
+                    if (fv->type != REDIS_REPLY_STRING) {
+                        continue;
+                    }
+                    py_val = PyString_FromStringAndSize(fv->str, fv->len);
+                    PyDict_SetItem(py_adict, PyList_GetItem(py_fields, j), py_val);
+                    Py_DECREF(py_val);
+                }
+            }
+            else {
+                for ( j=0; j+1<reply->elements; j+=2 ) {
+                    fk = reply->element[j];
+                    fv = reply->element[j+1];
+                    if (debugMode) {
+                        printf("%i: %s %s\n", ids[i+k], fk->str, fv->str);
+                    }
+                    py_key = PyString_FromStringAndSize(fk->str, fk->len);
+                    py_val = PyString_FromStringAndSize(fv->str, fv->len);
+                    PyDict_SetItem(py_adict, py_key, py_val);
+                    Py_DECREF(py_key);
+                    Py_DECREF(py_val);
+                }
+            }
+            if (PyDict_Size(py_adict) > 0) {
+                py_key = PyInt_FromLong(ids[i+k]);
+                PyDict_SetItem(py_rdict, py_key, py_adict);
+                Py_DECREF(py_key);
+            }
+            Py_DECREF(py_adict);
+            freeReplyObject(reply);
+        }
+    }
+    free(replies);
+    free(argv);
+    free(argvlen);
+    return rc;
+}
+
+
+
+// int rc = checkFields( py_fields )
+// validate an optional field list argument: NULL or a non-empty list of strings
+// rc: 0=valid, 1=input format error
+
+
+
+static int checkFields(PyObject *py_fields) {
+
+    int j;
+    if (py_fields == NULL) {
+        return 0;
+    }
+    if (PyList_Size(py_fields) == 0) {
+        return 1;
+    }
+    for ( j=0; j<PyList_Size(py_fields); ++j ) {
+        if (!PyString_Check(PyList_GetItem(py_fields, j))) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+
+
+// python def : (rc, dict) = get_records( search_key, search_value [, fields] )
 // find records matches the search_key and return list of items
-// rc: 0=success, 1=input format error, 2=search_key - no match found
-// dict: (recid: recid[searchKey] ...)
+// fields: optional list of field names, only these fields are retrieved
+// rc: 0=success, 1=input format error, 2=search_key - no match found, 3=meta engine error
+// dict: (recid: {key: value, ...} ...)
 
 
 
 static PyObject * pyGetRecords(PyObject *self, PyObject *args) {
 
-    // retrieve 2 input parameters in char * format
+    // retrieve 2 input parameters in char * format and optional field list
     char *searchKey, *searchVal;
-    if (!PyArg_ParseTuple(args, "ss", &searchKey, &searchVal)) {
+    PyObject* py_fields = NULL;
+    if (!PyArg_ParseTuple(args, "ss|O!", &searchKey, &searchVal, &PyList_Type, &py_fields)) {
         return Py_BuildValue("i", 1);   // ERROR - PyArg_ParseTuple
     }
+    if (checkFields(py_fields) != 0) {
+        return Py_BuildValue("i", 1);   // ERROR - field list
+    }
 
     // get all recID that matches the searckKey and searchVal
-    int *allId;
-    unsigned recCount;
-    MEsearchId(dbhandle, searchKey, searchVal, &allId, &recCount);
+    int *allId = NULL;
+    unsigned recCount = 0;
+    meHandle *h;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    MEsearchId(h->c, searchKey, searchVal, &allId, &recCount);
+    Py_END_ALLOW_THREADS
     if (recCount == 0) {
+        releaseHandle(h, 0);
         return Py_BuildValue("i", 2);   // ERROR - no record found
     }
 
     // build output dict object
-    int rc, i, j;
-    unsigned size;
-    long recid, dict_size;
-    char *allData, *key, *val;
+    int rc;
     PyObject* py_rdict;
-    PyObject* py_adict;
-    PyObject* py_key;
-    PyObject* py_val;
     py_rdict = PyDict_New();
-    py_adict = PyDict_New();
+    rc = fetchRecords(h, allId, recCount, py_fields, py_rdict);
+    releaseHandle(h, rc);
+    free(allId);
+    if (rc != 0) {
+        Py_DECREF(py_rdict);
+        return Py_BuildValue("i", rc);  // ERROR - meta engine
+    }
+
+    if (debugMode) {
+        printf("pyGetRecords: records retrieved: %i\n", recCount);
+    }
+
+    // return 2 parameters: rc, dict
+    return Py_BuildValue("iN", 0, py_rdict);
+}
+
+
+
+// python def : (rc, cursor, list) = scan_keys( pattern, cursor, count )
+// one SCAN step over the meta engine keys matching pattern (e.g. "file_name:*.vcf"),
+// start with cursor "0", the scan is complete when the returned cursor is "0"
+// rc: 0=success, 1=input format error, 3=meta engine error
+// list: [key, ...], a key can be returned more than once during a full scan
+
+
+
+static PyObject * pyScanKeys(PyObject *self, PyObject *args) {
+
+    char *pattern, *cursor;
+    int count;
+    if (!PyArg_ParseTuple(args, "ssi", &pattern, &cursor, &count)) {
+        return Py_BuildValue("(is[])", 1, "0");   // ERROR - PyArg_ParseTuple
+    }
+
+    int rc = 0;
+    meHandle *h;
+    redisReply *reply;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    reply = redisCommand(h->c, "SCAN %s MATCH %s COUNT %d", cursor, pattern, count);
+    if (reply == NULL || reply->type != REDIS_REPLY_ARRAY || reply->elements != 2) {
+        rc = 3;
+    }
+    releaseHandle(h, rc);
+    Py_END_ALLOW_THREADS
+    if (rc != 0) {
+        if (reply) freeReplyObject(reply);
+        return Py_BuildValue("(is[])", 3, "0");   // ERROR - meta engine
+    }
 
-    // loop through all recIDs
+    // reply is [next_cursor, [key, ...]]
+    int i;
+    PyObject* py_list;
+    PyObject* py_val;
+    redisReply *keys = reply->element[1];
+    py_list = PyList_New(0);
+    for ( i=0; i<keys->elements; ++i ) {
+        py_val = PyString_FromStringAndSize(keys->element[i]->str, keys->element[i]->len);
+        PyList_Append(py_list, py_val);
+        Py_DECREF(py_val);
+    }
+    py_val = Py_BuildValue("isN", 0, reply->element[0]->str, py_list);
+    freeReplyObject(reply);
+
+    // return 3 parameters: rc, cursor, list
+    return py_val;
+}
+
+
+
+// python def : (rc, cursor, list) = scan_set( set_name, cursor, count )
+// one SSCAN step over a meta engine index set (e.g. "file_format:vcf" or "pending:vcf"),
+// start with cursor "0", the scan is complete when the returned cursor is "0"
+// rc: 0=success, 1=input format error, 3=meta engine error
+// list: [recid, ...], a recid can be returned more than once during a full scan
+
+
+
+static PyObject * pyScanSet(PyObject *self, PyObject *args) {
+
+    char *setName, *cursor;
+    int count;
+    if (!PyArg_ParseTuple(args, "ssi", &setName, &cursor, &count)) {
+        return Py_BuildValue("(is[])", 1, "0");   // ERROR - PyArg_ParseTuple
+    }
+
+    int rc = 0;
+    meHandle *h;
+    redisReply *reply;
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    reply = redisCommand(h->c, "SSCAN %s %s COUNT %d", setName, cursor, count);
+    if (reply == NULL || reply->type != REDIS_REPLY_ARRAY || reply->elements != 2) {
+        rc = 3;
+    }
+    releaseHandle(h, rc);
+    Py_END_ALLOW_THREADS
+    if (rc != 0) {
+        if (reply) freeReplyObject(reply);
+        return Py_BuildValue("(is[])", 3, "0");   // ERROR - meta engine
+    }
+
+    // reply is [next_cursor, [recid, ...]]
+    int i;
+    PyObject* py_list;
+    PyObject* py_val;
+    redisReply *ids = reply->element[1];
+    py_list = PyList_New(0);
+    for ( i=0; i<ids->elements; ++i ) {
+        py_val = PyInt_FromLong(atol(ids->element[i]->str));
+        PyList_Append(py_list, py_val);
+        Py_DECREF(py_val);
+    }
+    py_val = Py_BuildValue("isN", 0, reply->element[0]->str, py_list);
+    freeReplyObject(reply);
+
+    // return 3 parameters: rc, cursor, list
+    return py_val;
+}
+
+
+
+// python def : (rc, dict) = get_records_by_id( list_of_recids [, fields] )
+// retrieve all fields of the listed records, records that do not exist are left out
+// fields: optional list of field names, only these fields are retrieved
+// rc: 0=success, 1=input format error, 3=meta engine error
+// dict: (recid: {key: value, ...} ...)
+
+
+
+static PyObject * pyGetRecordsById(PyObject *self, PyObject *args) {
+
+    PyObject* py_list;
+    PyObject* py_recid;
+    PyObject* py_fields = NULL;
+    if (!PyArg_ParseTuple(args, "O!|O!", &PyList_Type, &py_list, &PyList_Type, &py_fields)) {
+        return Py_BuildValue("(i{})", 1);   // ERROR - PyArg_ParseTuple
+    }
+    if (checkFields(py_fields) != 0) {
+        return Py_BuildValue("(i{})", 1);   // ERROR - field list
+    }
+
+    int i;
+    int recCount = PyList_Size(py_list);
     for ( i=0; i<recCount; ++i ) {
-        recid = *(allId+i);
-        PyDict_Clear(py_adict);
-
-        // create kv and add to py_dict (recid: recid[searchKey])
-        MEgetAllFieldsById(dbhandle, recid, &allData, &size);
-        for (j=0; j<size; j+=2) {
-            key = allData+j*ME_STRING_MAX_LENGTH;
-            val = allData+(j+1)*ME_STRING_MAX_LENGTH;
-            if (debugMode) {
-                printf( "%i: %s %s\n", recid, key, val);
-            }
-            py_key = PyString_FromString(key);
-            py_val = PyString_FromString(val);
-            PyDict_SetItem(py_adict, py_key, py_val);
+        py_recid = PyList_GetItem(py_list, i);
+        if (!(PyInt_Check(py_recid) || PyLong_Check(py_recid))) {
+            return Py_BuildValue("(i{})", 1);   // ERROR - recid is not an integer
         }
-        py_key = PyInt_FromLong(recid);
-        PyDict_SetItem(py_rdict, py_key, PyDict_Copy(py_adict));
-        free(allData);
     }
-    free(allId);
-    
+
+    // build output dict object
+    int rc;
+    int *ids = malloc((recCount+1) * sizeof(int));
+    meHandle *h;
+    PyObject* py_rdict;
+    for ( i=0; i<recCount; ++i ) {
+        ids[i] = (int)PyInt_AsLong(PyList_GetItem(py_list, i));
+    }
+    py_rdict = PyDict_New();
+    Py_BEGIN_ALLOW_THREADS
+    h = acquireHandle();
+    Py_END_ALLOW_THREADS
+    rc = fetchRecords(h, ids, recCount, py_fields, py_rdict);
+    releaseHandle(h, rc);
+    free(ids);
+    if (rc != 0) {
+        Py_DECREF(py_rdict);
+        return Py_BuildValue("(i{})", rc);  // ERROR - meta engine
+    }
     if (debugMode) {
-        printf("pyGetRecords: records retrieved: %i\n", recCount);
+        printf("pyGetRecordsById: records retrieved: %i\n", (int)PyDict_Size(py_rdict));
     }
 
     // return 2 parameters: rc, dict
-    return Py_BuildValue("iO", 0, py_rdict);
+    return Py_BuildValue("iN", 0, py_rdict);
 }
 
 
@@ -301,9 +1212,15 @@ static PyObject * pyGetRecords(PyObject *self, PyObject *args) {
 static PyMethodDef MetaApiMethods[] = {
     {"init_redis_handle", pyInitRedisHandle, METH_VARARGS},
     {"add_new_record", pyAddNewRecord, METH_VARARGS},
+    {"add_new_records", pyAddNewRecords, METH_VARARGS},
     {"append_to_record", pyAppendToRecord, METH_VARARGS},
+    {"append_to_records", pyAppendToRecords, METH_VARARGS},
     {"get_unprocessed_record", pyGetUnprocessedRecord, METH_VARARGS},
+    {"add_pending_records", pyAddPendingRecords, METH_VARARGS},
     {"get_records", pyGetRecords, METH_VARARGS},
+    {"scan_keys", pyScanKeys, METH_VARARGS},
+    {"scan_set", pyScanSet, METH_VARARGS},
+    {"get_records_by_id", pyGetRecordsById, METH_VARARGS},
     {NULL, NULL}
 };
 
@@ -315,5 +1232,7 @@ static PyMethodDef MetaApiMethods[] = {
 
 void initmeta_api()
 {
+    PyEval_InitThreads();
+    pthread_atfork(NULL, NULL, poolAtForkChild);
     (void) Py_InitModule("meta_api", MetaApiMethods);
 };
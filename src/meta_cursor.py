@@ -0,0 +1,113 @@
+import meta_api
+
+
+# Filename : meta_cursor.py
+# Purpose  : paged iteration over meta engine records using SCAN/SSCAN cursors.
+#            Records are fetched batch records at a time so memory use stays flat
+#            however many records match.
+#
+#            SCAN/SSCAN may return an element more than once while the sets change.
+#            iter_records yields a record id once per page, an id may rarely appear in
+#            two pages while the index sets change (the report keeps the latest entry
+#            per file name). iter_pending yields every id once: the pending set shrinks
+#            while it is scanned (writeback SREMs analyzed ids) and SSCAN repeats ids
+#            after a rehash, a repeated id would be analyzed again as a duplicate file
+#            name and its verdict overwritten. Its set of yielded ids grows with the
+#            pending set, as the analyzer's processed_items does.
+#
+# Usage:
+#   for (recid, record) in meta_cursor.iter_records('file_format', 'vcf', batch=1000):
+#   for (recid, record) in meta_cursor.iter_records('file_format', 'vcf', fields=['file_name']):
+#   for (recid, value) in meta_cursor.iter_pending('vcf', 'file_name', batch=1000):
+#
+# fields limits the record dict to the listed fields (HMGET), records are complete otherwise.
+#
+# Errors returned by meta_api raise IOError, meta_api.init_redis_handle must be called first.
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - field projection
+# 20261018 - no set of every yielded id, duplicates removed within a page only
+# 20261018 - iter_pending yields every id once, the pending set shrinks while scanned
+#
+#
+# functions
+#
+#
+# yield the index set names matching key:pattern, exact patterns are not scanned
+def index_sets(key, pattern, batch):
+    name = key + ':' + pattern
+    if not any(c in pattern for c in '*?['):
+        yield name
+        return
+
+    cursor = '0'
+    while True:
+        (rc, cursor, keys) = meta_api.scan_keys(name, cursor, batch)
+        if rc != 0:
+            raise IOError("meta_cursor: scan_keys failed, rc=" + str(rc))
+        for k in keys:
+            yield k
+        if cursor == '0':
+            break
+
+
+# yield the record ids of one index set
+def iter_ids(set_name, batch):
+    cursor = '0'
+    while True:
+        (rc, cursor, ids) = meta_api.scan_set(set_name, cursor, batch)
+        if rc != 0:
+            raise IOError("meta_cursor: scan_set failed, rc=" + str(rc))
+        for recid in ids:
+            yield recid
+        if cursor == '0':
+            break
+
+
+# yield (recid, dict) for one page of record ids, in page order, once per id
+def fetch_page(ids, fields=None):
+    if len(ids) == 0:
+        return
+    seen = set()
+    ids = [recid for recid in ids if not (recid in seen or seen.add(recid))]
+    if fields:
+        (rc, page) = meta_api.get_records_by_id(ids, list(fields))
+    else:
+        (rc, page) = meta_api.get_records_by_id(ids)
+    if rc != 0:
+        raise IOError("meta_cursor: get_records_by_id failed, rc=" + str(rc))
+    for recid in ids:
+        if recid in page:
+            yield recid, page[recid]
+
+
+# yield (recid, dict) for every record where field key matches pattern
+def iter_records(key, pattern, batch=1000, fields=None):
+    ids = []
+    for set_name in index_sets(key, pattern, batch):
+        for recid in iter_ids(set_name, batch):
+            ids.append(recid)
+            if len(ids) >= batch:
+                for item in fetch_page(ids, fields):
+                    yield item
+                ids = []
+    for item in fetch_page(ids, fields):
+        yield item
+
+
+# yield (recid, record[key]) for every record in the caddy pending set, once per id
+def iter_pending(caddy, key, batch=1000):
+    ids = []
+    seen = set()
+    for recid in iter_ids('pending:' + caddy, batch):
+        if recid in seen:
+            continue
+        seen.add(recid)
+        ids.append(recid)
+        if len(ids) >= batch:
+            for (recid, record) in fetch_page(ids, [key]):
+                yield recid, record[key]
+            ids = []
+    for (recid, record) in fetch_page(ids, [key]):
+        yield recid, record[key]
@@ -0,0 +1,59 @@
+import sys
+import os
+import dicom
+import cad_config
+import cad_analyze_dicom
+import cad_rules_dicom
+
+# Differential test: process_dicom_file with header_only = yes against header_only = no
+# usage: python test_analyze_dicom.py [dicom directory]
+# default directory is pydicom's testfiles (deflated image_dfl.dcm included), every file is
+# classified both ways by the phi_table analyzer (cad_analyze_dicom) and by the pyke rules
+# (cad_rules_dicom), the verdict, phi_rule and undef_rule must be identical
+
+myroot = os.path.join(os.path.dirname(dicom.__file__), 'testfiles')
+if len(sys.argv) > 1:
+	myroot = sys.argv[1]
+
+analyzer = cad_analyze_dicom.dicom_class()
+cad_rules_dicom.load_facts()
+classifiers = (('phi_table', analyzer.process_dicom_file),
+               ('rules', cad_rules_dicom.process_dicom_file))
+
+checked = 0
+mismatch = 0
+names = set()
+
+def classify(process, filepath, header_only):
+	cad_config.dicom['header_only'] = header_only
+	return process(filepath)
+
+# Walk the tree.
+for root, directories, files in os.walk(myroot):
+	for filename in sorted(files):
+		filepath = os.path.join(root, filename)
+		if not (filepath.endswith(".dcm") or filepath.endswith(".gz")):
+			continue
+		for (label, process) in classifiers:
+			full = classify(process, filepath, 'no')
+			if full[0] != 0:
+				print "SKIP: ", label, filepath
+				continue
+			header = classify(process, filepath, 'yes')
+			checked += 1
+			names.add(filename)
+
+			# (rc, status, phi_rule, undef_rule)
+			if full != header:
+				mismatch += 1
+				print "MISMATCH: ", label, filepath
+				print "  header_only=no : ", str(full)
+				print "  header_only=yes: ", str(header)
+
+if len(sys.argv) == 1 and 'image_dfl.dcm' not in names:
+	mismatch += 1
+	print "MISSING: image_dfl.dcm (deflated transfer syntax) not checked"
+
+print "checked: ", checked, " mismatch: ", mismatch
+if mismatch > 0:
+	sys.exit(1)
@@ -0,0 +1,51 @@
+import sys
+import os
+import dicom
+import dicom_header
+
+# Differential test: dicom_header.read_elements() header_only against the full read
+# usage: python test_dicom_header.py [dicom directory]
+# default directory is pydicom's testfiles, every file is read both ways and the tags and
+# empty values must be identical; the deflated image_dfl.dcm must be among the checked files
+
+myroot = os.path.join(os.path.dirname(dicom.__file__), 'testfiles')
+if len(sys.argv) > 1:
+	myroot = sys.argv[1]
+
+checked = 0
+mismatch = 0
+names = set()
+
+# Walk the tree.
+for root, directories, files in os.walk(myroot):
+	for filename in sorted(files):
+		filepath = os.path.join(root, filename)
+		if not (filepath.endswith(".dcm") or filepath.endswith(".gz")):
+			continue
+		try:
+			full = dicom_header.read_elements(filepath, False)
+		except:
+			print "SKIP: ", filepath
+			continue
+		header = dicom_header.read_elements(filepath, True)
+		checked += 1
+		names.add(filename)
+
+		full_tags = [dicom_header.tag_string(tag) for (tag, name, val) in full]
+		header_tags = [dicom_header.tag_string(tag) for (tag, name, val) in header]
+		full_empty = [tag for (tag, name, val) in full if len(val) == 0]
+		header_empty = [tag for (tag, name, val) in header if len(val) == 0]
+		if full_tags != header_tags or full_empty != header_empty:
+			mismatch += 1
+			print "MISMATCH: ", filepath
+			print "  missing : ", str(sorted(set(full_tags) - set(header_tags)))
+			print "  extra   : ", str(sorted(set(header_tags) - set(full_tags)))
+			print "  empty   : ", str(sorted(set(full_empty) ^ set(header_empty)))
+
+if len(sys.argv) == 1 and 'image_dfl.dcm' not in names:
+	mismatch += 1
+	print "MISSING: image_dfl.dcm (deflated transfer syntax) not checked"
+
+print "checked: ", checked, " mismatch: ", mismatch
+if mismatch > 0:
+	sys.exit(1)
@@ -0,0 +1,264 @@
+import sys
+import os
+import re
+import shutil
+import tempfile
+import threading
+import subprocess
+import cad_config
+import cad_gpfs_ingest
+import cad_ingest_server
+
+
+# Filename : test_gpfs_policy.py
+# Purpose  : run gpfs_class.apply_query_policy against stub GPFS commands and check the
+#            single pass scan: one mmapplypolicy for all directories of a file system,
+#            each directory selected with PATH_NAME LIKE, and the incremental second scan
+#            selecting files changed after the watermark of each directory
+#
+# The directories are created in a temporary directory, its file system stands in for
+# the GPFS file system (gpfs_dev is set to its df device). monitor_1 holds a nested
+# fileset and data holds a tree that is not configured, the files the policy selects
+# are worked out from its PATH_NAME LIKE and FILESET_NAME conditions. A directory whose
+# fileset cannot be read is scanned on its own with fileset scope.
+#
+# Every mmapplypolicy call runs one LIST callback (cad_gpfs_exec.py) that forwards its
+# filelist to the test socket, filelists are not ingested into the meta engine. The
+# watermarks move only if the ingest server of this process ingested the filelist: not
+# when another server owns the socket, ingest_socket is empty or the ingest failed.
+
+# Change Log:
+# 20261018 - initial release
+# 20261018 - directory names with LIKE wildcards, rc=1 on failure
+# 20261018 - nested fileset and unconfigured tree not selected, per directory fallback
+# 20261018 - LIST callback per scan, watermarks not moved unless this process ingested it
+
+
+stub_mmgetstate = """#!/bin/sh
+echo " Node number  Node name        GPFS state"
+echo "       1      localhost        active"
+"""
+
+# fileset of a path: the stub reads it from the filesets file, written by the test
+stub_mmlsattr = """#!/bin/sh
+name=`grep -F -x -A1 -- "$2" %(filesets)s | sed -n 2p`
+if [ -z "$name" ]; then echo "mmlsattr: $2: unknown"; exit 1; fi
+echo "file name:            $2"
+echo "storage pool name:    system"
+echo "fileset name:         $name"
+"""
+
+# record the arguments and the policy of every call, run one LIST callback with the
+# OPTS of the EXEC rule, its rc is ignored (the watermark does not rely on it)
+stub_mmapplypolicy = """#!/bin/sh
+echo "ARGS $@" >> %(log)s
+while [ $# -gt 0 ]; do
+    if [ "$1" = "-P" ]; then
+        cat "$2" >> %(log)s
+        opts=`sed -n "s/.* OPTS '\\([^']*\\)'.*/\\1/p" "$2"`
+    fi
+    shift
+done
+echo "1 1 0 fset1 system 10 16 0 0 20000 20000 20000 20000 R -- /a.vcf" > %(test_dir)s/filelist.$$
+%(python)s %(callback)s LIST %(test_dir)s/filelist.$$ "$opts"
+exit 0
+"""
+
+# cad_gpfs_exec.py with the test socket
+callback_script = """import sys
+sys.path.insert(0, %(src)r)
+import cad_config
+cad_config.gpfs['ingest_socket'] = %(socket)r
+cad_config.scheduler['log_file'] = %(log)r
+sys.argv = ['cad_gpfs_exec.py'] + sys.argv[1:]
+execfile(%(src)r + '/cad_gpfs_exec.py')
+"""
+
+test_dir = tempfile.mkdtemp()
+mmfs_bin = test_dir + '/bin'
+log = test_dir + '/mmapplypolicy.log'
+filesets_file = test_dir + '/filesets'
+ingest_socket = test_dir + '/ingest.sock'
+callback = test_dir + '/callback.py'
+stub_args = {'log': log, 'filesets': filesets_file, 'test_dir': test_dir,
+             'python': sys.executable, 'callback': callback}
+os.makedirs(mmfs_bin)
+for (name, script) in (('mmgetstate', stub_mmgetstate), ('mmapplypolicy', stub_mmapplypolicy),
+                       ('mmlsattr', stub_mmlsattr)):
+    with open(mmfs_bin + '/' + name, 'w') as f:
+        f.write(script % stub_args)
+    os.chmod(mmfs_bin + '/' + name, 0755)
+with open(callback, 'w') as f:
+    f.write(callback_script % {'src': os.path.dirname(os.path.abspath(cad_gpfs_ingest.__file__)),
+                               'socket': ingest_socket, 'log': test_dir + '/callback.log'})
+
+dirs = [test_dir + '/data/monitor_1', test_dir + '/data/monitor%2']
+for d in dirs:
+    os.makedirs(d)
+
+# path -> fileset, the nested fileset and the unconfigured tree must not be selected
+files = {
+    dirs[0] + '/a.vcf': 'fset1',
+    dirs[0] + '/sub/b.vcf': 'fset1',
+    dirs[0] + '/nested/c.vcf': 'nested',
+    dirs[1] + '/d.vcf': 'root',
+    test_dir + '/data/other/e.vcf': 'root',
+    test_dir + '/data/monitorX1/f.vcf': 'root',
+    test_dir + '/data/monitor_2/g.vcf': 'root',
+}
+expected = set([dirs[0] + '/a.vcf', dirs[0] + '/sub/b.vcf', dirs[1] + '/d.vcf'])
+with open(filesets_file, 'w') as f:
+    f.write(dirs[0] + '\nfset1\n' + dirs[1] + '\nroot\n')
+
+df = subprocess.check_output("df -P " + test_dir, shell=True).splitlines()[1].split(None, 5)
+(device, mount) = (df[0], df[5])
+cad_config.gpfs['gpfs_dev'] = device
+cad_config.gpfs['mmfs_bin'] = mmfs_bin
+cad_config.gpfs['single_pass'] = 'yes'
+cad_config.gpfs['ingest_socket'] = ingest_socket
+cad_config.gpfs['ingest_threads'] = '1'
+cad_config.gpfs['filelist_workers'] = '1'
+cad_config.gpfs['watermark_file'] = test_dir + '/watermark.json'
+cad_config.gpfs['gwd'] = os.path.relpath(test_dir + '/gwd', mount)
+cad_config.gpfs['lwd'] = os.path.relpath(test_dir + '/lwd', mount)
+cad_config.directories.clear()
+cad_config.directories['directory1'] = dirs[0]
+cad_config.directories['directory2'] = dirs[1]
+
+# filelists ingested by a server: name -> rc, the rc returned is ingest_rc
+ingested = {}
+ingest_rc = [0]
+def ingest_filelist(filelist, workers=None, pool=None):
+    ingested[filelist] = ingest_rc[0]
+    return ingest_rc[0]
+
+gpfs = cad_gpfs_ingest.gpfs_class()
+gpfs.connect = lambda pool_size=1: 0
+gpfs.ingest_filelist = ingest_filelist
+rc = gpfs.apply_query_policy(0)
+
+with open(log) as f:
+    out = f.read()
+os.remove(log)
+calls = [line for line in out.splitlines() if line.startswith('ARGS ')]
+print out
+
+# the second scan selects the files changed since the first
+marks = cad_gpfs_ingest.load_watermarks()
+rc2 = gpfs.apply_query_policy(0)
+with open(log) as f:
+    out2 = f.read()
+os.remove(log)
+print out2
+
+# '_' and '%' of the directory names are escaped, they do not match other directories
+def like(d):
+    return "'" + d.replace('_', '\\_').replace('%', '\\%') + "/%' ESCAPE '\\'"
+
+# the (PATH_NAME LIKE ... AND FILESET_NAME = ...) conditions of the policy as
+# (path regex, fileset), a condition without FILESET_NAME matches any fileset
+def conditions(policy):
+    found = []
+    pattern = (r"PATH_NAME LIKE '((?:[^']|'')*)' ESCAPE '\\'"
+               r"(?: AND \(MODIFICATION_TIME > TIMESTAMP\('[^']*'\)"
+               r" OR CHANGE_TIME > TIMESTAMP\('[^']*'\)\))?"
+               r"(?: AND FILESET_NAME = '((?:[^']|'')*)')?")
+    for (prefix, fileset) in re.findall(pattern, policy):
+        regex = ''
+        i = 0
+        while i < len(prefix):
+            c = prefix[i]
+            if c == '\\':
+                i += 1
+                regex += re.escape(prefix[i])
+            elif c == '%':
+                regex += '.*'
+            elif c == '_':
+                regex += '.'
+            else:
+                regex += re.escape(c)
+            i += 1
+        found.append((regex.replace("''", "'") + '$', fileset or None))
+    return found
+
+def selected(policy):
+    return set([path for (path, fileset) in files.items()
+                for (regex, fs) in conditions(policy)
+                if re.match(regex, path) and fs in (None, fileset)])
+
+errors = []
+for d in dirs:
+    if d not in marks:
+        errors.append("no watermark for " + d)
+    elif ("PATH_NAME LIKE " + like(d) + " AND (MODIFICATION_TIME > TIMESTAMP('" + marks[d] + "')"
+            not in out2):
+        errors.append("second scan does not start at the watermark of " + d)
+if "MODIFICATION_TIME >" in out:
+    errors.append("first scan has a watermark")
+if rc2 != 0:
+    errors.append("second apply_query_policy rc=" + str(rc2))
+if rc != 0:
+    errors.append("apply_query_policy rc=" + str(rc))
+if len(calls) != 1:
+    errors.append("mmapplypolicy calls=" + str(len(calls)) + ", expected 1")
+elif not calls[0].startswith('ARGS ' + test_dir + '/data '):
+    errors.append("scan directory is not the common directory: " + calls[0])
+for d in dirs:
+    if "PATH_NAME LIKE " + like(d) not in out:
+        errors.append("no PATH_NAME rule for " + d)
+if "--scope filesystem" not in out:
+    errors.append("single pass scan is not filesystem scope")
+for (policy, label) in ((out, "first"), (out2, "second")):
+    if selected(policy) != expected:
+        errors.append(label + " scan selects " + str(sorted(selected(policy)))
+                      + ", expected " + str(sorted(expected)))
+
+# a directory whose fileset cannot be read is scanned alone in its fileset
+with open(filesets_file, 'w') as f:
+    f.write(dirs[0] + '\nfset1\n')
+os.remove(cad_config.gpfs['watermark_file'])
+rc3 = gpfs.apply_query_policy(0)
+with open(log) as f:
+    out3 = f.read()
+calls3 = [line for line in out3.splitlines() if line.startswith('ARGS ')]
+if rc3 != 0:
+    errors.append("fallback apply_query_policy rc=" + str(rc3))
+if len(calls3) != 2 or [c for c in calls3 if not c.endswith('--scope fileset')]:
+    errors.append("fallback calls are not one fileset scope scan per directory: " + str(calls3))
+if selected(out3) != expected:
+    errors.append("fallback scans select " + str(sorted(selected(out3))))
+if len(ingested) != 4 or [l for l in ingested if not l.startswith(test_dir + '/filelist.')]:
+    errors.append("filelists ingested by this process: " + str(sorted(ingested)))
+
+# the callbacks are not seen by this process: another server owns the socket, or no
+# ingest_socket, or the ingest fails
+other = cad_ingest_server.ingest_server(ingest_socket, gpfs, 1)
+thread = threading.Thread(target=other.serve_forever)
+thread.daemon = True
+thread.start()
+for (label, socket_path, fail) in (("another server", ingest_socket, 0),
+                                   ("no ingest_socket", '', 0),
+                                   ("failed ingest", ingest_socket, 1)):
+    if fail:
+        other.shutdown()
+        other.server_close()
+        os.remove(ingest_socket)
+    cad_config.gpfs['ingest_socket'] = socket_path
+    ingest_rc[0] = fail
+    os.remove(cad_config.gpfs['watermark_file'])
+    cad_gpfs_ingest.save_watermarks({})
+    count = len(ingested)
+    rc4 = gpfs.apply_query_policy(0)
+    os.remove(log)
+    if rc4 == 0:
+        errors.append(label + ": apply_query_policy rc=0")
+    if cad_gpfs_ingest.load_watermarks() != {}:
+        errors.append(label + ": watermarks moved")
+    if len(ingested) != count + 2:
+        errors.append(label + ": filelists ingested=" + str(len(ingested) - count))
+
+shutil.rmtree(test_dir)
+for e in errors:
+    print "FAILED: " + e
+if len(errors) > 0:
+    sys.exit(1)
@@ -0,0 +1,52 @@
+import sys
+import os
+import dicom_header
+import cad_pyke_dicom
+import cad_rules_dicom
+
+# Differential test: cad_rules_dicom.classify() against the pyke engine (cad_pyke_dicom)
+# usage: python test_rules_dicom.py [dicom directory]
+# every rule tag is checked with an empty and a non-empty value, then every .dcm file
+# below the directory, the 4 conclusion lists must be identical
+
+myroot = "/gpfs-fs1/tmp/monitor2"
+if len(sys.argv) > 1:
+	myroot = sys.argv[1]
+
+checked = 0
+mismatch = 0
+
+def compare(label, attributes):
+	global checked, mismatch
+	checked += 1
+	expected = cad_pyke_dicom.classify(attributes)
+	actual = cad_rules_dicom.classify(attributes)
+	for name in ('isphi_tag', 'nokey_tag', 'blank_tag', 'nophi_tag'):
+		if expected[name] != actual[name]:
+			mismatch += 1
+			print "MISMATCH: ", label, name
+			print "  pyke : ", str(expected[name])
+			print "  rules: ", str(actual[name])
+
+# all rule tags plus an unreferenced tag
+cad_rules_dicom.load_facts()
+tags = sorted(set(cad_rules_dicom.is_phi_rules.keys()) | cad_rules_dicom.not_phi_tags)
+tags.append('(0009,0010)')
+compare("rules, empty values", [(tag, '') for tag in tags])
+compare("rules, values", [(tag, '20150101') for tag in tags])
+
+# Walk the tree.
+for root, directories, files in os.walk(myroot):
+	for filename in files:
+		filepath = os.path.join(root, filename)
+		if filepath.endswith(".dcm"):
+			try:
+				elements = dicom_header.read_elements(filepath)
+			except:
+				print "SKIP: ", filepath
+				continue
+			compare(filepath, [(dicom_header.tag_string(tag), val) for (tag, name, val) in elements])
+
+print "checked: ", checked, " mismatch: ", mismatch
+if mismatch > 0:
+	sys.exit(1)